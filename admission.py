@@ -0,0 +1,219 @@
+"""
+Admission control for the tracking endpoints.
+
+Runs as ASGI middleware in front of the beacon routes and answers with a fast
+429 + Retry-After, before the request reaches the threadpool or the
+connection pool, when:
+
+- the project has used up its token bucket (ADMISSION_PROJECT_RATE beacons
+  per second with a burst of ADMISSION_PROJECT_BURST),
+- ADMISSION_MAX_IN_FLIGHT tracking requests are already being processed,
+- the ingestion buffer holds more than ADMISSION_MAX_QUEUE items, or
+- the database pools are nearly exhausted (checked-out connections above
+  ADMISSION_POOL_SHED_RATIO of capacity), or a tracking request timed out
+  waiting for a pooled connection (DB_POOL_TIMEOUT).
+
+Dashboards and other routes are never shed. Decisions are counted and
+exposed through `metrics()`.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from database import async_engine, engine
+import ingestion
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_PROJECT_RATE = float(os.getenv("ADMISSION_PROJECT_RATE", "200"))
+ADMISSION_PROJECT_BURST = float(os.getenv("ADMISSION_PROJECT_BURST", "400"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "40000"))
+ADMISSION_POOL_SHED_RATIO = float(os.getenv("ADMISSION_POOL_SHED_RATIO", "0.8"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+ADMISSION_MAX_PROJECTS = 10000
+
+TRACKING_PATH_RE = re.compile(
+    r"^/api/analytics/(\d+)/(track|batch|pageview|exit|exit-link|cart-action|event)(/|$)"
+)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def pool_saturation(engine) -> float:
+    """Checked-out share of a QueuePool's capacity (0 for pools without a limit)"""
+    if engine is None:
+        return 0.0
+    pool = engine.pool
+    try:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return pool.checkedout() / capacity if capacity else 0.0
+    except AttributeError:
+        # NullPool / StaticPool
+        return 0.0
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        rate: float = ADMISSION_PROJECT_RATE,
+        burst: float = ADMISSION_PROJECT_BURST,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        pool_shed_ratio: float = ADMISSION_POOL_SHED_RATIO,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+        queue_depth=None,
+        pools=(),
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.pool_shed_ratio = pool_shed_ratio
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth or (lambda: 0)
+        self.pools = pools
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = Counter()
+        self.shed_by_project = Counter()
+
+    def admit(self, project_id: int):
+        """None if the request may proceed, else (reason, retry_after_seconds)"""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return self._shed_locked(project_id, "in_flight", self.retry_after)
+
+            bucket = self._buckets.get(project_id)
+            if bucket is None:
+                bucket = self._buckets[project_id] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > ADMISSION_MAX_PROJECTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(project_id)
+            wait = bucket.take(time.monotonic())
+            if wait:
+                return self._shed_locked(project_id, "project_rate", wait)
+
+        if self.queue_depth() >= self.max_queue:
+            return self._shed(project_id, "queue_depth", self.retry_after)
+        if any(pool_saturation(engine) >= self.pool_shed_ratio for engine in self.pools):
+            return self._shed(project_id, "db_pool", self.retry_after)
+
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _shed(self, project_id: int, reason: str, retry_after: float):
+        with self._lock:
+            return self._shed_locked(project_id, reason, retry_after)
+
+    def _shed_locked(self, project_id: int, reason: str, retry_after: float):
+        self.shed[reason] += 1
+        self.shed_by_project[project_id] += 1
+        return reason, max(1, math.ceil(retry_after))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "shed_total": sum(self.shed.values()),
+                "top_shed_projects": dict(self.shed_by_project.most_common(10)),
+                "queue_depth": self.queue_depth(),
+                "max_queue": self.max_queue,
+                "pool_saturation": [round(pool_saturation(engine), 3) for engine in self.pools],
+            }
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware so shed requests never touch the body or the threadpool"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        match = TRACKING_PATH_RE.match(scope["path"])
+        if not match:
+            return await self.app(scope, receive, send)
+
+        project_id = int(match.group(1))
+        verdict = self.controller.admit(project_id)
+        if verdict is not None:
+            return await self._reject(send, *verdict)
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except PoolTimeoutError:
+            if started:
+                raise
+            reason, retry_after = self.controller._shed(project_id, "db_pool_timeout", self.controller.retry_after)
+            await self._reject(send, reason, retry_after)
+        finally:
+            self.controller.release()
+
+    @staticmethod
+    async def _reject(send, reason: str, retry_after: int):
+        body = json.dumps({"detail": "Too many tracking requests", "reason": reason}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+controller = AdmissionController(
+    queue_depth=ingestion.buffer.pending,
+    pools=tuple(e for e in (engine, async_engine.sync_engine if async_engine is not None else None) if e is not None),
+)
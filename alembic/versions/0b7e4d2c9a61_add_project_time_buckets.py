@@ -0,0 +1,49 @@
+"""Replace hourly visitor sketches with 30-minute project time buckets
+
+Revision ID: 0b7e4d2c9a61
+Revises: f2a86c3e9d17
+Create Date: 2026-10-17 18:11:39.402871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4d2c9a61'
+down_revision: Union[str, None] = 'f2a86c3e9d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'project_time_buckets',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('page_views', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('visits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('new_visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('returning_visitors', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'bucket_start')
+    )
+    # Hourly sketches are superseded by the bucket sketches; rebuild with: python rollups.py rebuild
+    op.drop_table('hourly_visitor_sketches')
+
+
+def downgrade() -> None:
+    op.create_table(
+        'hourly_visitor_sketches',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('hour_start', sa.DateTime(), nullable=False),
+        sa.Column('visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('new_visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('returning_visitors', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'hour_start')
+    )
+    op.drop_table('project_time_buckets')
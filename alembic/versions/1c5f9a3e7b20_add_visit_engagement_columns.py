@@ -0,0 +1,67 @@
+"""Add per-visit engagement columns
+
+Revision ID: 1c5f9a3e7b20
+Revises: 0b7e4d2c9a61
+Create Date: 2026-10-17 21:04:12.583310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c5f9a3e7b20'
+down_revision: Union[str, None] = '0b7e4d2c9a61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('visits', sa.Column('page_views_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('visits', sa.Column('events_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('visits', sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+    op.add_column('visits', sa.Column('is_bounce', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # Backfill from history: one grouped pass over page_views and one over events
+    op.execute("UPDATE visits SET last_activity_at = visited_at")
+    op.execute("""
+        UPDATE visits SET
+            page_views_count = pv.n,
+            last_activity_at = CASE
+                WHEN visits.last_activity_at IS NULL OR pv.last_viewed > visits.last_activity_at THEN pv.last_viewed
+                ELSE visits.last_activity_at
+            END
+        FROM (
+            SELECT visit_id, COUNT(*) AS n, MAX(viewed_at) AS last_viewed
+            FROM page_views GROUP BY visit_id
+        ) AS pv
+        WHERE pv.visit_id = visits.id
+    """)
+    op.execute("""
+        UPDATE visits SET
+            events_count = ev.n,
+            last_activity_at = CASE
+                WHEN visits.last_activity_at IS NULL OR ev.last_event > visits.last_activity_at THEN ev.last_event
+                ELSE visits.last_activity_at
+            END
+        FROM (
+            SELECT visit_id, COUNT(*) AS n, MAX(timestamp) AS last_event
+            FROM events GROUP BY visit_id
+        ) AS ev
+        WHERE ev.visit_id = visits.id
+    """)
+    op.execute("UPDATE visits SET is_bounce = (page_views_count = 1)")
+
+    op.create_index('ix_visits_project_page_views_count', 'visits', ['project_id', 'page_views_count'])
+    op.create_index('ix_visits_project_is_bounce', 'visits', ['project_id', 'is_bounce'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visits_project_is_bounce', table_name='visits')
+    op.drop_index('ix_visits_project_page_views_count', table_name='visits')
+    op.drop_column('visits', 'is_bounce')
+    op.drop_column('visits', 'last_activity_at')
+    op.drop_column('visits', 'events_count')
+    op.drop_column('visits', 'page_views_count')
@@ -0,0 +1,60 @@
+"""Add visitors dimension table
+
+Revision ID: 2d8e6b4f1a93
+Revises: 1c5f9a3e7b20
+Create Date: 2026-10-17 22:37:50.114206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d8e6b4f1a93'
+down_revision: Union[str, None] = '1c5f9a3e7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'visitors',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('visitor_id', sa.String(), nullable=False),
+        sa.Column('first_seen', sa.DateTime(), nullable=False),
+        sa.Column('last_seen', sa.DateTime(), nullable=False),
+        sa.Column('session_count', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('country', sa.String(), nullable=True),
+        sa.Column('city', sa.String(), nullable=True),
+        sa.Column('device', sa.String(), nullable=True),
+        sa.Column('browser', sa.String(), nullable=True),
+        sa.Column('os', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'visitor_id')
+    )
+
+    # Backfill from visits (python rollups.py rebuild does the same later on)
+    op.execute("""
+        INSERT INTO visitors (project_id, visitor_id, first_seen, last_seen, session_count)
+        SELECT project_id, visitor_id, MIN(visited_at), MAX(visited_at), COUNT(*)
+        FROM visits
+        WHERE visitor_id IS NOT NULL AND project_id IS NOT NULL AND visited_at IS NOT NULL
+        GROUP BY project_id, visitor_id
+    """)
+    op.execute("""
+        UPDATE visitors SET (country, city, device, browser, os) = (
+            SELECT v.country, v.city, v.device, v.browser, v.os FROM visits v
+            WHERE v.project_id = visitors.project_id AND v.visitor_id = visitors.visitor_id
+            ORDER BY v.visited_at DESC, v.id DESC
+            LIMIT 1
+        )
+    """)
+
+    op.create_index('ix_visitors_project_session_count', 'visitors', ['project_id', 'session_count'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visitors_project_session_count', table_name='visitors')
+    op.drop_table('visitors')
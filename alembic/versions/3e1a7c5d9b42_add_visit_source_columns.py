@@ -0,0 +1,57 @@
+"""Add ingest-time source category and referrer domain to visits
+
+Revision ID: 3e1a7c5d9b42
+Revises: 2d8e6b4f1a93
+Create Date: 2026-10-17 23:41:06.271945
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from utils import classify_source, get_referrer_domain
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e1a7c5d9b42'
+down_revision: Union[str, None] = '2d8e6b4f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('visits', sa.Column('source_category', sa.String(), nullable=True))
+    op.add_column('visits', sa.Column('referrer_domain', sa.String(), nullable=True))
+
+    # Backfill with the ingest classifier: classify each distinct referrer once, load the
+    # results into a temp table and apply them with one joined UPDATE (visits.referrer
+    # has no index, so an UPDATE per referrer would scan visits once per referrer)
+    bind = op.get_bind()
+    referrers = [r for (r,) in bind.execute(sa.text("SELECT DISTINCT referrer FROM visits WHERE referrer IS NOT NULL"))]
+    rows = [{"ref": r, "category": classify_source(r), "domain": get_referrer_domain(r)} for r in referrers]
+    op.execute("CREATE TEMPORARY TABLE referrer_sources (referrer VARCHAR PRIMARY KEY, category VARCHAR, domain VARCHAR)")
+    insert = sa.text("INSERT INTO referrer_sources (referrer, category, domain) VALUES (:ref, :category, :domain)")
+    for offset in range(0, len(rows), 1000):
+        bind.execute(insert, rows[offset:offset + 1000])
+    op.execute("""
+        UPDATE visits SET source_category = m.category, referrer_domain = m.domain
+        FROM referrer_sources m
+        WHERE visits.referrer = m.referrer
+    """)
+    op.execute("DROP TABLE referrer_sources")
+    op.execute(f"UPDATE visits SET source_category = '{classify_source(None)}' WHERE referrer IS NULL")
+
+    # Every visit is classified now; readers compare the column without a fallback
+    with op.batch_alter_table('visits') as batch_op:
+        batch_op.alter_column('source_category', existing_type=sa.String(), nullable=False)
+
+    op.create_index('ix_visits_project_source_category', 'visits', ['project_id', 'source_category', 'visited_at'])
+    op.create_index('ix_visits_project_referrer_domain', 'visits', ['project_id', 'referrer_domain'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visits_project_referrer_domain', table_name='visits')
+    op.drop_index('ix_visits_project_source_category', table_name='visits')
+    op.drop_column('visits', 'referrer_domain')
+    op.drop_column('visits', 'source_category')
@@ -0,0 +1,45 @@
+"""Add composite indexes for the dashboard query patterns
+
+Revision ID: 4f2b8d6e0c13
+Revises: 3e1a7c5d9b42
+Create Date: 2026-10-18 00:52:37.904118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f2b8d6e0c13'
+down_revision: Union[str, None] = '3e1a7c5d9b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, extra kwargs); kept in step with models.py
+INDEXES = [
+    ('ix_visits_project_visited_at', 'visits', ['project_id', 'visited_at'], {'postgresql_include': ['visitor_id']}),
+    ('ix_visits_project_visitor', 'visits', ['project_id', 'visitor_id', 'visited_at'], {}),
+    ('ix_visits_project_session', 'visits', ['project_id', 'session_id'], {}),
+    ('ix_page_views_visit_viewed_at', 'page_views', ['visit_id', 'viewed_at'], {}),
+    ('ix_events_visit_event_type', 'events', ['visit_id', 'event_type'], {}),
+    ('ix_cart_actions_visit_action', 'cart_actions', ['visit_id', 'action'], {}),
+    ('ix_exit_link_clicks_project_clicked_at', 'exit_link_clicks', ['project_id', 'clicked_at'], {}),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; on Postgres the
+    # tables stay writable while the indexes build. A failed concurrent build
+    # leaves an INVALID index behind: drop it and rerun the upgrade.
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kwargs)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
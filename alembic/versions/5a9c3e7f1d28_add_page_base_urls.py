@@ -0,0 +1,70 @@
+"""Add normalized base URLs to page views and visit entry / exit pages
+
+Revision ID: 5a9c3e7f1d28
+Revises: 4f2b8d6e0c13
+Create Date: 2026-10-18 01:36:12.508342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from utils import normalize_page_url
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9c3e7f1d28'
+down_revision: Union[str, None] = '4f2b8d6e0c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _normalize(bind, table, source, target):
+    # Normalize each distinct URL once, with the same normalizer the ingest path uses, then
+    # apply the results with one joined UPDATE through a temp table ({source} has no index,
+    # so an UPDATE per URL would scan {table} once per URL)
+    urls = [u for (u,) in bind.execute(sa.text(f"SELECT DISTINCT {source} FROM {table} WHERE {source} IS NOT NULL"))]
+    rows = [{"url": u, "base_url": normalize_page_url(u)} for u in urls]
+    bind.execute(sa.text("CREATE TEMPORARY TABLE page_base_urls (url VARCHAR PRIMARY KEY, base_url VARCHAR)"))
+    insert = sa.text("INSERT INTO page_base_urls (url, base_url) VALUES (:url, :base_url)")
+    for offset in range(0, len(rows), 1000):
+        bind.execute(insert, rows[offset:offset + 1000])
+    bind.execute(sa.text(f"""
+        UPDATE {table} SET {target} = m.base_url
+        FROM page_base_urls m
+        WHERE {table}.{source} = m.url
+    """))
+    bind.execute(sa.text("DROP TABLE page_base_urls"))
+
+
+def upgrade() -> None:
+    op.add_column('page_views', sa.Column('base_url', sa.String(), nullable=True))
+    op.add_column('visits', sa.Column('entry_base_url', sa.String(), nullable=True))
+    op.add_column('visits', sa.Column('exit_base_url', sa.String(), nullable=True))
+
+    bind = op.get_bind()
+    _normalize(bind, 'page_views', 'url', 'base_url')
+    _normalize(bind, 'visits', 'entry_page', 'entry_base_url')
+    # Exit page: base URL of each visit's latest page view (uses ix_page_views_visit_viewed_at)
+    op.execute("""
+        UPDATE visits SET exit_base_url = (
+            SELECT pv.base_url FROM page_views pv
+            WHERE pv.visit_id = visits.id
+            ORDER BY pv.viewed_at DESC, pv.id DESC
+            LIMIT 1
+        )
+    """)
+
+    op.create_index('ix_page_views_base_url_visit', 'page_views', ['base_url', 'visit_id'])
+    op.create_index('ix_visits_project_entry_base_url', 'visits', ['project_id', 'entry_base_url', 'visited_at'])
+    op.create_index('ix_visits_project_exit_base_url', 'visits', ['project_id', 'exit_base_url', 'visited_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_visits_project_exit_base_url', table_name='visits')
+    op.drop_index('ix_visits_project_entry_base_url', table_name='visits')
+    op.drop_index('ix_page_views_base_url_visit', table_name='page_views')
+    op.drop_column('visits', 'exit_base_url')
+    op.drop_column('visits', 'entry_base_url')
+    op.drop_column('page_views', 'base_url')
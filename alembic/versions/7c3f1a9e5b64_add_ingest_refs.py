@@ -0,0 +1,34 @@
+"""Add ingest_refs table
+
+Revision ID: 7c3f1a9e5b64
+Revises: 5a9c3e7f1d28
+Create Date: 2026-10-18 09:12:44.603187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3f1a9e5b64'
+down_revision: Union[str, None] = '5a9c3e7f1d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ingest_refs',
+        sa.Column('ref', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('ref')
+    )
+    op.create_index(op.f('ix_ingest_refs_created_at'), 'ingest_refs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ingest_refs_created_at'), table_name='ingest_refs')
+    op.drop_table('ingest_refs')
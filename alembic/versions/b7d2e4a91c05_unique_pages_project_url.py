@@ -0,0 +1,54 @@
+"""Deduplicate pages and add unique (project_id, url) index
+
+Revision ID: b7d2e4a91c05
+Revises: 4325f8f61b68
+Create Date: 2026-10-17 10:12:41.503126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4a91c05'
+down_revision: Union[str, None] = '4325f8f61b68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Concurrent get-or-create may have left several rows per (project_id, url).
+    # Keep the oldest one, move page views and view counts onto it, drop the rest.
+    op.execute("""
+        UPDATE page_views SET page_id = (
+            SELECT MIN(keep.id) FROM pages dup
+            JOIN pages keep ON keep.project_id = dup.project_id AND keep.url = dup.url
+            WHERE dup.id = page_views.page_id
+        )
+        WHERE page_id IN (
+            SELECT id FROM pages p WHERE id <> (
+                SELECT MIN(q.id) FROM pages q WHERE q.project_id = p.project_id AND q.url = p.url
+            )
+        )
+    """)
+    op.execute("""
+        UPDATE pages SET total_views = (
+            SELECT SUM(COALESCE(q.total_views, 0)) FROM pages q
+            WHERE q.project_id = pages.project_id AND q.url = pages.url
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM pages GROUP BY project_id, url HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM pages WHERE id NOT IN (
+            SELECT MIN(id) FROM pages GROUP BY project_id, url
+        )
+    """)
+    op.create_index('uq_pages_project_url', 'pages', ['project_id', 'url'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_pages_project_url', table_name='pages')
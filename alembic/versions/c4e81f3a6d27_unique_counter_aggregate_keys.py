@@ -0,0 +1,74 @@
+"""Deduplicate exit link / traffic source aggregates and add unique keys
+
+Revision ID: c4e81f3a6d27
+Revises: b7d2e4a91c05
+Create Date: 2026-10-17 11:03:18.227940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e81f3a6d27'
+down_revision: Union[str, None] = 'b7d2e4a91c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    # exit_link is created by the application (models.ExitLink), not by 001
+    if 'exit_link' in tables:
+        # NULL never conflicts in a unique index; store a missing from_page as ''
+        op.execute("UPDATE exit_link SET from_page = '' WHERE from_page IS NULL")
+        op.execute("""
+            UPDATE exit_link SET
+                click_count = (
+                    SELECT SUM(COALESCE(q.click_count, 0)) FROM exit_link q
+                    WHERE q.project_id = exit_link.project_id AND q.url = exit_link.url
+                      AND q.from_page = exit_link.from_page
+                ),
+                last_clicked = (
+                    SELECT MAX(q.last_clicked) FROM exit_link q
+                    WHERE q.project_id = exit_link.project_id AND q.url = exit_link.url
+                      AND q.from_page = exit_link.from_page
+                )
+            WHERE id IN (
+                SELECT MIN(id) FROM exit_link GROUP BY project_id, url, from_page HAVING COUNT(*) > 1
+            )
+        """)
+        op.execute("""
+            DELETE FROM exit_link WHERE id NOT IN (
+                SELECT MIN(id) FROM exit_link GROUP BY project_id, url, from_page
+            )
+        """)
+        op.create_index('uq_exit_link_project_url_from_page', 'exit_link', ['project_id', 'url', 'from_page'], unique=True)
+
+    op.execute("""
+        UPDATE traffic_sources SET visit_count = (
+            SELECT SUM(COALESCE(q.visit_count, 0)) FROM traffic_sources q
+            WHERE q.project_id = traffic_sources.project_id
+              AND q.source_type = traffic_sources.source_type
+              AND q.source_name = traffic_sources.source_name
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM traffic_sources
+            GROUP BY project_id, source_type, source_name HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM traffic_sources WHERE id NOT IN (
+            SELECT MIN(id) FROM traffic_sources GROUP BY project_id, source_type, source_name
+        )
+    """)
+    op.create_index('uq_traffic_sources_project_source', 'traffic_sources', ['project_id', 'source_type', 'source_name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_traffic_sources_project_source', table_name='traffic_sources')
+    if 'exit_link' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('uq_exit_link_project_url_from_page', table_name='exit_link')
@@ -0,0 +1,33 @@
+"""Add event_log_checkpoints table
+
+Revision ID: d93a07b5e2f4
+Revises: c4e81f3a6d27
+Create Date: 2026-10-17 12:41:09.318552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93a07b5e2f4'
+down_revision: Union[str, None] = 'c4e81f3a6d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'event_log_checkpoints',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('segment', sa.Integer(), nullable=False),
+        sa.Column('offset', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_log_checkpoints')
@@ -0,0 +1,38 @@
+"""Add daily_project_stats rollup table
+
+Revision ID: e5b1c7d20a94
+Revises: d93a07b5e2f4
+Create Date: 2026-10-17 15:02:44.120931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1c7d20a94'
+down_revision: Union[str, None] = 'd93a07b5e2f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_project_stats',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('stat_date', sa.Date(), nullable=False),
+        sa.Column('page_views', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('visits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unique_visitors', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('new_visitors', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('returning_visitors', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'stat_date')
+    )
+    # Populate with: python rollups.py rebuild
+
+
+def downgrade() -> None:
+    op.drop_table('daily_project_stats')
@@ -0,0 +1,47 @@
+"""Add daily / hourly HyperLogLog visitor sketch tables
+
+Revision ID: f2a86c3e9d17
+Revises: e5b1c7d20a94
+Create Date: 2026-10-17 16:27:05.554012
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a86c3e9d17'
+down_revision: Union[str, None] = 'e5b1c7d20a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_visitor_sketches',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('stat_date', sa.Date(), nullable=False),
+        sa.Column('visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('new_visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('returning_visitors', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'stat_date')
+    )
+    op.create_table(
+        'hourly_visitor_sketches',
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('hour_start', sa.DateTime(), nullable=False),
+        sa.Column('visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('new_visitors', sa.LargeBinary(), nullable=True),
+        sa.Column('returning_visitors', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+        sa.PrimaryKeyConstraint('project_id', 'hour_start')
+    )
+    # Populate with: python rollups.py rebuild
+
+
+def downgrade() -> None:
+    op.drop_table('hourly_visitor_sketches')
+    op.drop_table('daily_visitor_sketches')
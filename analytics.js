@@ -939,7 +939,7 @@
 
   // ============================================
 
-  // PAGE VIEW TRACKING
+  // VISIT & PAGE VIEW TRACKING
 
   // ============================================
 
@@ -951,6 +951,265 @@
   let currentPage = window.location.href;
 
 
+  // ============================================
+
+  // BATCHED DELIVERY
+
+  // ============================================
+
+  // Beacons are queued and delivered through POST /analytics/{id}/batch.
+  // New visits and page views get a client-side temp id ("v1", "p2", ...)
+  // that later entries can reference; the server maps them to stored ids
+  // (or, with its event log enabled, to refs that stand in for them).
+
+  const BATCH_FLUSH_DELAY = 2000;
+
+  const BATCH_MAX_EVENTS = 20;
+
+  const BATCH_MAX_SEND = 100;  // server limit per batch
+
+  const BATCH_RETRY_DELAY = 5000;
+
+  let eventQueue = [];
+
+  let flushTimer = null;
+
+  let batchInFlight = false;
+
+  let inFlightEvents = [];
+
+  let retryAt = 0;
+
+  let tempIdCounter = 0;
+
+  const resolvedIds = {};
+
+
+  function nextTempId(prefix) {
+
+    tempIdCounter += 1;
+
+    return `${prefix}${tempIdCounter}`;
+
+  }
+
+  function resolveId(id) {
+
+    return (typeof id === 'string' && resolvedIds[id]) ? resolvedIds[id] : id;
+
+  }
+
+  function unresolvedTempIds(entries) {
+
+    const ids = new Set();
+
+    entries.forEach(entry => {
+
+      [entry.visit_id, entry.pageview_id].forEach(id => {
+
+        if (typeof id === 'string' && !resolvedIds[id]) ids.add(id);
+
+      });
+
+    });
+
+    return ids;
+
+  }
+
+  // Entries of the in-flight batch that create the given temp ids, plus the
+  // entries those depend on (a page view pulls in its visit)
+  function creatorsFor(tempIds) {
+
+    const needed = new Set(tempIds);
+
+    for (let i = inFlightEvents.length - 1; i >= 0; i--) {
+
+      const entry = inFlightEvents[i];
+
+      if (entry.temp_id && needed.has(entry.temp_id)) {
+
+        unresolvedTempIds([entry]).forEach(id => needed.add(id));
+
+      }
+
+    }
+
+    return inFlightEvents.filter(entry => entry.temp_id && needed.has(entry.temp_id));
+
+  }
+
+  function scheduleFlush(delay) {
+
+    if (!flushTimer) {
+
+      flushTimer = setTimeout(flushQueue, delay);
+
+    }
+
+  }
+
+  function enqueue(entry) {
+
+    eventQueue.push(entry);
+
+    if (eventQueue.length >= BATCH_MAX_EVENTS) {
+
+      flushQueue();
+
+    } else if (!flushTimer) {
+
+      flushTimer = setTimeout(flushQueue, BATCH_FLUSH_DELAY);
+
+    }
+
+  }
+
+  function flushQueue(useBeacon) {
+
+    if (flushTimer) {
+
+      clearTimeout(flushTimer);
+
+      flushTimer = null;
+
+    }
+
+    if (!eventQueue.length) return;
+
+    // Temp ids are only known to the server within one batch, so wait for
+    // the batch that creates them before sending entries that use them
+    if (batchInFlight && !useBeacon) {
+
+      scheduleFlush(200);
+
+      return;
+
+    }
+
+    // Back off after a failed batch (the page unloading can't wait)
+    if (!useBeacon && Date.now() < retryAt) {
+
+      scheduleFlush(retryAt - Date.now());
+
+      return;
+
+    }
+
+    let pending = eventQueue.splice(0, BATCH_MAX_SEND);
+
+    if (useBeacon && batchInFlight) {
+
+      // The in-flight batch may never be answered once the page unloads, so
+      // resend the entries creating the temp ids these beacons reference and
+      // let the server resolve them within this batch (visits are deduplicated
+      // by session)
+      pending = creatorsFor(unresolvedTempIds(pending)).concat(pending);
+
+    }
+
+    const events = pending.map(entry => ({
+
+      ...entry,
+
+      visit_id: resolveId(entry.visit_id),
+
+      pageview_id: resolveId(entry.pageview_id)
+
+    }));
+
+    const url = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/batch`;
+
+    const body = JSON.stringify({ events: events });
+
+    log('📦 Sending batch:', events);
+
+    if (useBeacon && navigator.sendBeacon) {
+
+      navigator.sendBeacon(url, new Blob([body], { type: 'application/json' }));
+
+      return;
+
+    }
+
+    batchInFlight = true;
+
+    inFlightEvents = events;
+
+    fetch(url, {
+
+      method: 'POST',
+
+      headers: { 'Content-Type': 'application/json' },
+
+      body: body,
+
+      keepalive: !!useBeacon
+
+    })
+
+      .then(res => {
+
+        if (!res.ok) {
+
+          const error = new Error(`HTTP ${res.status}`);
+
+          // 429 and 5xx are worth retrying; other 4xx would fail again
+          error.retry = res.status === 429 || res.status >= 500;
+
+          error.retryAfter = (parseFloat(res.headers.get('Retry-After')) || 0) * 1000;
+
+          throw error;
+
+        }
+
+        return res.json();
+
+      })
+
+      .then(result => {
+
+        log('✅ Batch delivered!', result);
+
+        Object.assign(resolvedIds, result.ids || {});
+
+        visitId = resolveId(visitId);
+
+        currentPageViewId = resolveId(currentPageViewId);
+
+      })
+
+      .catch(err => {
+
+        log('❌ Batch error:', err.message);
+
+        if (err.retry === false) return;
+
+        // Network error, 429 or 5xx: put the batch back in front of anything
+        // queued since, so entries using its temp ids can still be resolved
+        eventQueue = events.concat(eventQueue);
+
+        retryAt = Date.now() + (err.retryAfter || BATCH_RETRY_DELAY);
+
+      })
+
+      .finally(() => {
+
+        batchInFlight = false;
+
+        inFlightEvents = [];
+
+        if (eventQueue.length) {
+
+          scheduleFlush(Math.max(retryAt - Date.now(), 0) || BATCH_FLUSH_DELAY);
+
+        }
+
+      });
+
+  }
+
+
   function trackVisit() {
 
     // Validation
@@ -1040,43 +1299,18 @@
 
     };
 
-    const url = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/track`;
-
     log('📤 Tracking visit...');
 
     log('Data:', data);
 
+    visitId = nextTempId('v');
 
-    fetch(url, {
-
-      method: 'POST',
-
-      headers: { 'Content-Type': 'application/json' },
-
-      body: JSON.stringify(data)
-
-    })
-
-      .then(res => res.json())
-
-      .then(result => {
-
-        log('✅ Visit tracked!', result);
-
-        visitId = result.visit_id;
+    enqueue({ type: 'visit', temp_id: visitId, data: data });
 
-        // Track initial page view
+    // Track initial page view and send both right away
+    trackPageView(window.location.href, document.title);
 
-        trackPageView(window.location.href, document.title);
-
-      })
-
-      .catch(err => {
-
-
-        log('❌ Error:', err.message);
-
-      });
+    flushQueue();
 
   }
 
@@ -1112,39 +1346,13 @@
 
 
     };
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/pageview/${visitId}`;
 
     log('📄 Tracking page view:', data);
 
-    fetch(apiUrl, {
-
-      method: 'POST',
-
-      headers: { 'Content-Type': 'application/json' },
-
-      body: JSON.stringify(data)
-
-
-    })
-
-      .then(res => res.json())
-
-      .then(result => {
-
-        log('✅ Page view tracked!', result);
-
-        // Store the pageview ID for later updates
-
-        currentPageViewId = result.pageview_id;
-
-      })
-
-      .catch(err => {
-
-        log('❌ Page view error:', err.message);
-
-      });
+    // Store the pageview temp ID for later updates
+    currentPageViewId = nextTempId('p');
 
+    enqueue({ type: 'pageview', temp_id: currentPageViewId, visit_id: visitId, data: data });
 
     // Reset timer for next page
 
@@ -1166,28 +1374,9 @@
       time_spent: timeSpent
     };
 
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/pageview/${visitId}/update/${pageViewId}`;
-
     log('⏱️ Updating time spent:', timeSpent + 's for pageview', pageViewId);
 
-    // Use sendBeacon for reliable tracking
-
-    if (navigator.sendBeacon) {
-
-      const blob = new Blob([JSON.stringify(data)], { type: 'application/json' })
-      navigator.sendBeacon(apiUrl, blob)
-
-    } else {
-      fetch(apiUrl, {
-        method: 'PUT',
-
-        headers: { 'Content-Type': 'application/json' },
-
-        body: JSON.stringify(data),
-        keepalive: true
-      }).catch(() => { });
-
-    } // Added closing brace here
+    enqueue({ type: 'pageview_update', visit_id: visitId, pageview_id: pageViewId, data: data });
 
   }
 
@@ -1204,41 +1393,20 @@
       exit_page: window.location.href,
       time_spent: timeSpent
     };
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/exit/${visitId}`;
     log('🚪 Tracking exit:', data);
+    enqueue({ type: 'exit', visit_id: visitId, data: data });
     // Use sendBeacon for reliable exit tracking
-    if (navigator.sendBeacon) {
-      const blob = new Blob([JSON.stringify(data)], { type: 'application/json' });
-      navigator.sendBeacon(apiUrl, blob);
-    } else {
-      fetch(apiUrl, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(data),
-        keepalive: true
-      }).catch(() => { });
-    }
+    flushQueue(true);
   }
   function trackExitLink(url) {
     const data = {
       url: url,
       from_page: window.location.href
     };
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/exit-link`;
     log('🔗 Tracking exit link:', data);
-    // Use sendBeacon for reliable tracking
-    if (navigator.sendBeacon) {
-      const blob = new Blob([JSON.stringify(data)], { type: 'application/json' });
-      navigator.sendBeacon(apiUrl, blob);
-    } else {
-      fetch(apiUrl, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(data)
-      }).catch((err) => {
-        log('❌ Exit link tracking error:', err.message);
-      });
-    }
+    enqueue({ type: 'exit_link', data: data });
+    // The browser is about to leave the page
+    flushQueue(true);
   }
 
   function setupExitLinkTracking() {
@@ -1367,22 +1535,9 @@
       timestamp: Date.now()
     };
 
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/event/${visitId}`;
-    
     log('📊 Tracking event:', eventType, data);
-    
-    fetch(apiUrl, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(data)
-    })
-      .then(res => res.json())
-      .then(result => {
-        log('✅ Event tracked!', result);
-      })
-      .catch(err => {
-        log('❌ Event tracking error:', err.message);
-      });
+
+    enqueue({ type: 'event', visit_id: visitId, data: data });
   }
 
   // Shopify Product Page Detection
@@ -1750,33 +1905,9 @@ function setupPurchaseDetection() {
 
     };
 
-    const apiUrl = `${CONFIG.apiUrl.replace(/\/$/, '')}/analytics/${CONFIG.projectId}/cart-action/${visitId}`;
-
     log('🛒 Tracking cart action:', data);
 
-    fetch(apiUrl, {
-
-      method: 'POST',
-
-      headers: { 'Content-Type': 'application/json' },
-
-      body: JSON.stringify(data)
-
-    })
-
-      .then(res => res.json())
-
-      .then(result => {
-
-        log('✅ Cart action tracked!', result);
-
-      })
-
-      .catch(err => {
-
-        log('❌ Cart action error:', err.message);
-
-      });
+    enqueue({ type: 'cart_action', visit_id: visitId, data: data });
 
   }
 
@@ -0,0 +1,135 @@
+"""
+Requests/sec and latency for the custom event beacon served by a sync
+`def` handler on the sync engine vs the `async def` handler on the async
+engine, with many beacons in flight at once.
+
+    python benchmarks/bench_async.py --beacons 5000 --concurrency 1000
+
+Requests go through the ASGI app in-process (httpx ASGITransport), so the
+sync handler is limited by the Starlette threadpool exactly as under
+uvicorn. Runs against a throwaway SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+# Measure the async handlers even on SQLite, where they are off by default
+os.environ.setdefault("TRACKING_ASYNC", "true")
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import models  # noqa: E402
+from database import Base, SessionLocal, async_engine, engine, get_db  # noqa: E402
+from ingestion import buffer as ingest_buffer  # noqa: E402
+from routers import analytics  # noqa: E402
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(analytics.router, prefix="/api/analytics")
+
+    @app.post("/sync/{project_id}/event/{visit_id}")
+    def track_event_sync(project_id: int, visit_id: int, event_data: dict, db: Session = Depends(get_db)):
+        after_commit = []
+        result = analytics._record_event(db, project_id, visit_id, event_data, ingest_buffer, after_commit)
+        analytics._run_after_commit(after_commit)
+        return result
+
+    return app
+
+
+def seed(visits: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Bench", domain="bench.local", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.flush()
+        visit_ids = []
+        for _ in range(visits):
+            visit = models.Visit(project_id=project.id, visitor_id=uuid.uuid4().hex, session_id=uuid.uuid4().hex)
+            db.add(visit)
+            db.flush()
+            visit_ids.append(visit.id)
+        db.commit()
+        return project.id, visit_ids
+    finally:
+        db.close()
+
+
+async def run(app: FastAPI, path_for, beacons: int, concurrency: int):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    body = {"event_type": "product_view", "url": "https://bench.local/products/x", "data": {"product_id": 1}}
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+        "Accept-Language": "en-US,en;q=0.9",
+        "Origin": "https://bench.local",
+    }
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        async def beacon(i):
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                res = await client.post(path_for(i), json=body)
+                latencies.append(time.perf_counter() - started)
+                if res.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(beacon(i) for i in range(beacons)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return beacons / elapsed, p50, p99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--beacons", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    args = parser.parse_args()
+
+    if async_engine is None:
+        sys.exit("async engine unavailable: install aiosqlite (SQLite) or asyncpg (Postgres)")
+
+    project_id, visit_ids = seed(100)
+    app = build_app()
+    ingest_buffer.start()
+
+    def sync_path(i):
+        return f"/sync/{project_id}/event/{visit_ids[i % len(visit_ids)]}"
+
+    def async_path(i):
+        return f"/api/analytics/{project_id}/event/{visit_ids[i % len(visit_ids)]}"
+
+    results = {}
+    for label, path_for in (("sync def + sync engine", sync_path), ("async def + async engine", async_path)):
+        results[label] = asyncio.run(run(app, path_for, args.beacons, args.concurrency))
+        ingest_buffer.flush()
+
+    ingest_buffer.stop()
+
+    print(f"database:     {engine.url.render_as_string(hide_password=True)}")
+    print(f"beacons:      {args.beacons} ({args.concurrency} in flight)")
+    for label, (rps, p50, p99, errors) in results.items():
+        print(f"{label:26s} {rps:8.0f} req/sec   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms   errors {errors}")
+
+
+if __name__ == "__main__":
+    main()
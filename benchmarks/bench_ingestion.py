@@ -0,0 +1,122 @@
+"""
+Beacons/sec for the custom event beacon: one commit per beacon vs the
+write-behind ingestion buffer.
+
+    python benchmarks/bench_ingestion.py --beacons 5000 --threads 8
+
+Runs against a throwaway SQLite file unless DATABASE_URL is already set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+import models  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from ingestion import IngestionBuffer  # noqa: E402
+
+
+def seed(visits: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Bench", domain="bench.local", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.flush()
+        visit_ids = []
+        for _ in range(visits):
+            visit = models.Visit(project_id=project.id, visitor_id=uuid.uuid4().hex, session_id=uuid.uuid4().hex)
+            db.add(visit)
+            db.flush()
+            visit_ids.append(visit.id)
+        db.commit()
+        return project.id, visit_ids
+    finally:
+        db.close()
+
+
+def event_row(visit_id: int, i: int) -> dict:
+    return {
+        "visit_id": visit_id,
+        "event_type": "product_view",
+        "event_data": {"product_id": i},
+        "url": "https://bench.local/products/x",
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def beacon_commit_per_row(project_id: int, visit_id: int, i: int):
+    db = SessionLocal()
+    try:
+        db.query(models.Visit).filter(models.Visit.id == visit_id, models.Visit.project_id == project_id).first()
+        db.add(models.Event(**event_row(visit_id, i)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def beacon_buffered(buf: IngestionBuffer, project_id: int, visit_id: int, i: int):
+    db = SessionLocal()
+    try:
+        db.query(models.Visit).filter(models.Visit.id == visit_id, models.Visit.project_id == project_id).first()
+    finally:
+        db.close()
+    buf.add(models.Event, event_row(visit_id, i))
+
+
+def run(fn, beacons: int, threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(fn, range(beacons)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--beacons", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    project_id, visit_ids = seed(100)
+
+    def pick(i):
+        return visit_ids[i % len(visit_ids)]
+
+    before = run(
+        lambda i: beacon_commit_per_row(project_id, pick(i), i),
+        args.beacons,
+        args.threads,
+    )
+
+    buf = IngestionBuffer(batch_size=args.batch_size, flush_interval=args.flush_interval)
+    buf.start()
+    after = run(
+        lambda i: beacon_buffered(buf, project_id, pick(i), i),
+        args.beacons,
+        args.threads,
+    )
+    drain_start = time.perf_counter()
+    buf.stop()
+    after_drained = after + (time.perf_counter() - drain_start)
+
+    print(f"database:            {engine.url.render_as_string(hide_password=True)}")
+    print(f"beacons:             {args.beacons} ({args.threads} threads)")
+    print(f"commit per beacon:   {args.beacons / before:10.0f} beacons/sec")
+    print(f"write-behind (ack):  {args.beacons / after:10.0f} beacons/sec")
+    print(f"write-behind (durable incl. drain): {args.beacons / after_drained:10.0f} beacons/sec")
+    print(f"flushes:             {buf.stats['flushes']}")
+
+
+if __name__ == "__main__":
+    main()
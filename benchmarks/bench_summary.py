@@ -0,0 +1,192 @@
+"""
+Latency of the project summary (GET /api/analytics/{id}/summary) on a large
+synthetic project: the original plan of eight raw queries over visits and
+page_views vs the current single statement over the rollups.
+
+    python benchmarks/bench_summary.py --pageviews 5000000 --days 30
+
+Seeds one project with the given number of page views (four per visit,
+spread over --history days), rebuilds the daily rollup, sketches and time
+buckets, then calls both plans --repeat times. Runs against a throwaway
+SQLite file unless DATABASE_URL is set; seeding 5M page views takes a few
+minutes.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+import pytz  # noqa: E402
+from sqlalchemy import case, desc, event, func, insert  # noqa: E402
+
+import models  # noqa: E402
+import rollups  # noqa: E402
+import utils  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from routers import analytics  # noqa: E402
+from utils import get_ist_start_of_day  # noqa: E402
+
+PAGEVIEWS_PER_VISIT = 4
+DEVICES = ("desktop", "mobile", "tablet")
+PAGES = [f"https://bench.local/page-{i}" for i in range(200)]
+
+
+def seed(pageviews: int, history: int, batch: int = 20000):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Bench", domain="bench.local", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.commit()
+        project_id = project.id
+    finally:
+        db.close()
+
+    rng = random.Random(16)
+    visitors = [uuid.uuid4().hex for _ in range(max(1, pageviews // 20))]
+    now = datetime.utcnow()
+    visits = pageviews // PAGEVIEWS_PER_VISIT
+    with engine.begin() as conn:
+        visit_id = conn.execute(func.coalesce(func.max(models.Visit.id), 0).select()).scalar()
+    first_visit_id = visit_id + 1
+
+    for offset in range(0, visits, batch):
+        visit_rows, pageview_rows = [], []
+        for _ in range(min(batch, visits - offset)):
+            visit_id += 1
+            visited_at = now - timedelta(seconds=rng.randrange(history * 86400))
+            visit_rows.append({
+                "id": visit_id, "project_id": project_id, "visitor_id": rng.choice(visitors),
+                "session_id": uuid.uuid4().hex, "device": rng.choice(DEVICES),
+                "visited_at": visited_at, "is_unique": rng.random() < 0.3, "is_new_session": True,
+            })
+            for n in range(PAGEVIEWS_PER_VISIT):
+                pageview_rows.append({
+                    "visit_id": visit_id, "url": rng.choice(PAGES),
+                    "viewed_at": visited_at + timedelta(seconds=30 * n),
+                })
+        with engine.begin() as conn:
+            conn.execute(insert(models.Visit), visit_rows)
+            conn.execute(insert(models.PageView), pageview_rows)
+        print(f"\rseeded {offset + len(visit_rows):,} / {visits:,} visits", end="", flush=True)
+    print()
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Page), [
+            {"project_id": project_id, "url": url, "title": url.rsplit("/", 1)[-1], "total_views": rng.randrange(1000)}
+            for url in PAGES
+        ])
+        conn.execute(insert(models.TrafficSource), [
+            {"project_id": project_id, "source_type": "referral", "source_name": name, "visit_count": rng.randrange(1000)}
+            for name in ("google", "bing", "twitter", "facebook", "newsletter", "direct")
+        ])
+
+    db = SessionLocal()
+    try:
+        rollups.rebuild(db, project_id=project_id)
+        rollups.rebuild_sketches(db, project_id=project_id)
+        rollups.rebuild_time_buckets(db, project_id=project_id)
+    finally:
+        db.close()
+    return project_id, visit_id - first_visit_id + 1
+
+
+def legacy_summary(db, project_id: int, days: int):
+    """The summary's original query plan: every figure computed from raw visits and page views"""
+    start_date_utc = get_ist_start_of_day(days - 1).astimezone(pytz.UTC)
+    visit = models.Visit
+    recent = (visit.project_id == project_id, visit.visited_at >= start_date_utc)
+
+    total_visits = db.query(visit).filter(*recent).count()
+    unique_visitors = db.query(func.count(func.distinct(visit.visitor_id))).filter(*recent).scalar()
+    live_visitors = db.query(func.count(func.distinct(visit.visitor_id))).filter(
+        visit.project_id == project_id, visit.visited_at >= datetime.utcnow() - timedelta(minutes=5)
+    ).scalar()
+
+    ist_date_expr = utils.get_ist_date_expr(visit.visited_at, db.bind.dialect.name)
+    columns = (
+        ist_date_expr.label("visit_date"),
+        func.count(models.PageView.id),
+        func.count(func.distinct(visit.visitor_id)),
+        func.count(func.distinct(case((visit.is_unique == True, visit.visitor_id), else_=None))),  # noqa: E712
+        func.count(func.distinct(case((visit.is_unique == False, visit.visitor_id), else_=None))),  # noqa: E712
+    )
+    joined = db.query(*columns).join(models.PageView, visit.id == models.PageView.visit_id)
+    daily = joined.filter(*recent).group_by(ist_date_expr).all()
+    all_time = joined.filter(visit.project_id == project_id).group_by(ist_date_expr).order_by(ist_date_expr).all()
+
+    top_pages = db.query(models.Page.url, models.Page.title, models.Page.total_views).filter(
+        models.Page.project_id == project_id
+    ).order_by(desc(models.Page.total_views)).limit(5).all()
+    top_sources = db.query(
+        models.TrafficSource.source_name, func.sum(models.TrafficSource.visit_count).label("count")
+    ).filter(models.TrafficSource.project_id == project_id).group_by(
+        models.TrafficSource.source_name
+    ).order_by(desc("count")).limit(5).all()
+    devices = db.query(visit.device, func.count(visit.id)).filter(
+        visit.project_id == project_id
+    ).group_by(visit.device).all()
+    return total_visits, unique_visitors, live_visitors, daily, all_time, top_pages, top_sources, devices
+
+
+def current_summary(db, project_id: int, days: int):
+    return analytics.get_summary(project_id, days, db=db, current_user=None)
+
+
+def measure(plan, project_id: int, days: int, repeat: int):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    latencies = []
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(repeat):
+            db = SessionLocal()
+            try:
+                started = time.perf_counter()
+                plan(db, project_id, days)
+                latencies.append(time.perf_counter() - started)
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1], len(statements) // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pageviews", type=int, default=5_000_000)
+    parser.add_argument("--history", type=int, default=180, help="days of synthetic traffic")
+    parser.add_argument("--days", type=int, default=30, help="summary period")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    project_id, visits = seed(args.pageviews, args.history)
+    print(f"seed + rollup rebuild: {time.perf_counter() - started:.0f} s")
+
+    results = {}
+    for label, plan in (("raw queries (original)", legacy_summary), ("single statement", current_summary)):
+        results[label] = measure(plan, project_id, args.days, args.repeat)
+
+    print(f"database:     {engine.url.render_as_string(hide_password=True)}")
+    print(f"project:      {visits:,} visits, {visits * PAGEVIEWS_PER_VISIT:,} page views over {args.history} days")
+    print(f"summary:      last {args.days} days, {args.repeat} runs")
+    for label, (p50, worst, statements) in results.items():
+        print(f"{label:24s} p50 {p50 * 1000:9.1f} ms   max {worst * 1000:9.1f} ms   {statements} statements")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Ingestion load generator that replays the analytics.js protocol.
+
+Each simulated browser session follows the sequence analytics.js sends:
+
+    visit + first pageview          (sent right away, temp ids v1/p1)
+    per further page: pageview_update for the previous page, a new pageview,
+        the page's events (product_view, add_to_cart, ...) and cart actions
+    pageview_update + exit          (the unload beacon)
+
+In `batch` mode (what analytics.js does today) every step is one
+POST /{project_id}/batch carrying temp ids that are resolved from the
+response, exactly like the browser. In `single` mode the same beacons hit the
+per-beacon endpoints (track, pageview, update, event, cart-action, exit).
+
+    python benchmarks/loadgen.py --sessions 2000 --concurrency 200
+    python benchmarks/loadgen.py --target http://127.0.0.1:8000 --mode single
+
+`--target inprocess` (default) drives the ASGI app through httpx without a
+server; an http:// URL drives a running uvicorn. Rows written are counted in
+the database named by DATABASE_URL, which must be the server's database when
+targeting uvicorn. Runs against a throwaway SQLite file unless DATABASE_URL is
+set.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/loadgen.db"
+# Measure the ingest path, not the shedder; set ADMISSION_ENABLED=true to exercise 429s
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+import models  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+
+COUNTED_TABLES = (
+    models.Visit,
+    models.PageView,
+    models.Page,
+    models.Event,
+    models.CartAction,
+    models.ExitLinkClick,
+)
+
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Origin": "https://loadgen.local",
+}
+
+REFERRERS = (
+    ("direct", None, None),
+    ("https://www.google.com/", "organic", "google"),
+    ("https://www.facebook.com/", "social", "facebook"),
+    ("https://blog.example.org/post", "referral", "blog.example.org"),
+)
+
+
+class Catalogue:
+    """Site URLs with a uniform or Zipf popularity distribution"""
+
+    def __init__(self, urls: int, distribution: str, zipf_s: float, rng: random.Random):
+        self.rng = rng
+        self.urls = ["https://loadgen.local/"] + [
+            f"https://loadgen.local/products/item-{i}" if i % 3 else f"https://loadgen.local/collections/c-{i}"
+            for i in range(1, urls)
+        ]
+        if distribution == "zipf":
+            self.weights = [1.0 / (rank ** zipf_s) for rank in range(1, len(self.urls) + 1)]
+        else:
+            self.weights = None
+
+    def pick(self) -> str:
+        return self.rng.choices(self.urls, weights=self.weights)[0]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.beacons = 0
+
+    def report(self, elapsed: float):
+        print(f"beacons:          {self.beacons} in {elapsed:.1f}s = {self.beacons / elapsed:,.0f} beacons/sec")
+        print(f"{'endpoint':16s} {'requests':>9s} {'errors':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+        for endpoint, samples in sorted(self.latencies.items()):
+            samples.sort()
+
+            def pct(p):
+                return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+            print(
+                f"{endpoint:16s} {len(samples):9d} {self.errors[endpoint]:7d} "
+                f"{pct(0.50):8.1f} {pct(0.95):8.1f} {pct(0.99):8.1f}"
+            )
+
+
+class Session:
+    """One simulated browser tab running analytics.js"""
+
+    def __init__(self, client, project_id: int, args, catalogue: Catalogue, stats: Stats, visitor_id: str, rng: random.Random):
+        self.client = client
+        self.project_id = project_id
+        self.args = args
+        self.catalogue = catalogue
+        self.stats = stats
+        self.visitor_id = visitor_id
+        self.rng = rng
+        self.resolved = {}
+        self.temp_seq = 0
+
+    def temp_id(self, prefix: str) -> str:
+        self.temp_seq += 1
+        return f"{prefix}{self.temp_seq}"
+
+    async def post(self, endpoint: str, method: str, path: str, body: dict, beacons: int = 1):
+        started = time.perf_counter()
+        try:
+            res = await self.client.request(method, f"/api/analytics/{self.project_id}{path}", json=body)
+            ok = res.status_code == 200
+        except httpx.HTTPError:
+            res, ok = None, False
+        self.stats.latencies[endpoint].append(time.perf_counter() - started)
+        self.stats.beacons += beacons
+        if not ok:
+            self.stats.errors[endpoint] += 1
+            return None
+        return res.json()
+
+    async def think(self):
+        if self.args.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    def page_beacons(self, url: str):
+        """Events and cart actions analytics.js emits on a page"""
+        events, carts = [], []
+        if "/products/" in url:
+            product_id = url.rsplit("-", 1)[-1]
+            events.append({"event_type": "product_view", "event_data": {"product_id": product_id}})
+            if self.rng.random() < self.args.cart_ratio:
+                events.append({"event_type": "add_to_cart", "event_data": {"product_id": product_id}})
+                carts.append({"action": "add_to_cart", "product_id": product_id, "product_name": f"Item {product_id}", "product_url": url, "page_url": url})
+        elif "/collections/" in url:
+            events.append({"event_type": "category_view", "event_data": {"collection": url.rsplit("/", 1)[-1]}})
+        for event in events:
+            event.update(url=url, timestamp=int(time.time() * 1000))
+        return events, carts
+
+    def visit_data(self, entry_page: str) -> dict:
+        referrer, source_type, source_name = self.rng.choice(REFERRERS)
+        return {
+            "visitor_id": self.visitor_id,
+            "session_id": uuid.uuid4().hex,
+            "referrer": referrer,
+            "entry_page": entry_page,
+            "device": self.rng.choice(("Desktop", "Mobile", "Tablet")),
+            "browser": "Chrome",
+            "os": "Windows",
+            "screen_resolution": "1920x1080",
+            "language": "en-US",
+            "traffic_source": source_type,
+            "traffic_name": source_name,
+        }
+
+    async def run(self):
+        pages = self.rng.randint(self.args.min_pages, self.args.max_pages)
+        urls = [self.catalogue.pick() for _ in range(pages)]
+        if self.args.mode == "batch":
+            await self.run_batched(urls)
+        else:
+            await self.run_single(urls)
+
+    async def send_batch(self, entries: list):
+        def resolve(ref):
+            return self.resolved.get(ref, ref)
+
+        events = [dict(entry, visit_id=resolve(entry.get("visit_id")), pageview_id=resolve(entry.get("pageview_id"))) for entry in entries]
+        result = await self.post("batch", "POST", "/batch", {"events": events}, beacons=len(events))
+        if result:
+            self.resolved.update(result.get("ids", {}))
+
+    async def run_batched(self, urls: list):
+        visit_id = self.temp_id("v")
+        pageview_id = self.temp_id("p")
+        await self.send_batch([
+            {"type": "visit", "temp_id": visit_id, "data": self.visit_data(urls[0])},
+            {"type": "pageview", "temp_id": pageview_id, "visit_id": visit_id, "data": {"url": urls[0], "title": "Page", "time_spent": 0}},
+        ])
+        if visit_id not in self.resolved:
+            return
+
+        for i, url in enumerate(urls):
+            entries = []
+            if i:
+                entries.append({"type": "pageview_update", "visit_id": visit_id, "pageview_id": pageview_id, "data": {"time_spent": self.rng.randint(2, 90)}})
+                pageview_id = self.temp_id("p")
+                entries.append({"type": "pageview", "temp_id": pageview_id, "visit_id": visit_id, "data": {"url": url, "title": "Page", "time_spent": 0}})
+            events, carts = self.page_beacons(url)
+            entries += [{"type": "event", "visit_id": visit_id, "data": event} for event in events]
+            entries += [{"type": "cart_action", "visit_id": visit_id, "data": cart} for cart in carts]
+            if entries:
+                await self.think()
+                await self.send_batch(entries)
+
+        exit_entries = [
+            {"type": "pageview_update", "visit_id": visit_id, "pageview_id": pageview_id, "data": {"time_spent": self.rng.randint(2, 90)}},
+            {"type": "exit", "visit_id": visit_id, "data": {"exit_page": urls[-1]}},
+        ]
+        if self.rng.random() < self.args.exit_link_ratio:
+            exit_entries.append({"type": "exit_link", "data": {"url": "https://partner.example.net/", "from_page": urls[-1]}})
+        await self.think()
+        await self.send_batch(exit_entries)
+
+    async def run_single(self, urls: list):
+        result = await self.post("track", "POST", "/track", self.visit_data(urls[0]))
+        if not result or not result.get("visit_id"):
+            return
+        visit_id = result["visit_id"]
+        pageview_id = None
+
+        for url in urls:
+            if pageview_id:
+                await self.post("pageview_update", "PUT", f"/pageview/{visit_id}/update/{pageview_id}", {"time_spent": self.rng.randint(2, 90)})
+            result = await self.post("pageview", "POST", f"/pageview/{visit_id}", {"url": url, "title": "Page", "time_spent": 0})
+            pageview_id = result.get("pageview_id") if result else None
+            events, carts = self.page_beacons(url)
+            for event in events:
+                await self.post("event", "POST", f"/event/{visit_id}", event)
+            for cart in carts:
+                await self.post("cart_action", "POST", f"/cart-action/{visit_id}", cart)
+            await self.think()
+
+        if pageview_id:
+            await self.post("pageview_update", "PUT", f"/pageview/{visit_id}/update/{pageview_id}", {"time_spent": self.rng.randint(2, 90)})
+        await self.post("exit", "POST", f"/exit/{visit_id}", {"exit_page": urls[-1]})
+        if self.rng.random() < self.args.exit_link_ratio:
+            await self.post("exit_link", "POST", "/exit-link", {"url": "https://partner.example.net/", "from_page": urls[-1]})
+
+
+def create_project() -> int:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Load test", domain="loadgen.local", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def count_rows() -> dict:
+    db = SessionLocal()
+    try:
+        return {model.__tablename__: db.query(model).count() for model in COUNTED_TABLES}
+    finally:
+        db.close()
+
+
+def build_inprocess_app():
+    from fastapi import FastAPI
+    from routers import analytics
+
+    app = FastAPI()
+    app.include_router(analytics.router, prefix="/api/analytics")
+    return app
+
+
+async def drive(args, project_id: int, stats: Stats):
+    rng = random.Random(args.seed)
+    catalogue = Catalogue(args.urls, args.url_dist, args.zipf_s, rng)
+    returning_pool = []
+
+    if args.target == "inprocess":
+        # Server errors become 500 responses, as they would under uvicorn
+        transport = httpx.ASGITransport(app=build_inprocess_app(), raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadgen", headers=BROWSER_HEADERS)
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.target.rstrip("/"), headers=BROWSER_HEADERS, limits=limits, timeout=60)
+
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        if returning_pool and rng.random() < args.return_ratio:
+            visitor_id = rng.choice(returning_pool)
+        else:
+            visitor_id = uuid.uuid4().hex
+            returning_pool.append(visitor_id)
+        async with gate:
+            await Session(client, project_id, args, catalogue, stats, visitor_id, random.Random(rng.random())).run()
+
+    async with client:
+        await asyncio.gather(*(one(i) for i in range(args.sessions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="inprocess", help="'inprocess' or a base URL such as http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=("batch", "single"), default="batch")
+    parser.add_argument("--project-id", type=int, help="existing project (default: create one)")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100, help="sessions in flight at once")
+    parser.add_argument("--return-ratio", type=float, default=0.3, help="share of sessions from returning visitors")
+    parser.add_argument("--min-pages", type=int, default=1)
+    parser.add_argument("--max-pages", type=int, default=6)
+    parser.add_argument("--urls", type=int, default=200, help="distinct URLs on the simulated site")
+    parser.add_argument("--url-dist", choices=("zipf", "uniform"), default="zipf")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--cart-ratio", type=float, default=0.15, help="chance of add-to-cart on a product page")
+    parser.add_argument("--exit-link-ratio", type=float, default=0.1)
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between pages")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds to wait for write-behind before counting rows (http target)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    project_id = args.project_id or create_project()
+    before = count_rows()
+    stats = Stats()
+
+    inprocess = args.target == "inprocess"
+    if inprocess:
+        from ingestion import buffer as ingest_buffer
+        from visit_index import index as visit_index
+
+        ingest_buffer.start()
+        visit_index.start(SessionLocal)
+
+    started = time.perf_counter()
+    asyncio.run(drive(args, project_id, stats))
+    elapsed = time.perf_counter() - started
+
+    if inprocess:
+        ingest_buffer.stop()
+        visit_index.stop()
+    else:
+        time.sleep(args.settle)
+    after = count_rows()
+
+    print(f"target:           {args.target} ({args.mode} mode, project {project_id})")
+    print(f"database:         {engine.url.render_as_string(hide_password=True)}")
+    print(f"sessions:         {args.sessions} ({args.concurrency} concurrent, {args.return_ratio:.0%} returning, {args.url_dist} over {args.urls} URLs)")
+    stats.report(elapsed)
+    print("rows written:")
+    for table, count in after.items():
+        print(f"  {table:18s} {count - before[table]:9d}")
+
+
+if __name__ == "__main__":
+    main()
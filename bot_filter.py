@@ -0,0 +1,148 @@
+"""
+Bot classifier for the tracking endpoints.
+
+A beacon is rejected when any of these holds:
+
+- the User-Agent is missing or matches a known crawler / automation pattern,
+- the request headers look like a script rather than a browser (no
+  Accept-Language and no Origin/Referer, headless client hints, prefetch
+  and preview requests),
+- the client IP falls inside a configured datacenter range.
+
+UA verdicts are cached in an LRU keyed by a hash of the User-Agent string, so
+the regex runs once per distinct UA. Rejections are counted per project in
+memory; nothing is written to the database for bot traffic.
+"""
+import bisect
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Optional
+
+from cache_utils import LRUCache, MISSING
+
+logger = logging.getLogger("app")
+
+BOT_FILTER_ENABLED = os.getenv("BOT_FILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+BOT_UA_CACHE_SIZE = int(os.getenv("BOT_UA_CACHE_SIZE", "50000"))
+# Comma separated CIDRs and/or a file with one CIDR per line (# comments allowed)
+BOT_IP_RANGES = os.getenv("BOT_IP_RANGES", "")
+BOT_IP_RANGES_FILE = os.getenv("BOT_IP_RANGES_FILE")
+
+BOT_UA_RE = re.compile(
+    r"(bot|spider|crawl|slurp|mediapartners-google|adsbot-google|googlebot|bingbot|bingpreview|msnbot|yandex|baidu|duckduckbot|ahrefs|semrush|mj12|dotbot|bytespider|facebookexternalhit|twitterbot|linkedinbot|whatsapp|telegram|discordbot|slackbot|curl|wget|python-requests|aiohttp|httpclient|libwww-perl|scrapy|selenium|puppeteer|playwright|headless|lighthouse|uptimerobot)",
+    re.IGNORECASE,
+)
+
+
+class IPRanges:
+    """Sorted, merged CIDR ranges with O(log n) membership checks"""
+
+    def __init__(self, cidrs=()):
+        self._starts = {4: [], 6: []}
+        self._ends = {4: [], 6: []}
+        networks = []
+        for cidr in cidrs:
+            try:
+                networks.append(ipaddress.ip_network(cidr.strip(), strict=False))
+            except ValueError:
+                logger.warning(f"⚠️ Ignoring invalid bot IP range: {cidr!r}")
+        for network in sorted(networks, key=lambda n: (n.version, int(n.network_address))):
+            start, end = int(network.network_address), int(network.broadcast_address)
+            starts, ends = self._starts[network.version], self._ends[network.version]
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def __contains__(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        value = int(address)
+        starts = self._starts[address.version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[address.version][i]
+
+    @classmethod
+    def from_config(cls, ranges: str = BOT_IP_RANGES, path: Optional[str] = BOT_IP_RANGES_FILE):
+        cidrs = [c for c in ranges.split(",") if c.strip()]
+        if path:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        line = line.split("#", 1)[0].strip()
+                        if line:
+                            cidrs.append(line)
+            except OSError as e:
+                logger.error(f"❌ Could not read bot IP ranges from {path}: {e}")
+        return cls(cidrs)
+
+
+class BotClassifier:
+    def __init__(
+        self,
+        ip_ranges: Optional[IPRanges] = None,
+        cache_size: int = BOT_UA_CACHE_SIZE,
+        enabled: bool = BOT_FILTER_ENABLED,
+    ):
+        self.enabled = enabled
+        self.ip_ranges = ip_ranges if ip_ranges is not None else IPRanges.from_config()
+        self.ua_verdicts = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._rejections = defaultdict(Counter)
+
+    def _ua_verdict(self, user_agent: str) -> Optional[str]:
+        key = hashlib.blake2b(user_agent.encode("utf-8", "replace"), digest_size=12).digest()
+        verdict = self.ua_verdicts.get(key)
+        if verdict is MISSING:
+            verdict = "user_agent" if BOT_UA_RE.search(user_agent) else None
+            self.ua_verdicts.set(key, verdict)
+        return verdict
+
+    @staticmethod
+    def _header_verdict(headers) -> Optional[str]:
+        if "headless" in (headers.get("sec-ch-ua") or "").lower():
+            return "headers"
+        purpose = (headers.get("purpose") or headers.get("sec-purpose") or headers.get("x-purpose") or "").lower()
+        if "prefetch" in purpose or "preview" in purpose:
+            return "headers"
+        # Browsers always send Accept-Language, and an Origin or Referer on cross-site beacons
+        if not headers.get("accept-language") and not headers.get("origin") and not headers.get("referer"):
+            return "headers"
+        return None
+
+    def classify(self, headers, ip: Optional[str]) -> Optional[str]:
+        """Rejection reason for a beacon ("user_agent", "headers", "ip"), or None if it looks human"""
+        if not self.enabled:
+            return None
+        user_agent = (headers.get("user-agent") or "").strip()
+        if not user_agent:
+            return "user_agent"
+        verdict = self._ua_verdict(user_agent) or self._header_verdict(headers)
+        if verdict:
+            return verdict
+        if ip and len(self.ip_ranges) and ip in self.ip_ranges:
+            return "ip"
+        return None
+
+    def record(self, project_id: int, reason: str):
+        with self._lock:
+            self._rejections[project_id][reason] += 1
+
+    def rejections(self, project_id: int) -> dict:
+        with self._lock:
+            counts = dict(self._rejections.get(project_id, {}))
+        return {"total": sum(counts.values()), "by_reason": counts}
+
+
+classifier = BotClassifier()
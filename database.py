@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Seconds to wait for a pooled connection before giving up; tracking routes
+# are shed by the admission controller well before this is reached
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
 
 if not DATABASE_URL:
     raise ValueError("❌ DATABASE_URL is missing! Check your .env file.")
@@ -17,7 +22,7 @@ if DATABASE_URL.startswith("sqlite"):
         connect_args={"check_same_thread": False},
         pool_size=20,           # Increase pool size
         max_overflow=30,        # Increase overflow
-        pool_timeout=None,      # Remove timeout
+        pool_timeout=DB_POOL_TIMEOUT,
         pool_recycle=3600,       # Recycle connections after 1 hour
         pool_pre_ping=True      # Verify connections before use
     )
@@ -26,7 +31,7 @@ else:
         DATABASE_URL,
         pool_size=20,           # Increase pool size
         max_overflow=30,        # Increase overflow
-        pool_timeout=None,      # Remove timeout
+        pool_timeout=DB_POOL_TIMEOUT,
         pool_recycle=3600,       # Recycle connections after 1 hour
         pool_pre_ping=True      # Verify connections before use
     )
@@ -39,6 +44,60 @@ SessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+logger = logging.getLogger("app")
+
+
+def _async_url(url: str) -> str:
+    """Same database, async driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql+psycopg2:"):
+        return "postgresql+asyncpg:" + url[len("postgresql+psycopg2:"):]
+    if url.startswith(("postgresql:", "postgres:")):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+
+# Optional async engine for the tracking endpoints; needs aiosqlite or asyncpg
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    if ASYNC_DATABASE_URL.startswith("sqlite"):
+        # SQLAlchemy uses NullPool for aiosqlite; connections are not shared across event loops
+        async_engine = create_async_engine(ASYNC_DATABASE_URL)
+
+        # Interleaved coroutines would otherwise hold read locks and fail to
+        # upgrade them ("database is locked"); take the write lock up front
+        # and let SQLite's busy timeout queue writers instead
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def _sqlite_autocommit_driver(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(async_engine.sync_engine, "begin")
+        def _sqlite_begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=20,
+            max_overflow=30,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=3600,
+            pool_pre_ping=True
+        )
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False
+    )
+except ImportError as e:
+    logger.warning(f"⚠️ Async database driver unavailable, async endpoints disabled: {e}")
+    async_engine = None
+    AsyncSessionLocal = None
+
 
 def get_db():
     db = SessionLocal()
@@ -46,3 +105,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database engine is not configured (install aiosqlite or asyncpg)")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Tracking endpoints run on the async engine when this is true; "auto" (the
+# default) uses it only off SQLite, where aiosqlite is slower than the sync
+# driver, and only when an async driver is installed
+TRACKING_ASYNC = os.getenv("TRACKING_ASYNC", "auto").lower()
+USE_ASYNC_TRACKING = AsyncSessionLocal is not None and (
+    TRACKING_ASYNC in ("1", "true", "yes")
+    or (TRACKING_ASYNC == "auto" and not DATABASE_URL.startswith("sqlite"))
+)
+
+
+class ThreadedSession:
+    """
+    Sync session behind the AsyncSession calls the tracking handlers make
+    (run_sync, scalar, commit, rollback); each call runs in the threadpool.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+    async def scalar(self, statement):
+        return await run_in_threadpool(self.session.scalar, statement)
+
+    async def commit(self):
+        await run_in_threadpool(self.session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.session.rollback)
+
+
+async def get_tracking_db():
+    if USE_ASYNC_TRACKING:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = SessionLocal()
+    try:
+        yield ThreadedSession(db)
+    finally:
+        await run_in_threadpool(db.close)
@@ -0,0 +1,561 @@
+"""
+Durable, append-only log of accepted tracking beacons.
+
+With EVENT_LOG_DIR set, the tracking endpoints append each raw beacon to
+this log before doing any database work and acknowledge it once the log has
+been fsynced; all database work happens in the LogConsumer.
+Appends are group-committed: a background thread fsyncs at most every
+EVENT_LOG_FSYNC_INTERVAL seconds and all waiters since the previous fsync are
+released together.
+
+Layout: EVENT_LOG_DIR/worker-N, one directory per server process (each
+process claims the first free slot), holding numbered NDJSON segments
+(`000000000001.ndjson`, ...). A segment is sealed once it passes
+EVENT_LOG_SEGMENT_BYTES. Record kinds:
+
+    {"beacon": project_id, "ip": ..., "received_at": ..., "entries": [...]}
+                                                       tracking beacon (see routers.analytics)
+    {"stage": name, "args": [...], "kwargs": {...}}   write-behind work
+    {"table": name, "row": {...}}                      row a request inserted itself
+    {"table": name, "id": id, "values": {...}}         update a request made itself
+
+New visits and page views are answered with a ref ("v-<hex>", "p-<hex>")
+instead of a database id. The LogConsumer applies beacons, records each ref
+in ingest_refs with its row and resolves later beacons through it; a beacon
+whose ref is not applied yet (it reached another worker) is re-appended for
+up to EVENT_LOG_REF_WAIT seconds. Refs are kept for EVENT_LOG_REF_DAYS.
+
+The position the consumer has reached is written to event_log_checkpoints in
+the same transaction as the rows, so restarts resume exactly where the
+database left off. Sealed
+segments behind the checkpoint are gzipped, and archives beyond
+EVENT_LOG_RETAIN_BYTES are deleted oldest first.
+
+Replay (after an outage or a schema change) re-applies a log directory:
+
+    python event_log.py replay --dir /var/lib/analytics/events/worker-0 [--since 2026-10-01T00:00:00] [--tables visits,events]
+"""
+import argparse
+import asyncio
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from datetime import date, datetime
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger("app")
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR")
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+EVENT_LOG_FSYNC_INTERVAL = float(os.getenv("EVENT_LOG_FSYNC_INTERVAL", "0.02"))
+EVENT_LOG_RETAIN_BYTES = int(os.getenv("EVENT_LOG_RETAIN_BYTES", str(1024 * 1024 * 1024)))
+EVENT_LOG_CONSUME_INTERVAL = float(os.getenv("EVENT_LOG_CONSUME_INTERVAL", "0.5"))
+EVENT_LOG_REF_WAIT = float(os.getenv("EVENT_LOG_REF_WAIT", "60"))
+EVENT_LOG_REF_DAYS = int(os.getenv("EVENT_LOG_REF_DAYS", "2"))
+
+SEGMENT_SUFFIX = ".ndjson"
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+Position = Tuple[int, int]
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    if len(obj) == 1 and "$d" in obj:
+        return date.fromisoformat(obj["$d"])
+    return obj
+
+
+def encode(record: dict) -> bytes:
+    return json.dumps(record, default=_default, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def decode(line: bytes) -> dict:
+    return json.loads(line, object_hook=_object_hook)
+
+
+class EventLog:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = EVENT_LOG_SEGMENT_BYTES,
+        fsync_interval: float = EVENT_LOG_FSYNC_INTERVAL,
+        retain_bytes: int = EVENT_LOG_RETAIN_BYTES,
+    ):
+        self.directory = directory
+        # Checkpoint key; unique per host so several servers can share a database
+        self.name = f"{socket.gethostname()}:{os.path.basename(os.path.normpath(directory))}"
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.retain_bytes = retain_bytes
+
+        self._lock = threading.Lock()
+        self._synced_cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._file = None
+        self._segment = 0
+        self._offset = 0
+        self._written = (0, 0)
+        self._synced = (0, 0)
+
+    # -- writing ---------------------------------------------------------
+
+    def _acquire_lock(self):
+        lock_file = open(os.path.join(self.directory, "LOCK"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"Event log {self.directory} is in use by another process")
+        return lock_file
+
+    def open(self, start_sync_thread: bool = True) -> "EventLog":
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = self._acquire_lock()
+
+        numbers = [number for number, _, _ in self.segment_files()]
+        self._segment = max(numbers, default=0)
+        live = self._path(self._segment)
+        if self._segment == 0 or not os.path.exists(live):
+            # Never append to an archived segment
+            self._segment += 1
+            live = self._path(self._segment)
+        self._repair(live)
+        self._file = open(live, "ab")
+        self._offset = self._file.tell()
+        self._written = self._synced = (self._segment, self._offset)
+
+        if start_sync_thread:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="event-log-fsync", daemon=True)
+            self._thread.start()
+        return self
+
+    @classmethod
+    def claim(cls, parent: str, max_workers: int = 64, **kwargs) -> "EventLog":
+        """Open the first `worker-N` log under `parent` not held by another process"""
+        for n in range(max_workers):
+            try:
+                return cls(os.path.join(parent, f"worker-{n}"), **kwargs).open()
+            except RuntimeError:
+                continue
+        raise RuntimeError(f"No free event log slot under {parent}")
+
+    @staticmethod
+    def _repair(path: str):
+        """Drop a torn last line left by a crash mid-write"""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            keep = data.rfind(b"\n") + 1
+            if keep != len(data):
+                logger.warning(f"⚠️ Event log {path}: truncating {len(data) - keep} bytes of torn write")
+                f.truncate(keep)
+
+    def _path(self, segment: int, archived: bool = False) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{ARCHIVE_SUFFIX if archived else SEGMENT_SUFFIX}")
+
+    def append(self, record: dict) -> Position:
+        data = encode(dict(record, ts=datetime.utcnow()))
+        with self._lock:
+            if self._offset and self._offset + len(data) > self.segment_bytes:
+                self._rotate_locked()
+            self._file.write(data)
+            self._offset += len(data)
+            self._written = (self._segment, self._offset)
+            return self._written
+
+    def _rotate_locked(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._segment += 1
+        self._offset = 0
+        self._file = open(self._path(self._segment), "ab")
+
+    def sync(self):
+        """fsync everything appended so far and release its waiters"""
+        with self._lock:
+            position = self._written
+            if position > self._synced:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        with self._synced_cond:
+            if position > self._synced:
+                self._synced = position
+                self._synced_cond.notify_all()
+
+    def durable_position(self) -> Position:
+        return self._synced
+
+    def wait_durable(self, position: Optional[Position] = None, timeout: Optional[float] = None) -> bool:
+        target = position or self._written
+        with self._synced_cond:
+            return self._synced_cond.wait_for(lambda: self._synced >= target, timeout)
+
+    async def wait_durable_async(self, position: Optional[Position] = None):
+        target = position or self._written
+        while self._synced < target:
+            await asyncio.sleep(self.fsync_interval / 2)
+
+    def _run(self):
+        while not self._stopping.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"❌ Event log fsync failed: {e}")
+
+    def close(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+        if self._file:
+            self.sync()
+            self._file.close()
+            self._file = None
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    # -- reading ---------------------------------------------------------
+
+    def segment_files(self):
+        """(segment number, path, archived) for every segment, oldest first"""
+        found = []
+        for filename in os.listdir(self.directory):
+            for suffix, archived in ((ARCHIVE_SUFFIX, True), (SEGMENT_SUFFIX, False)):
+                if filename.endswith(suffix) and filename[:-len(suffix)].isdigit():
+                    found.append((int(filename[:-len(suffix)]), os.path.join(self.directory, filename), archived))
+                    break
+        return sorted(found)
+
+    def read(self, start: Position = (0, 0), end: Optional[Position] = None) -> Iterator[Tuple[Position, dict]]:
+        """Yield (position after record, record) from `start` up to `end` (default: durable position)"""
+        end = end or self._synced
+        if end <= start:
+            return
+        for number, path, archived in self.segment_files():
+            if number < start[0] or number > end[0]:
+                continue
+            opener = gzip.open if archived else open
+            with opener(path, "rb") as f:
+                offset = 0
+                if number == start[0] and start[1]:
+                    if archived:
+                        f.read(start[1])
+                    else:
+                        f.seek(start[1])
+                    offset = start[1]
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    if (number, offset) > end:
+                        return
+                    yield (number, offset), decode(line)
+
+    # -- retention -------------------------------------------------------
+
+    def compact(self, checkpoint: Position):
+        """Gzip sealed segments the consumer is done with; drop archives over the size budget"""
+        if self._file is not None:
+            self._compact(checkpoint, self._segment)
+            return
+        # Offline (compact command): hold the directory lock so no writer opens the
+        # log meanwhile; the newest segment is the one a writer would append to
+        lock_file = self._acquire_lock()
+        try:
+            self._compact(checkpoint, max((number for number, _, _ in self.segment_files()), default=0))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _compact(self, checkpoint: Position, live_segment: int):
+        for number, path, archived in self.segment_files():
+            if archived or number >= live_segment:
+                continue
+            if number > checkpoint[0] or (number == checkpoint[0] and checkpoint[1] < os.path.getsize(path)):
+                continue
+            target = self._path(number, archived=True)
+            with open(path, "rb") as src, gzip.open(target + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(target + ".tmp", target)
+            os.remove(path)
+
+        archives = [(number, path) for number, path, archived in self.segment_files() if archived]
+        total = sum(os.path.getsize(path) for _, path in archives)
+        for number, path in archives:
+            if total <= self.retain_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            logger.warning(f"⚠️ Event log retention: deleted archived segment {number}")
+
+
+def load_checkpoint(session_factory, name: str) -> Position:
+    import models
+
+    db = session_factory()
+    try:
+        row = db.get(models.EventLogCheckpoint, name)
+        return (row.segment, row.offset) if row else (0, 0)
+    finally:
+        db.close()
+
+
+class LogConsumer:
+    """
+    Applies the log to the database.
+
+    Stage records are fed into the ingestion buffer. Beacon records, which
+    the tracking endpoints append before doing any database work, are handed
+    to `beacons` (routers.analytics.logged_beacons) and applied in the
+    consumer's session. The rows, the stage work they produce and the new
+    position are committed in one transaction; if it fails, nothing is kept
+    and the consumer reads the same records again.
+    """
+
+    def __init__(self, log: EventLog, buffer, session_factory=None, interval: float = EVENT_LOG_CONSUME_INTERVAL, beacons=None):
+        from database import SessionLocal
+        from ingestion import CheckpointStage
+
+        self.log = log
+        self.buffer = buffer
+        self.session_factory = session_factory or SessionLocal
+        self.interval = interval
+        self.beacons = beacons
+        self.checkpoint = buffer.register_stage("checkpoint", CheckpointStage(log.name))
+        self.position = load_checkpoint(self.session_factory, log.name)
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def consume(self) -> int:
+        """
+        Apply up to a batch of durable records since the last call; returns
+        the number of records applied. Reads nothing while the buffer is at
+        max_pending, so a backlog stays in the log rather than in memory.
+        """
+        with self.buffer.exclusive():
+            if self.buffer.pending() >= self.buffer.max_pending:
+                return 0
+            fed = 0
+            start = self.position
+            deferred = []
+            session = self.session_factory()
+            try:
+                with self.buffer.direct():
+                    for position, record in self.log.read(start):
+                        if "stage" in record:
+                            self.buffer.enqueue(record["stage"], *record["args"], **record["kwargs"])
+                            fed += 1
+                        elif "beacon" in record and self.beacons is not None:
+                            self.beacons.apply(session, record, deferred)
+                            fed += 1
+                        self.position = position
+                        if fed >= self.buffer.batch_size or self.buffer.pending() >= self.buffer.max_pending:
+                            break
+                    if self.position == start:
+                        return 0
+                    self.buffer.enqueue("checkpoint", self.position)
+                self.buffer.flush(session)
+            except Exception:
+                session.rollback()
+                self.buffer.discard()
+                self.position = start
+                if self.beacons is not None:
+                    self.beacons.reset()
+                raise
+            finally:
+                session.close()
+
+        # Beacons waiting on a ref another worker has not applied yet go to the back of the log
+        for record in deferred:
+            self.log.append(record)
+        return fed
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-log-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Apply what is left"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(10)
+            self._thread = None
+        self.log.sync()
+        try:
+            while self.consume() >= self.buffer.batch_size:
+                self.log.sync()
+        except Exception as e:
+            logger.error(f"❌ Event log consumer stopped with unapplied records: {e}")
+        self.buffer.flush()
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        while not self._stopping.wait(self.interval):
+            try:
+                # A full batch means there is more backlog; deferred beacons wait for the next round
+                while self.consume() >= self.buffer.batch_size and not self._stopping.is_set():
+                    pass
+                if time.monotonic() - last_compaction > 60:
+                    last_compaction = time.monotonic()
+                    self.log.compact(load_checkpoint(self.session_factory, self.log.name))
+                    if self.beacons is not None:
+                        self.beacons.prune(self.session_factory)
+            except Exception as e:
+                logger.error(f"❌ Event log consumer error: {e}")
+
+
+def replay(directory: str, since: Optional[datetime] = None, tables: Optional[set] = None, chunk: int = 5000, beacons=None) -> dict:
+    """
+    Re-apply a log directory to the database.
+
+    Rows the requests wrote themselves are inserted with ON CONFLICT DO
+    NOTHING and their updates re-applied; write-behind work goes through a
+    private ingestion buffer. Beacon records are applied by `beacons`, which
+    skips visits and page views whose ref is already stored. Write-behind
+    rows and other beacon entries carry no id, so replaying a range that is
+    already in the database inserts them again; use --since and --tables to
+    backfill only what is missing.
+    """
+    from sqlalchemy import text, update as sa_update
+
+    from database import SessionLocal
+    from ingestion import IngestionBuffer, _table_for, buffer as shared_buffer
+    import utils
+
+    log = EventLog(directory)
+    log._synced = (float("inf"), 0)
+    buffer = IngestionBuffer(flush_interval=3600)
+    counts = {"records": 0, "rows": 0, "updates": 0, "stage_items": 0, "beacons": 0, "unresolved": 0, "skipped": 0}
+    seeded_ids = set()
+
+    def wanted(record) -> bool:
+        if since and record.get("ts") and record["ts"] < since:
+            return False
+        if not tables:
+            return True
+        if "table" in record:
+            return record["table"] in tables
+        if "beacon" in record:
+            return "beacons" in tables
+        if record["stage"] == "rows":
+            return record["args"][0] in tables
+        return record["stage"] in tables
+
+    def apply(batch):
+        db = SessionLocal()
+        try:
+            dialect = db.get_bind().dialect.name
+            for record in batch:
+                if "table" not in record:
+                    continue
+                table = _table_for(record["table"])
+                if "row" in record:
+                    stmt = utils.get_insert_for_dialect(table, dialect).values(**record["row"])
+                    db.execute(stmt.on_conflict_do_nothing())
+                    seeded_ids.add(table.name)
+                    counts["rows"] += 1
+                else:
+                    db.execute(sa_update(table).where(table.c.id == record["id"]).values(**record["values"]))
+                    counts["updates"] += 1
+            db.commit()
+        finally:
+            db.close()
+        beacon_records = [record for record in batch if "beacon" in record]
+        if beacons is not None and beacon_records:
+            # The _record_* hooks submit to the shared buffer; apply them with the rows
+            db = SessionLocal()
+            try:
+                with shared_buffer.exclusive(), shared_buffer.direct():
+                    for record in beacon_records:
+                        deferred = []
+                        beacons.apply(db, record, deferred)
+                        counts["beacons"] += 1
+                        counts["unresolved"] += sum(len(r["entries"]) for r in deferred)
+                    shared_buffer.flush(db)
+            finally:
+                db.close()
+        for record in batch:
+            if "stage" in record:
+                buffer.enqueue(record["stage"], *record["args"], **record["kwargs"])
+                counts["stage_items"] += 1
+        buffer.flush()
+
+    batch = []
+    for _, record in log.read():
+        counts["records"] += 1
+        if not wanted(record):
+            counts["skipped"] += 1
+            continue
+        batch.append(record)
+        if len(batch) >= chunk:
+            apply(batch)
+            batch = []
+    if batch:
+        apply(batch)
+
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            # Explicit ids do not advance Postgres sequences
+            for name in seeded_ids:
+                db.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE((SELECT MAX(id) FROM {name}), 1))"
+                ))
+            db.commit()
+    finally:
+        db.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_cmd = commands.add_parser("replay", help="re-apply a log directory to the database")
+    replay_cmd.add_argument("--dir", default=EVENT_LOG_DIR, required=EVENT_LOG_DIR is None)
+    replay_cmd.add_argument("--since", type=datetime.fromisoformat, help="skip records logged before this UTC time")
+    replay_cmd.add_argument("--tables", help="comma separated table / stage names to replay (\"beacons\" for beacon records)")
+
+    compact_cmd = commands.add_parser("compact", help="archive consumed segments and enforce retention")
+    compact_cmd.add_argument("--dir", default=EVENT_LOG_DIR, required=EVENT_LOG_DIR is None)
+
+    args = parser.parse_args()
+    if args.command == "replay":
+        from routers.analytics import logged_beacons
+
+        tables = set(args.tables.split(",")) if args.tables else None
+        print(replay(args.dir, since=args.since, tables=tables, beacons=logged_beacons))
+    else:
+        from database import SessionLocal
+
+        log = EventLog(args.dir)
+        log.compact(load_checkpoint(SessionLocal, log.name))
+        print(f"Compacted {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
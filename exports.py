@@ -0,0 +1,275 @@
+"""
+Streaming data exports (visits, page views, events, cart actions) for the
+reports router and scheduled dumps.
+
+Rows are read through a server-side cursor (`yield_per`, which turns on
+`stream_results`) in chunks of EXPORT_CHUNK_ROWS and encoded chunk by chunk,
+so memory stays flat however many rows a project has. Each export opens its
+own session: the generator outlives the request's `get_db` dependency.
+
+Page views and events are selected through their visit, so every dataset is
+scoped by project and the visit's `visited_at` range (the dashboard's own
+counting rule).
+
+CSV keeps the dashboard's original column set. Parquet (optional dependency
+pyarrow) carries typed columns: integers, floats and booleans as such,
+timestamps as UTC microseconds, strings dictionary-encoded and JSON as text.
+Each cursor chunk becomes one row group, so Parquet files are also written
+without holding more than one chunk:
+
+    python exports.py parquet --project 3 --dataset visits --since 2026-01-01 --until 2026-01-31 --out visits.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime, time
+from typing import Iterator, Optional
+
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer, select
+
+import models
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only the Parquet export needs it
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "50000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+visit, pageview, event, cart = models.Visit, models.PageView, models.Event, models.CartAction
+
+# dataset -> (header, column) pairs; page views and events join their visit
+DATASETS = {
+    "visits": [
+        ("Visitor ID", visit.visitor_id), ("IP Address", visit.ip_address), ("Country", visit.country),
+        ("State", visit.state), ("City", visit.city), ("Device", visit.device), ("Browser", visit.browser),
+        ("OS", visit.os), ("Referrer", visit.referrer), ("Entry Page", visit.entry_page),
+        ("Exit Page", visit.exit_page), ("Session Duration", visit.session_duration), ("Visited At", visit.visited_at),
+    ],
+    "pageviews": [
+        ("Visit ID", pageview.visit_id), ("Visitor ID", visit.visitor_id), ("URL", pageview.url),
+        ("Base URL", pageview.base_url), ("Title", pageview.title), ("Time Spent", pageview.time_spent),
+        ("Scroll Depth", pageview.scroll_depth), ("Viewed At", pageview.viewed_at),
+    ],
+    "events": [
+        ("Visit ID", event.visit_id), ("Visitor ID", visit.visitor_id), ("Event Type", event.event_type),
+        ("URL", event.url), ("Event Data", event.event_data), ("Timestamp", event.timestamp),
+    ],
+}
+# dataset -> typed columns for Parquet; field names are the column names
+COLUMNAR = {
+    "visits": [
+        visit.id, visit.visitor_id, visit.session_id, visit.ip_address, visit.country, visit.state, visit.city,
+        visit.latitude, visit.longitude, visit.isp, visit.device, visit.browser, visit.os, visit.screen_resolution,
+        visit.language, visit.timezone, visit.referrer, visit.source_category, visit.referrer_domain,
+        visit.utm_source, visit.utm_medium, visit.utm_campaign, visit.entry_page, visit.entry_base_url,
+        visit.exit_page, visit.exit_base_url, visit.session_duration, visit.page_views_count, visit.events_count,
+        visit.is_unique, visit.is_new_session, visit.is_bounce, visit.visited_at, visit.last_activity_at,
+    ],
+    "pageviews": [
+        pageview.id, pageview.visit_id, visit.visitor_id, pageview.url, pageview.base_url, pageview.title,
+        pageview.time_spent, pageview.scroll_depth, pageview.viewed_at,
+    ],
+    "events": [
+        event.id, event.visit_id, visit.visitor_id, event.event_type, event.url, event.event_data, event.timestamp,
+    ],
+    "cart_actions": [
+        cart.id, cart.visit_id, visit.visitor_id, cart.action, cart.product_id, cart.product_name,
+        cart.product_url, cart.page_url, cart.created_at,
+    ],
+}
+_ORDER = {
+    "visits": (visit.visited_at, visit.id),
+    "pageviews": (visit.visited_at, pageview.visit_id, pageview.id),
+    "events": (visit.visited_at, event.visit_id, event.id),
+    "cart_actions": (visit.visited_at, cart.visit_id, cart.id),
+}
+_JOIN = {
+    "pageviews": (pageview, visit.id == pageview.visit_id),
+    "events": (event, visit.id == event.visit_id),
+    "cart_actions": (cart, visit.id == cart.visit_id),
+}
+
+
+def headers(dataset: str) -> list:
+    return [header for header, _ in DATASETS[dataset]]
+
+
+def export_query(dataset: str, project_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 columnar: bool = False):
+    """SELECT for one dataset (CSV or Parquet columns), ordered by visit time; raises KeyError for an unknown dataset"""
+    columns = COLUMNAR[dataset] if columnar else [column for _, column in DATASETS[dataset]]
+    stmt = select(*columns)
+    if dataset in _JOIN:
+        stmt = stmt.select_from(visit).join(*_JOIN[dataset])
+    stmt = stmt.where(visit.project_id == project_id)
+    if start is not None:
+        stmt = stmt.where(visit.visited_at >= start)
+    if end is not None:
+        stmt = stmt.where(visit.visited_at <= end)
+    return stmt.order_by(*_ORDER[dataset])
+
+
+def iter_chunks(stmt, session_factory=None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[list]:
+    """Lists of up to `chunk_rows` row tuples, fetched through a server-side cursor"""
+    if session_factory is None:
+        from database import SessionLocal as session_factory
+    db = session_factory()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _json_positions(columns: list) -> list:
+    return [i for i, column in enumerate(columns) if isinstance(column.type, JSON)]
+
+
+def _encode_json(rows, positions):
+    for row in rows:
+        row = list(row)
+        for i in positions:
+            if row[i] is not None:
+                row[i] = json.dumps(row[i], separators=(",", ":"))
+        yield row
+
+
+def csv_stream(dataset: str, chunks: Iterator[list], gzip: bool = False) -> Iterator[bytes]:
+    """Encode row chunks as CSV (UTF-8, header first), one bytes block per chunk, optionally gzipped"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def emit() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    # csv writes datetimes as str() ("YYYY-MM-DD HH:MM:SS[.ffffff]"); JSON columns need encoding
+    json_positions = _json_positions([column for _, column in DATASETS[dataset]])
+    writer.writerow(headers(dataset))
+    for chunk in chunks:
+        writer.writerows(_encode_json(chunk, json_positions) if json_positions else chunk)
+        block = emit()
+        if block:
+            yield block
+    block = emit()
+    if compressor:
+        block += compressor.flush()
+    if block:
+        yield block
+
+
+# ---------------------------------------
+# Parquet
+# ---------------------------------------
+def _arrow_type(column):
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")  # stored as naive UTC
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def parquet_schema(dataset: str):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    return pa.schema([pa.field(column.key, _arrow_type(column)) for column in COLUMNAR[dataset]])
+
+
+def _record_batch(chunk: list, schema, json_positions: list):
+    arrays = []
+    for i, (field, values) in enumerate(zip(schema, zip(*chunk))):
+        if i in json_positions:
+            values = [None if v is None else json.dumps(v, separators=(",", ":")) for v in values]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _write_row_groups(dataset: str, chunks: Iterator[list], where) -> Iterator[int]:
+    """Write each chunk to `where` (path or file object) as one row group, yielding its row count; the footer is written once chunks run out"""
+    schema = parquet_schema(dataset)
+    json_positions = _json_positions(COLUMNAR[dataset])
+    with pq.ParquetWriter(where, schema, compression=PARQUET_COMPRESSION) as writer:
+        for chunk in chunks:
+            if chunk:
+                writer.write_table(pa.Table.from_batches([_record_batch(chunk, schema, json_positions)]))
+                yield len(chunk)
+
+
+def write_parquet(dataset: str, chunks: Iterator[list], path: str) -> int:
+    """Write a Parquet file to `path`; returns the number of rows"""
+    return sum(_write_row_groups(dataset, chunks, path))
+
+
+class _ByteQueue(io.RawIOBase):
+    """Write-only file collecting what ParquetWriter emits until it is drained"""
+
+    def __init__(self):
+        self.blocks, self.position = [], 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.blocks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.blocks = b"".join(self.blocks), []
+        return data
+
+
+def parquet_stream(dataset: str, chunks: Iterator[list]) -> Iterator[bytes]:
+    """Encode row chunks as a Parquet file, one bytes block per row group, then the footer"""
+    sink = _ByteQueue()
+    for _ in _write_row_groups(dataset, chunks, sink):
+        block = sink.drain()
+        if block:
+            yield block
+    yield sink.drain()
+
+
+def main():
+    from utils import ist_to_utc
+
+    parser = argparse.ArgumentParser(description="Bulk data exports")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parquet_cmd = commands.add_parser("parquet", help="write one dataset of a project to a Parquet file")
+    parquet_cmd.add_argument("--project", type=int, required=True, help="project id")
+    parquet_cmd.add_argument("--dataset", choices=list(COLUMNAR), default="visits")
+    parquet_cmd.add_argument("--since", type=date.fromisoformat, help="only visits on or after this IST day (YYYY-MM-DD)")
+    parquet_cmd.add_argument("--until", type=date.fromisoformat, help="only visits on or before this IST day (YYYY-MM-DD)")
+    parquet_cmd.add_argument("--out", required=True, help="output path")
+
+    args = parser.parse_args()
+    start = ist_to_utc(datetime.combine(args.since, time.min)) if args.since else None
+    end = ist_to_utc(datetime.combine(args.until, time.max)) if args.until else None
+    stmt = export_query(args.dataset, args.project, start=start, end=end, columnar=True)
+    rows = write_parquet(args.dataset, iter_chunks(stmt, chunk_rows=PARQUET_ROW_GROUP_ROWS), args.out)
+    print(f"Wrote {rows} {args.dataset} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
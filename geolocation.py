@@ -0,0 +1,194 @@
+"""
+IP geolocation for the tracking path.
+
+Lookups go through a single memory-mapped MaxMind reader shared by the whole
+process, with a bounded LRU cache in front of it. Misses (including private
+addresses and IPs not in the database) are cached too, so a given IP costs at
+most one reader lookup until it is evicted.
+
+ip-api.com is only used as an optional fallback. It never runs on the request
+thread: the lookup is queued, rate limited to stay under the free tier limit,
+and the visit row is patched when the answer arrives.
+"""
+import ipaddress
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import geoip2.database
+import geoip2.errors
+
+from cache_utils import LRUCache, MISSING
+
+logger = logging.getLogger("app")
+
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "./GeoLite2-City.mmdb")
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "100000"))
+GEOIP_REMOTE_FALLBACK = os.getenv("GEOIP_REMOTE_FALLBACK", "false").lower() in ("1", "true", "yes")
+GEOIP_REMOTE_PER_MINUTE = int(os.getenv("GEOIP_REMOTE_PER_MINUTE", "40"))
+
+IP_API_URL = "http://ip-api.com/json/{ip}?fields=status,message,country,regionName,city,lat,lon,isp,query"
+
+
+def is_private_ip(ip_address: str) -> bool:
+    """True for loopback, private, link-local and unparseable addresses"""
+    try:
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return True
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+
+
+class GeoResolver:
+    """Cached IP -> location resolver backed by one shared MaxMind reader"""
+
+    def __init__(
+        self,
+        db_path: str = GEOIP_DB_PATH,
+        cache_size: int = GEOIP_CACHE_SIZE,
+        remote_fallback: bool = GEOIP_REMOTE_FALLBACK,
+        remote_per_minute: int = GEOIP_REMOTE_PER_MINUTE,
+    ):
+        self.db_path = db_path
+        self.cache = LRUCache(cache_size)
+        self.remote_fallback = remote_fallback
+        self.remote_per_minute = remote_per_minute
+
+        self._reader = None
+        self._reader_checked = False
+        self._reader_lock = threading.Lock()
+
+        self._executor = None
+        self._inflight = set()
+        self._remote_lock = threading.Lock()
+        self._remote_calls = []
+
+    @property
+    def reader(self):
+        """Open the MaxMind database once, memory-mapped; None if it is missing"""
+        if not self._reader_checked:
+            with self._reader_lock:
+                if not self._reader_checked:
+                    if os.path.exists(self.db_path):
+                        try:
+                            self._reader = geoip2.database.Reader(
+                                self.db_path, mode=geoip2.database.MODE_MMAP
+                            )
+                        except Exception as e:
+                            logger.error(f"❌ Could not open GeoIP database {self.db_path}: {e}")
+                    self._reader_checked = True
+        return self._reader
+
+    def lookup(self, ip_address: str) -> dict:
+        """Return location fields for an IP, or {} when it cannot be resolved"""
+        if not ip_address:
+            return {}
+
+        cached = self.cache.get(ip_address)
+        if cached is not MISSING:
+            return cached
+
+        location = {} if is_private_ip(ip_address) else self._lookup_local(ip_address)
+        self.cache.set(ip_address, location)
+        return location
+
+    def _lookup_local(self, ip_address: str) -> dict:
+        reader = self.reader
+        if reader is None:
+            return {}
+        try:
+            response = reader.city(ip_address)
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return {}
+        except Exception as e:
+            logger.error(f"❌ GeoIP lookup failed for {ip_address}: {e}")
+            return {}
+
+        return {
+            "country": response.country.name,
+            "state": response.subdivisions.most_specific.name if response.subdivisions else None,
+            "city": response.city.name,
+            "latitude": response.location.latitude,
+            "longitude": response.location.longitude,
+        }
+
+    def wants_remote(self, ip_address: str, location: dict) -> bool:
+        return self.remote_fallback and not location and not is_private_ip(ip_address)
+
+    def resolve_remote_async(self, ip_address: str, on_result):
+        """Queue an ip-api.com lookup; `on_result(location)` runs on a worker thread"""
+        with self._remote_lock:
+            if ip_address in self._inflight:
+                return False
+            if not self._take_remote_slot():
+                return False
+            self._inflight.add(ip_address)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="geoip-remote")
+
+        self._executor.submit(self._resolve_remote, ip_address, on_result)
+        return True
+
+    def _take_remote_slot(self) -> bool:
+        now = time.monotonic()
+        self._remote_calls = [t for t in self._remote_calls if now - t < 60]
+        if len(self._remote_calls) >= self.remote_per_minute:
+            return False
+        self._remote_calls.append(now)
+        return True
+
+    def _resolve_remote(self, ip_address: str, on_result):
+        import requests
+
+        location = {}
+        try:
+            response = requests.get(IP_API_URL.format(ip=ip_address), timeout=3)
+            data = response.json() if response.status_code == 200 else {}
+            if data.get("status") == "success":
+                location = {
+                    "country": data.get("country"),
+                    "state": data.get("regionName"),
+                    "city": data.get("city"),
+                    "latitude": data.get("lat"),
+                    "longitude": data.get("lon"),
+                    "isp": data.get("isp"),
+                }
+        except Exception as e:
+            logger.error(f"❌ Remote geolocation failed for {ip_address}: {e}")
+        finally:
+            with self._remote_lock:
+                self._inflight.discard(ip_address)
+
+        self.cache.set(ip_address, location)
+        if location:
+            try:
+                on_result(location)
+            except Exception as e:
+                logger.error(f"❌ Could not store remote geolocation for {ip_address}: {e}")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+            self._reader_checked = False
+
+
+def update_visit_location(visit_id: int, location: dict):
+    """Patch location columns on a visit that was stored before geo data arrived"""
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.query(models.Visit).filter(models.Visit.id == visit_id).update(location)
+        db.commit()
+    finally:
+        db.close()
+
+
+resolver = GeoResolver()
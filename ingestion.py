@@ -0,0 +1,679 @@
+"""
+Write-behind ingestion buffer for the tracking endpoints.
+
+Tracking handlers validate a beacon, hand the rows it produces to the buffer
+and acknowledge straight away. The buffer groups pending rows by table and a
+background thread writes them with one multi-row INSERT per table, inside a
+single transaction, whenever the batch size or the flush interval is reached.
+
+With an event log attached (see event_log.py) submitted work is appended to
+the log instead, and a log consumer feeds it into the stages; the consumer's
+position is written in the same transaction as the rows it covers.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Integer, Table, bindparam, case, column, func, insert, select, update, values
+from sqlalchemy.exc import DataError, IntegrityError
+
+from database import SessionLocal
+from hll import HLL_BUCKET_PRECISION, HLL_PRECISION, HyperLogLog
+import models
+import utils
+
+logger = logging.getLogger("app")
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "2.0"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "50000"))
+INGEST_UPDATE_CHUNK = 1000
+
+
+def _table_for(model) -> Table:
+    """Table for a mapped class, a Table or a table name"""
+    if isinstance(model, Table):
+        return model
+    if isinstance(model, str):
+        return models.Base.metadata.tables[model]
+    return model.__table__
+
+
+class RowStage:
+    """Pending INSERT rows grouped by table, in first-seen table order"""
+
+    def __init__(self):
+        self._rows = OrderedDict()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, model, row: dict):
+        self._rows.setdefault(_table_for(model), []).append(row)
+        self._size += 1
+
+    def drain(self):
+        rows, self._rows, self._size = self._rows, OrderedDict(), 0
+        return rows
+
+    def restore(self, rows):
+        # Put a failed batch back in front of anything queued since
+        for model, batch in reversed(list(rows.items())):
+            self._rows[model] = batch + self._rows.get(model, [])
+            self._rows.move_to_end(model, last=False)
+            self._size += len(batch)
+
+    def discard_oldest(self, count: int) -> int:
+        dropped = 0
+        for model in list(self._rows):
+            batch = self._rows[model]
+            take = min(count - dropped, len(batch))
+            del batch[:take]
+            dropped += take
+            if not batch:
+                del self._rows[model]
+            if dropped >= count:
+                break
+        self._size -= dropped
+        return dropped
+
+    def apply(self, session, rows):
+        for model, batch in rows.items():
+            # executemany needs a uniform key set per statement
+            by_keys = OrderedDict()
+            for row in batch:
+                by_keys.setdefault(tuple(sorted(row)), []).append(row)
+            for group in by_keys.values():
+                session.execute(insert(model), group)
+
+    def apply_each(self, session, rows) -> int:
+        """Row-at-a-time fallback that skips rows the database rejects"""
+        rejected = 0
+        for model, batch in rows.items():
+            for row in batch:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(model), [row])
+                except (IntegrityError, DataError) as e:
+                    rejected += 1
+                    logger.error(f"❌ Ingestion dropped invalid {model.name} row: {e.orig}")
+        return rejected
+
+
+class CounterStage:
+    """
+    Coalesced `column = column + n` increments keyed by primary key.
+
+    All deltas for a row within one flush window collapse into a single
+    entry, applied with one executemany UPDATE, so hot rows are written once
+    per flush instead of once per beacon and no increment is lost to a
+    read-modify-write race.
+    """
+
+    def __init__(self, model, *columns):
+        self.table = model.__table__
+        self.columns = columns
+        self._deltas = {}
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def add(self, row_id, **deltas):
+        current = self._deltas.setdefault(row_id, dict.fromkeys(self.columns, 0))
+        for column, amount in deltas.items():
+            current[column] += amount
+
+    def drain(self):
+        deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def restore(self, deltas):
+        for row_id, values in deltas.items():
+            self.add(row_id, **values)
+
+    def apply(self, session, deltas):
+        table = self.table
+        stmt = update(table).where(table.c.id == bindparam("_id")).values({
+            column: func.coalesce(table.c[column], 0) + bindparam(f"_{column}")
+            for column in self.columns
+        })
+        # Stable key order keeps concurrent flushers from deadlocking
+        session.execute(stmt, [
+            {"_id": row_id, **{f"_{column}": amount for column, amount in values.items()}}
+            for row_id, values in sorted(deltas.items())
+        ])
+
+
+class LatestValueStage:
+    """
+    Last-writer-wins `column = value` updates keyed by primary key.
+
+    Repeated updates to the same row inside a flush window overwrite each
+    other in memory; only the newest value is written. On Postgres a flush is
+    one `UPDATE ... FROM (VALUES ...)` per chunk, elsewhere an executemany.
+    """
+
+    def __init__(self, model, column_name: str):
+        self.table = model.__table__
+        self.column = column_name
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, row_id, value):
+        self._values[row_id] = value
+
+    def drain(self):
+        pending, self._values = self._values, {}
+        return pending
+
+    def restore(self, pending):
+        # Anything written since the failed flush is newer; keep it
+        for row_id, value in pending.items():
+            self._values.setdefault(row_id, value)
+
+    def apply(self, session, pending):
+        table = self.table
+        items = sorted(pending.items())
+        if session.get_bind().dialect.name == 'postgresql':
+            for start in range(0, len(items), INGEST_UPDATE_CHUNK):
+                incoming = values(
+                    column("id", Integer), column("value", table.c[self.column].type), name="incoming"
+                ).data(items[start:start + INGEST_UPDATE_CHUNK])
+                session.execute(
+                    update(table).where(table.c.id == incoming.c.id).values({self.column: incoming.c.value})
+                )
+        else:
+            stmt = update(table).where(table.c.id == bindparam("_id")).values({self.column: bindparam("_value")})
+            session.execute(stmt, [{"_id": row_id, "_value": value} for row_id, value in items])
+
+
+class EngagementStage(CounterStage):
+    """
+    Per-visit engagement: page view / event counters, last activity time,
+    the bounce flag and the exit page.
+
+    Counters coalesce like CounterStage; last activity keeps the newest time
+    seen and `exit_base_url` the base URL of the newest page view. The flush
+    is one executemany UPDATE that also recomputes `is_bounce` (exactly one
+    page view) from the incremented count, so the flag can never disagree
+    with the counter.
+    """
+
+    def __init__(self):
+        super().__init__(models.Visit, "page_views_count", "events_count")
+
+    def add(self, row_id, last_activity_at=None, exit_base_url=None, exit_viewed_at=None, **deltas):
+        super().add(row_id, **deltas)
+        current = self._deltas[row_id]
+        if last_activity_at is not None and (current.get("last_activity_at") is None or last_activity_at > current["last_activity_at"]):
+            current["last_activity_at"] = last_activity_at
+        exit_viewed_at = exit_viewed_at or last_activity_at
+        if exit_base_url is not None and (current.get("exit_viewed_at") is None or exit_viewed_at >= current["exit_viewed_at"]):
+            current["exit_base_url"] = exit_base_url
+            current["exit_viewed_at"] = exit_viewed_at
+
+    def apply(self, session, deltas):
+        table = self.table
+        last_activity = table.c.last_activity_at
+        at = bindparam("_last_activity_at", type_=last_activity.type)
+        page_views = func.coalesce(table.c.page_views_count, 0) + bindparam("_page_views_count")
+        stmt = update(table).where(table.c.id == bindparam("_id")).values({
+            "page_views_count": page_views,
+            "events_count": func.coalesce(table.c.events_count, 0) + bindparam("_events_count"),
+            "last_activity_at": case(
+                (last_activity.is_(None) | (last_activity < at), at),
+                else_=last_activity,
+            ),
+            "is_bounce": page_views == 1,
+            "exit_base_url": func.coalesce(bindparam("_exit_base_url", type_=table.c.exit_base_url.type), table.c.exit_base_url),
+        })
+        session.execute(stmt, [
+            {
+                "_id": row_id,
+                "_page_views_count": values["page_views_count"],
+                "_events_count": values["events_count"],
+                "_last_activity_at": values.get("last_activity_at"),
+                "_exit_base_url": values.get("exit_base_url"),
+            }
+            for row_id, values in sorted(deltas.items())
+        ])
+
+
+class UpsertStage:
+    """
+    Aggregate counter rows keyed by a natural key.
+
+    Deltas for the same key are summed in memory and flushed as
+    INSERT ... ON CONFLICT (key) DO UPDATE SET counter = counter + excluded,
+    so creating the row and incrementing it is a single atomic statement.
+    Other columns keep the first value seen for the key; `latest` columns
+    are overwritten with the newest value on every flush.
+    """
+
+    def __init__(self, model, key, counters, latest=()):
+        self.table = model.__table__
+        self.key = tuple(key)
+        self.counters = tuple(counters)
+        self.latest = tuple(latest)
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row: dict, **deltas):
+        key = tuple(row[column] for column in self.key)
+        current = self._rows.get(key)
+        if current is None:
+            current = self._rows[key] = dict(row, **dict.fromkeys(self.counters, 0))
+        else:
+            current.update({column: row[column] for column in self.latest if column in row})
+        for column, amount in deltas.items():
+            current[column] += amount
+
+    def drain(self):
+        rows, self._rows = self._rows, {}
+        return rows
+
+    def restore(self, rows):
+        for row in rows.values():
+            self.add(row, **{column: row[column] for column in self.counters})
+
+    def apply(self, session, rows):
+        table = self.table
+        stmt = utils.get_insert_for_dialect(table, session.get_bind().dialect.name)
+        set_ = {
+            column: func.coalesce(table.c[column], 0) + stmt.excluded[column]
+            for column in self.counters
+        }
+        set_.update({column: stmt.excluded[column] for column in self.latest})
+        stmt = stmt.on_conflict_do_update(index_elements=list(self.key), set_=set_)
+
+        # executemany needs a uniform key set per statement
+        columns = sorted({column for row in rows.values() for column in row})
+        session.execute(stmt, [
+            {column: row.get(column) for column in columns}
+            for _, row in sorted(rows.items(), key=lambda item: repr(item[0]))
+        ])
+
+
+class SketchStage:
+    """
+    HyperLogLog sketches keyed by a natural key (see hll.py).
+
+    Items for the same key are hashed into in-memory sketches; a flush
+    creates missing rows, locks the existing ones (SELECT ... FOR UPDATE on
+    Postgres) and writes back the register-wise maximum, so concurrent
+    workers never lose each other's registers.
+    """
+
+    def __init__(self, model, key, columns, precision: int = HLL_PRECISION):
+        self.table = model.__table__
+        self.key = tuple(key)
+        self.columns = tuple(columns)
+        self.precision = precision
+        self._sketches = {}
+
+    def __len__(self):
+        return len(self._sketches)
+
+    def add(self, row: dict, **items):
+        key = tuple(row[column] for column in self.key)
+        sketches = self._sketches.get(key)
+        if sketches is None:
+            sketches = self._sketches[key] = {column: HyperLogLog(self.precision) for column in self.columns}
+        for column, item in items.items():
+            if item is not None:
+                sketches[column].add(str(item))
+
+    def drain(self):
+        sketches, self._sketches = self._sketches, {}
+        return sketches
+
+    def restore(self, sketches):
+        for key, columns in sketches.items():
+            current = self._sketches.setdefault(key, columns)
+            if current is not columns:
+                for column, sketch in columns.items():
+                    current[column].merge(sketch)
+
+    def apply(self, session, sketches):
+        table = self.table
+        keys = sorted(sketches, key=repr)
+        stmt = utils.get_insert_for_dialect(table, session.get_bind().dialect.name)
+        session.execute(stmt.on_conflict_do_nothing(index_elements=list(self.key)), [
+            dict(zip(self.key, key)) for key in keys
+        ])
+        for key in keys:
+            match = [table.c[column] == value for column, value in zip(self.key, key)]
+            stored = session.execute(
+                select(*(table.c[column] for column in self.columns)).where(*match).with_for_update()
+            ).one()
+            session.execute(update(table).where(*match).values({
+                column: HyperLogLog.union([blob, sketches[key][column].to_bytes()], self.precision).to_bytes()
+                for column, blob in zip(self.columns, stored)
+            }))
+
+
+class CheckpointStage:
+    """Event log position, upserted in the same transaction as the work it covers"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._position = None
+
+    def __len__(self):
+        return 1 if self._position else 0
+
+    def add(self, position):
+        self._position = max(self._position or position, position)
+
+    def drain(self):
+        position, self._position = self._position, None
+        return position
+
+    def restore(self, position):
+        self.add(position)
+
+    def apply(self, session, position):
+        table = models.EventLogCheckpoint.__table__
+        stmt = utils.get_insert_for_dialect(table, session.get_bind().dialect.name).values(
+            name=self.name, segment=position[0], offset=position[1], updated_at=datetime.utcnow()
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"segment": stmt.excluded.segment, "offset": stmt.excluded.offset, "updated_at": stmt.excluded.updated_at}
+        ))
+
+
+class IngestionBuffer:
+    """
+    In-process write-behind queue.
+
+    Work is organised in stages; every stage is drained and applied in the
+    same transaction on each flush. A failed flush puts the drained work back
+    so nothing is lost while the database is unavailable.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: int = INGEST_BATCH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        max_pending: int = INGEST_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._stages = OrderedDict()
+        self.rows = self.register_stage("rows", RowStage())
+        self.log = None
+
+        self.stats = {
+            "queued": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+        }
+
+    def register_stage(self, name: str, stage):
+        self._stages[name] = stage
+        return stage
+
+    def attach_log(self, log):
+        """Route submitted work through a durable event log (see event_log.py)"""
+        self.log = log
+
+    def _logging(self) -> bool:
+        return self.log is not None and not getattr(self._local, "direct", False)
+
+    @contextmanager
+    def direct(self):
+        """
+        Feed submitted work straight into the stages on this thread and skip
+        journaling; the log consumer applies beacons it has read from the log
+        this way, and flushes them itself.
+        """
+        self._local.direct = True
+        try:
+            yield
+        finally:
+            self._local.direct = False
+
+    @contextmanager
+    def exclusive(self):
+        """Hold off other flushes (the flusher thread, inline flushes) for the block"""
+        with self._flush_lock:
+            yield
+
+    def submit(self, name: str, *args, **kwargs):
+        """Hand work to a stage; may trigger a flush when the buffer is full"""
+        if self._logging():
+            self.log.append({"stage": name, "args": args, "kwargs": kwargs})
+            return
+        self.enqueue(name, *args, **kwargs)
+
+    def enqueue(self, name: str, *args, **kwargs):
+        """Put work straight into a stage, bypassing the event log"""
+        with self._lock:
+            self._stages[name].add(*args, **kwargs)
+            self.stats["queued"] += 1
+            pending = self._pending_locked()
+
+        if getattr(self._local, "direct", False):
+            return
+        if pending >= self.max_pending:
+            # Caller pays for the flush instead of letting memory grow
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def add(self, model, row: dict):
+        """Queue one INSERT row for `model`"""
+        self.submit("rows", _table_for(model).name, row)
+
+    def journal(self, model, row: dict):
+        """Record a row the request wrote itself, so the log can replay it"""
+        if self._logging():
+            self.log.append({"table": _table_for(model).name, "row": row})
+
+    def journal_update(self, model, row_id, values: dict):
+        """Record an UPDATE the request made itself, so the log can replay it"""
+        if self._logging():
+            self.log.append({"table": _table_for(model).name, "id": row_id, "values": values})
+
+    async def wait_durable_async(self):
+        """Wait until everything submitted so far is on disk (no-op without a log)"""
+        if self.log is not None:
+            await self.log.wait_durable_async()
+
+    def discard(self) -> int:
+        """Drop everything queued; the log consumer reads it again after a failed apply"""
+        with self._lock:
+            count = self._pending_locked()
+            for stage in self._stages.values():
+                stage.drain()
+            return count
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending_locked()
+
+    def _pending_locked(self) -> int:
+        return sum(len(stage) for stage in self._stages.values())
+
+    def flush(self, session=None) -> int:
+        """
+        Write everything queued so far. Returns the number of items written.
+
+        With `session` the work is applied and committed in the caller's
+        transaction (the log consumer's, holding the beacons it applied) and
+        a failure is raised to the caller instead of being retried here.
+        """
+        with self._flush_lock:
+            with self._lock:
+                count = self._pending_locked()
+                drained = [
+                    (stage, stage.drain())
+                    for stage in self._stages.values()
+                    if len(stage)
+                ]
+
+            if not drained and session is None:
+                return 0
+
+            own_session = session is None
+            if own_session:
+                session = self.session_factory()
+            try:
+                try:
+                    with session.begin_nested():
+                        for stage, payload in drained:
+                            stage.apply(session, payload)
+                except (IntegrityError, DataError) as e:
+                    # One bad row must not wedge the whole queue
+                    logger.error(f"❌ Ingestion batch rejected, retrying stage by stage: {e.orig}")
+                    rejected = sum(self._apply_isolated(session, stage, payload) for stage, payload in drained)
+                    count -= rejected
+                    with self._lock:
+                        self.stats["dropped"] += rejected
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                with self._lock:
+                    self.stats["failed_flushes"] += 1
+                    if not own_session:
+                        raise
+                    logger.error(f"❌ Ingestion flush failed ({count} items kept for retry): {e}")
+                    for stage, payload in drained:
+                        stage.restore(payload)
+                    self._trim_locked()
+                return 0
+            finally:
+                if own_session:
+                    session.close()
+
+            with self._lock:
+                self.stats["flushed"] += count
+                self.stats["flushes"] += 1
+            return count
+
+    @staticmethod
+    def _apply_isolated(session, stage, payload) -> int:
+        """
+        Apply one stage's payload in a savepoint. If the database rejects it,
+        retry item by item (RowStage: row by row) and drop only the items it
+        rejects. Returns the number of dropped items.
+        """
+        try:
+            with session.begin_nested():
+                stage.apply(session, payload)
+            return 0
+        except (IntegrityError, DataError):
+            pass
+        if hasattr(stage, "apply_each"):
+            return stage.apply_each(session, payload)
+
+        # Keyed stages hold {key: pending work}; the checkpoint stage a single position
+        items = [{key: value} for key, value in payload.items()] if isinstance(payload, dict) else [payload]
+        rejected = 0
+        for item in items:
+            try:
+                with session.begin_nested():
+                    stage.apply(session, item)
+            except (IntegrityError, DataError) as e:
+                rejected += 1
+                logger.error(f"❌ Ingestion dropped invalid {type(stage).__name__} item {item!r:.200}: {e.orig}")
+        return rejected
+
+    def _trim_locked(self):
+        if "checkpoint" in self._stages:
+            # Work fed from the event log is covered by a queued checkpoint; dropping
+            # it would let that checkpoint skip it. The consumer stops reading instead.
+            return
+        overflow = self._pending_locked() - self.max_pending
+        if overflow > 0 and hasattr(self.rows, "discard_oldest"):
+            dropped = self.rows.discard_oldest(overflow)
+            self.stats["dropped"] += dropped
+            logger.error(f"❌ Ingestion buffer full, dropped {dropped} oldest rows")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="ingestion-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flusher thread and drain whatever is still queued"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        remaining = self.pending()
+        if remaining:
+            logger.error(f"❌ Ingestion buffer stopped with {remaining} unflushed items")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ingestion flusher error: {e}")
+
+
+buffer = IngestionBuffer()
+buffer.register_stage("page_views", CounterStage(models.Page, "total_views"))
+buffer.register_stage("time_spent", LatestValueStage(models.PageView, "time_spent"))
+buffer.register_stage("visit_engagement", EngagementStage())
+buffer.register_stage("exit_links", UpsertStage(
+    models.ExitLink,
+    key=("project_id", "url", "from_page"),
+    counters=("click_count",),
+    latest=("last_clicked",)
+))
+buffer.register_stage("traffic_sources", UpsertStage(
+    models.TrafficSource,
+    key=("project_id", "source_type", "source_name"),
+    counters=("visit_count",)
+))
+buffer.register_stage("daily_stats", UpsertStage(
+    models.DailyProjectStat,
+    key=("project_id", "stat_date"),
+    counters=("page_views", "visits", "unique_visitors", "new_visitors", "returning_visitors")
+))
+buffer.register_stage("daily_sketches", SketchStage(
+    models.DailyVisitorSketch,
+    key=("project_id", "stat_date"),
+    columns=("visitors", "new_visitors", "returning_visitors")
+))
+buffer.register_stage("time_buckets", UpsertStage(
+    models.ProjectTimeBucket,
+    key=("project_id", "bucket_start"),
+    counters=("page_views", "visits")
+))
+buffer.register_stage("bucket_sketches", SketchStage(
+    models.ProjectTimeBucket,
+    key=("project_id", "bucket_start"),
+    columns=("visitors", "new_visitors", "returning_visitors"),
+    precision=HLL_BUCKET_PRECISION
+))
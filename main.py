@@ -5,10 +5,16 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 from sqlalchemy.orm import Session
-from database import engine, get_db, Base
+from database import engine, async_engine, get_db, Base, SessionLocal
 from routers import projects, analytics, visitors, pages, traffic_sources, reports, auth, leads, chathistory, seo, team
 import models
 import os
+from contextlib import asynccontextmanager
+import admission
+import ingestion
+import event_log
+import geolocation
+import visit_index
 from logging_config import *
 
 logger = logging.getLogger("app")
@@ -88,6 +94,8 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
             
         response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
         response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
+        # Pagination cursor of /api/visitors/{id}/activity-view
+        response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
         
         return response
 
@@ -98,7 +106,35 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
 # ---------------------------------------------------
 
 
-app = FastAPI(title="State Counter Analytics API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_consumer = None
+    if event_log.EVENT_LOG_DIR:
+        # Beacons are acknowledged once they are in the on-disk log; the consumer does the database work
+        log = event_log.EventLog.claim(event_log.EVENT_LOG_DIR)
+        ingestion.buffer.attach_log(log)
+        log_consumer = event_log.LogConsumer(log, ingestion.buffer, beacons=analytics.logged_beacons)
+        log_consumer.start()
+    ingestion.buffer.start()
+    visit_index.index.start(SessionLocal)
+    yield
+    # Drain queued tracking rows before the worker exits
+    if log_consumer:
+        log_consumer.stop()
+    ingestion.buffer.stop()
+    if log_consumer:
+        log_consumer.log.close()
+    visit_index.index.stop()
+    geolocation.resolver.close()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+app = FastAPI(title="State Counter Analytics API", lifespan=lifespan)
+
+# Shed tracking beacons (429 + Retry-After) before they reach the threadpool or DB pool.
+# Added before the CORS middleware so rejections still carry CORS headers.
+app.add_middleware(admission.AdmissionMiddleware, controller=admission.controller)
 
 # Add Custom CORS middleware
 
@@ -195,6 +231,8 @@ app.include_router(team.router, prefix="/api/team", tags=["Team"])
 
 
 
+
+
 # ---------------------------------------------------
 
 # Root Routes
@@ -289,6 +327,12 @@ def health_check():
 
 
 
+@app.get("/metrics/admission")
+def admission_metrics():
+    """Tracking admission control: in-flight requests and shed counts by reason"""
+    return admission.controller.metrics()
+
+
 @app.get("/debug/email")
 
 def debug_email_config():
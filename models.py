@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Boolean, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Float, Boolean, Text, JSON, Index, LargeBinary, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
+from utils import classify_source
 
 
 
@@ -125,8 +126,18 @@ class Visit(Base):
     local_time_formatted = Column(String)
     timezone_offset = Column(String)
     referrer = Column(String)
+    # Classified once at ingest by utils.classify_source / utils.get_referrer_domain;
+    # every visit has a category, so filters compare it directly
+    source_category = Column(
+        String, nullable=False,
+        default=lambda context: classify_source(context.get_current_parameters().get("referrer"))
+    )
+    referrer_domain = Column(String)
     entry_page = Column(String)
     exit_page = Column(String)
+    # utils.normalize_page_url of the entry page and of the latest page view
+    entry_base_url = Column(String)
+    exit_base_url = Column(String)
     session_duration = Column(Integer)
     visited_at = Column(DateTime, default=datetime.utcnow, index=True)
     is_unique = Column(Boolean, default=True)
@@ -137,9 +148,28 @@ class Visit(Base):
     utm_medium = Column(String)
     utm_campaign = Column(String)
 
+    # Engagement, maintained incrementally by the tracking endpoints
+    page_views_count = Column(Integer, nullable=False, default=0, server_default="0")
+    events_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = Column(DateTime, default=datetime.utcnow)
+    is_bounce = Column(Boolean, nullable=False, default=False, server_default=false())
+
     project = relationship("Project", back_populates="visits")
     page_views = relationship("PageView", back_populates="visit")
 
+    __table_args__ = (
+        # Dashboard access paths: project + date range, per-visitor timelines, session lookups
+        Index("ix_visits_project_visited_at", "project_id", "visited_at", postgresql_include=["visitor_id"]),
+        Index("ix_visits_project_visitor", "project_id", "visitor_id", "visited_at"),
+        Index("ix_visits_project_session", "project_id", "session_id"),
+        Index("ix_visits_project_page_views_count", "project_id", "page_views_count"),
+        Index("ix_visits_project_is_bounce", "project_id", "is_bounce"),
+        Index("ix_visits_project_source_category", "project_id", "source_category", "visited_at"),
+        Index("ix_visits_project_referrer_domain", "project_id", "referrer_domain"),
+        Index("ix_visits_project_entry_base_url", "project_id", "entry_base_url", "visited_at"),
+        Index("ix_visits_project_exit_base_url", "project_id", "exit_base_url", "visited_at"),
+    )
+
 
 
 
@@ -151,6 +181,7 @@ class PageView(Base):
     visit_id = Column(Integer, ForeignKey("visits.id"))
     page_id = Column(Integer, ForeignKey("pages.id"))
     url = Column(String, nullable=False)
+    base_url = Column(String)  # utils.normalize_page_url(url), set at ingest
     title = Column(String)
     time_spent = Column(Integer)
     scroll_depth = Column(Float)
@@ -159,6 +190,11 @@ class PageView(Base):
     visit = relationship("Visit", back_populates="page_views")
     page = relationship("Page", back_populates="page_views")
 
+    __table_args__ = (
+        Index("ix_page_views_visit_viewed_at", "visit_id", "viewed_at"),
+        Index("ix_page_views_base_url_visit", "base_url", "visit_id"),
+    )
+
 
 
 
@@ -180,6 +216,11 @@ class Page(Base):
     project = relationship("Project", back_populates="pages")
     page_views = relationship("PageView", back_populates="page")
 
+    # One page row per URL, so concurrent get-or-create can rely on ON CONFLICT
+    __table_args__ = (
+        Index("uq_pages_project_url", "project_id", "url", unique=True),
+    )
+
 
 
 
@@ -200,6 +241,10 @@ class TrafficSource(Base):
     visit_count = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("uq_traffic_sources_project_source", "project_id", "source_type", "source_name", unique=True),
+    )
+
 
 
 
@@ -231,6 +276,10 @@ class ExitLink(Base):
     click_count = Column(Integer, default=1)
     last_clicked = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("uq_exit_link_project_url_from_page", "project_id", "url", "from_page", unique=True),
+    )
+
 
 
 
@@ -249,6 +298,10 @@ class ExitLinkClick(Base):
     from_page = Column(String)
     clicked_at = Column(DateTime, default=datetime.utcnow, index=True)
 
+    __table_args__ = (
+        Index("ix_exit_link_clicks_project_clicked_at", "project_id", "clicked_at"),
+    )
+
 
 
 
@@ -271,6 +324,10 @@ class CartAction(Base):
 
     visit = relationship("Visit")
 
+    __table_args__ = (
+        Index("ix_cart_actions_visit_action", "visit_id", "action"),
+    )
+
 
 
 
@@ -294,6 +351,10 @@ class Event(Base):
 
     visit = relationship("Visit")
 
+    __table_args__ = (
+        Index("ix_events_visit_event_type", "visit_id", "event_type"),
+    )
+
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -378,3 +439,90 @@ class UserProject(Base):
     __table_args__ = (
         {"sqlite_autoincrement": True}
     )
+
+
+class EventLogCheckpoint(Base):
+    """Position up to which an event log directory has been applied"""
+    __tablename__ = "event_log_checkpoints"
+
+    name = Column(String, primary_key=True)
+    segment = Column(Integer, nullable=False, default=0)
+    offset = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IngestRef(Base):
+    """
+    Stored id of a visit / page view accepted through the event log.
+
+    Tracking responses hand out the ref before the row exists; the log
+    consumer records the ref -> id mapping with the row, and later beacons
+    that use the ref are resolved through it.
+    """
+    __tablename__ = "ingest_refs"
+
+    ref = Column(String, primary_key=True)
+    row_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class Visitor(Base):
+    """One row per visitor and project, upserted by track_visit for every new session"""
+    __tablename__ = "visitors"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    visitor_id = Column(String, primary_key=True)
+    first_seen = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_seen = Column(DateTime, nullable=False, default=datetime.utcnow)
+    session_count = Column(Integer, nullable=False, default=1)
+    # Geo / device of the latest session
+    country = Column(String)
+    city = Column(String)
+    device = Column(String)
+    browser = Column(String)
+    os = Column(String)
+
+    __table_args__ = (
+        Index("ix_visitors_project_session_count", "project_id", "session_count"),
+    )
+
+
+class DailyProjectStat(Base):
+    """Per-project totals for one IST day, maintained at ingest (see rollups.py)"""
+    __tablename__ = "daily_project_stats"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    stat_date = Column(Date, primary_key=True)  # IST calendar date
+    page_views = Column(Integer, nullable=False, default=0)
+    visits = Column(Integer, nullable=False, default=0)
+    unique_visitors = Column(Integer, nullable=False, default=0)
+    new_visitors = Column(Integer, nullable=False, default=0)
+    returning_visitors = Column(Integer, nullable=False, default=0)
+
+
+class DailyVisitorSketch(Base):
+    """HyperLogLog sketches of the visitors seen on one IST day (see hll.py)"""
+    __tablename__ = "daily_visitor_sketches"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    stat_date = Column(Date, primary_key=True)  # IST calendar date
+    visitors = Column(LargeBinary)
+    new_visitors = Column(LargeBinary)
+    returning_visitors = Column(LargeBinary)
+
+
+class ProjectTimeBucket(Base):
+    """
+    Per-project traffic for one 30-minute UTC bucket (see rollups.py).
+
+    Half-hour buckets re-bucket exactly into IST (+05:30) hours.
+    """
+    __tablename__ = "project_time_buckets"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # UTC
+    page_views = Column(Integer, nullable=False, default=0)
+    visits = Column(Integer, nullable=False, default=0)
+    visitors = Column(LargeBinary)  # HLL sketches of visitors with a page view in the bucket
+    new_visitors = Column(LargeBinary)
+    returning_visitors = Column(LargeBinary)
@@ -0,0 +1,92 @@
+"""
+(project_id, url) -> page id resolution for the tracking path.
+
+Page rows are looked up through a bounded LRU cache. A miss does a single
+SELECT, and only if the page does not exist yet an INSERT ... ON CONFLICT
+DO NOTHING against the unique (project_id, url) index, so two requests
+creating the same page at once both end up with the same row.
+
+Newly created ids are cached only once the caller's transaction commits.
+
+The same module keeps the pageview id -> (visit id, project id) mapping used
+to authorise time-spent heartbeats without joining page_views to visits.
+"""
+import os
+from typing import Optional, Tuple
+
+from cache_utils import LRUCache, MISSING
+from ingestion import buffer as ingest_buffer
+import models
+import utils
+
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "100000"))
+PAGEVIEW_OWNER_CACHE_SIZE = int(os.getenv("PAGEVIEW_OWNER_CACHE_SIZE", "200000"))
+
+
+class PageRegistry:
+    def __init__(self, cache_size: int = PAGE_CACHE_SIZE):
+        self.cache = LRUCache(cache_size)
+
+    def resolve(self, db, project_id: int, url: str, title: Optional[str], after_commit: list) -> int:
+        key = (project_id, url)
+        page_id = self.cache.get(key)
+        if page_id is not MISSING:
+            return page_id
+
+        page_id = self._select(db, project_id, url)
+        if page_id is not None:
+            self.cache.set(key, page_id)
+            return page_id
+
+        stmt = utils.get_insert_for_dialect(models.Page, db.bind.dialect.name).values(
+            project_id=project_id,
+            url=url,
+            title=title,
+            total_views=0,
+            unique_views=0,
+            avg_time_spent=0.0,
+            bounce_rate=0.0
+        ).on_conflict_do_nothing(index_elements=["project_id", "url"])
+        db.execute(stmt)
+
+        page_id = self._select(db, project_id, url)
+        after_commit.append(lambda: self.cache.set(key, page_id))
+        after_commit.append(lambda: ingest_buffer.journal(models.Page, {
+            "id": page_id, "project_id": project_id, "url": url, "title": title,
+            "total_views": 0, "unique_views": 0, "avg_time_spent": 0.0, "bounce_rate": 0.0
+        }))
+        return page_id
+
+    @staticmethod
+    def _select(db, project_id: int, url: str) -> Optional[int]:
+        return db.query(models.Page.id).filter(
+            models.Page.project_id == project_id,
+            models.Page.url == url
+        ).scalar()
+
+
+class PageViewOwners:
+    def __init__(self, cache_size: int = PAGEVIEW_OWNER_CACHE_SIZE):
+        self.cache = LRUCache(cache_size)
+
+    def remember(self, pageview_id: int, visit_id: int, project_id: int):
+        self.cache.set(pageview_id, (visit_id, project_id))
+
+    def lookup(self, db, pageview_id: int) -> Optional[Tuple[int, int]]:
+        """(visit_id, project_id) owning the page view, or None if it does not exist"""
+        owner = self.cache.get(pageview_id)
+        if owner is not MISSING:
+            return owner
+
+        row = db.query(models.PageView.visit_id, models.Visit.project_id).join(
+            models.Visit, models.Visit.id == models.PageView.visit_id
+        ).filter(models.PageView.id == pageview_id).first()
+        if row is None:
+            return None
+        owner = (row.visit_id, row.project_id)
+        self.cache.set(pageview_id, owner)
+        return owner
+
+
+registry = PageRegistry()
+pageview_owners = PageViewOwners()
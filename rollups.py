@@ -0,0 +1,488 @@
+"""
+Daily per-project rollups for the dashboard summaries.
+
+`daily_project_stats` holds one row per (project_id, IST date) with page
+views, visits and unique / new / returning visitor counts. The tracking
+endpoints keep it current through the ingestion buffer ("daily_stats"
+stage), so the summary endpoints read O(days) rows instead of joining
+visits to page_views.
+
+Counting rules (shared by ingest and rebuild):
+
+- a visit and its page views count towards the IST date of the visit,
+- a visitor counts once per day as unique, on their first visit that day,
+  as new if that visit is their first ever (`is_unique`) and as returning
+  otherwise.
+
+Distinct visitors over arbitrary ranges come from HyperLogLog sketches
+(hll.py) stored per (project, IST day) in `daily_visitor_sketches`, updated
+at ingest and unioned at query time.
+
+Hourly charts read `project_time_buckets`: page views, visits and visitor
+sketches (by visit start) per project and 30-minute UTC bucket. Half-hour buckets re-bucket
+exactly into IST hours (`local_hour`), so a 90-day hourly chart reads about
+4,300 small rows instead of every page view.
+
+The `visitors` table (one row per project and visitor with first / last
+seen, session count and latest geo / device) is upserted by track_visit;
+`rebuild_visitors` recomputes it from visits.
+
+`visits.source_category` and `visits.referrer_domain` are set at ingest by
+utils.classify_source / utils.get_referrer_domain; `rebuild_visit_sources`
+reclassifies stored visits (once per distinct referrer), e.g. after the
+classification rules change. Likewise `rebuild_page_urls` recomputes the
+normalized base URLs (utils.normalize_page_url) of page views and of visit
+entry / exit pages.
+
+Rebuild history (or repair drift) with:
+
+    python rollups.py rebuild [--project ID] [--since YYYY-MM-DD]
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Column, MetaData, String, Table, case, func, insert, select, update
+
+from hll import HLL_BUCKET_PRECISION, HLL_PRECISION, HyperLogLog
+import models
+import utils
+
+IST_OFFSET = timedelta(hours=5, minutes=30)
+DAILY_COUNTERS = ("page_views", "visits", "unique_visitors", "new_visitors", "returning_visitors")
+SKETCH_COLUMNS = ("visitors", "new_visitors", "returning_visitors")
+BUCKET_MINUTES = 30
+
+
+def ist_date(visited_at: Optional[datetime]) -> date:
+    """IST calendar date of a naive UTC timestamp"""
+    return ((visited_at or datetime.utcnow()) + IST_OFFSET).date()
+
+
+def visit_deltas(db, visit: models.Visit) -> dict:
+    """Counter increments for a newly inserted visit"""
+    if visit.is_unique:
+        first_today = True
+    else:
+        day_start = datetime.combine(ist_date(visit.visited_at), datetime.min.time()) - IST_OFFSET
+        first_today = db.query(models.Visit.id).filter(
+            models.Visit.project_id == visit.project_id,
+            models.Visit.visitor_id == visit.visitor_id,
+            models.Visit.visited_at >= day_start,
+            models.Visit.id != visit.id
+        ).first() is None
+    return {
+        "visits": 1,
+        "unique_visitors": int(first_today),
+        "new_visitors": int(bool(visit.is_unique)),
+        "returning_visitors": int(first_today and not visit.is_unique),
+    }
+
+
+def daily_stats(db, project_id: int, start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """{IST date: DailyProjectStat} for a project, optionally limited to [start, end]"""
+    query = db.query(models.DailyProjectStat).filter(models.DailyProjectStat.project_id == project_id)
+    if start:
+        query = query.filter(models.DailyProjectStat.stat_date >= start)
+    if end:
+        query = query.filter(models.DailyProjectStat.stat_date <= end)
+    return {row.stat_date: row for row in query.order_by(models.DailyProjectStat.stat_date)}
+
+
+def bucket_start(ts: Optional[datetime]) -> datetime:
+    """30-minute UTC bucket of a naive UTC timestamp"""
+    ts = ts or datetime.utcnow()
+    return ts.replace(minute=ts.minute - ts.minute % BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def local_hour(bucket: datetime, offset: timedelta = IST_OFFSET) -> datetime:
+    """Local (IST by default) hour a UTC bucket falls into"""
+    return (bucket + offset).replace(minute=0, second=0, microsecond=0)
+
+
+def time_buckets(db, project_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None, sketches: bool = False):
+    """ProjectTimeBucket rows with start <= bucket_start < end, oldest first"""
+    bucket = models.ProjectTimeBucket
+    columns = [bucket.bucket_start, bucket.page_views, bucket.visits]
+    if sketches:
+        columns += [getattr(bucket, column) for column in SKETCH_COLUMNS]
+    query = db.query(*columns).filter(bucket.project_id == project_id)
+    if start is not None:
+        query = query.filter(bucket.bucket_start >= start)
+    if end is not None:
+        query = query.filter(bucket.bucket_start < end)
+    return query.order_by(bucket.bucket_start).all()
+
+
+def sketch_items(visit: models.Visit) -> dict:
+    """Sketch column -> item to add for a visit"""
+    return {
+        "visitors": visit.visitor_id,
+        "new_visitors": visit.visitor_id if visit.is_unique else None,
+        "returning_visitors": None if visit.is_unique else visit.visitor_id,
+    }
+
+
+def unique_visitors(db, project_ids, start=None, end=None, buckets: bool = False, column: str = "visitors") -> dict:
+    """
+    {project_id: estimated distinct visitors} for a range.
+
+    Daily sketches take an inclusive range of IST dates; with `buckets` the
+    30-minute time buckets are used and the range is UTC, start <= t < end.
+    Leave start / end out for an open range.
+    """
+    if buckets:
+        model, bucket, precision = models.ProjectTimeBucket, models.ProjectTimeBucket.bucket_start, HLL_BUCKET_PRECISION
+    else:
+        model, bucket, precision = models.DailyVisitorSketch, models.DailyVisitorSketch.stat_date, HLL_PRECISION
+    query = db.query(model.project_id, getattr(model, column)).filter(model.project_id.in_(list(project_ids)))
+    if start is not None:
+        query = query.filter(bucket >= start)
+    if end is not None:
+        query = query.filter(bucket < end if buckets else bucket <= end)
+
+    blobs = {}
+    for project_id, blob in query:
+        blobs.setdefault(project_id, []).append(blob)
+    return {
+        project_id: HyperLogLog.union(project_blobs, precision).count()
+        for project_id, project_blobs in blobs.items()
+    }
+
+
+def _as_date(value) -> date:
+    # SQLite returns the IST date expression as text
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild(db, project_id: Optional[int] = None, since: Optional[date] = None) -> int:
+    """
+    Recompute daily_project_stats from visits and page_views.
+
+    Replaces the rows for the selected project / days in one transaction.
+    Returns the number of rows written.
+    """
+    dialect = db.get_bind().dialect.name
+    visit_date = utils.get_ist_date_expr(models.Visit.visited_at, dialect)
+
+    filters = []
+    if project_id is not None:
+        filters.append(models.Visit.project_id == project_id)
+    if since is not None:
+        filters.append(models.Visit.visited_at >= datetime.combine(since, datetime.min.time()) - IST_OFFSET)
+
+    rows = {}
+    visit_counts = db.query(
+        models.Visit.project_id,
+        visit_date.label("stat_date"),
+        func.count(models.Visit.id),
+        func.count(func.distinct(models.Visit.visitor_id)),
+        func.count(func.distinct(case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None)))
+    ).filter(*filters).group_by(models.Visit.project_id, visit_date)
+    for pid, day, visits, unique, new in visit_counts:
+        rows[(pid, _as_date(day))] = {
+            "project_id": pid,
+            "stat_date": _as_date(day),
+            "page_views": 0,
+            "visits": visits,
+            "unique_visitors": unique,
+            "new_visitors": new or 0,
+            "returning_visitors": unique - (new or 0),
+        }
+
+    page_view_counts = db.query(
+        models.Visit.project_id,
+        visit_date.label("stat_date"),
+        func.count(models.PageView.id)
+    ).join(
+        models.PageView, models.Visit.id == models.PageView.visit_id
+    ).filter(*filters).group_by(models.Visit.project_id, visit_date)
+    for pid, day, page_views in page_view_counts:
+        key = (pid, _as_date(day))
+        if key in rows:
+            rows[key]["page_views"] = page_views
+
+    delete = db.query(models.DailyProjectStat)
+    if project_id is not None:
+        delete = delete.filter(models.DailyProjectStat.project_id == project_id)
+    if since is not None:
+        delete = delete.filter(models.DailyProjectStat.stat_date >= since)
+    delete.delete(synchronize_session=False)
+    if rows:
+        db.bulk_insert_mappings(models.DailyProjectStat, list(rows.values()))
+    db.commit()
+    return len(rows)
+
+
+def rebuild_sketches(db, project_id: Optional[int] = None, since: Optional[date] = None, chunk: int = 10000) -> int:
+    """
+    Recompute the daily visitor sketches from visits.
+
+    Visits are streamed in (project, time) order so only the current day is
+    held in memory. Returns the number of sketch rows written.
+    """
+    table = models.DailyVisitorSketch.__table__
+    filters = []
+    delete = table.delete()
+    if project_id is not None:
+        filters.append(models.Visit.project_id == project_id)
+        delete = delete.where(table.c.project_id == project_id)
+    if since is not None:
+        filters.append(models.Visit.visited_at >= datetime.combine(since, datetime.min.time()) - IST_OFFSET)
+        delete = delete.where(table.c.stat_date >= since)
+    db.execute(delete)
+
+    pending = []
+    current_key, sketches = None, None
+    written = 0
+
+    def emit():
+        nonlocal written
+        if current_key is None:
+            return
+        row = {"project_id": current_key[0], "stat_date": current_key[1]}
+        row.update({column: sketch.to_bytes() for column, sketch in sketches.items()})
+        pending.append(row)
+        written += 1
+        if len(pending) >= 1000:
+            db.execute(table.insert(), pending)
+            pending.clear()
+
+    visits = db.query(
+        models.Visit.project_id, models.Visit.visitor_id, models.Visit.visited_at, models.Visit.is_unique
+    ).filter(*filters).order_by(models.Visit.project_id, models.Visit.visited_at).yield_per(chunk)
+    for visit in visits:
+        key = (visit.project_id, ist_date(visit.visited_at))
+        if key != current_key:
+            emit()
+            current_key, sketches = key, {column: HyperLogLog() for column in SKETCH_COLUMNS}
+        for column, item in sketch_items(visit).items():
+            if item is not None:
+                sketches[column].add(str(item))
+    emit()
+    if pending:
+        db.execute(table.insert(), pending)
+    db.commit()
+    return written
+
+
+def rebuild_time_buckets(db, project_id: Optional[int] = None, since: Optional[date] = None, chunk: int = 10000) -> int:
+    """
+    Recompute project_time_buckets from visits and page_views.
+
+    Page views are tallied first; visits are then streamed in (project,
+    time) order, so only one bucket's visitor sketches are held in memory.
+    Returns the number of bucket rows written.
+    """
+    table = models.ProjectTimeBucket.__table__
+    start = datetime.combine(since, datetime.min.time()) - IST_OFFSET if since else None
+
+    delete = table.delete()
+    visit_filters, view_filters = [], []
+    if project_id is not None:
+        delete = delete.where(table.c.project_id == project_id)
+        visit_filters.append(models.Visit.project_id == project_id)
+        view_filters.append(models.Visit.project_id == project_id)
+    if start is not None:
+        delete = delete.where(table.c.bucket_start >= start)
+        visit_filters.append(models.Visit.visited_at >= start)
+        view_filters.append(models.PageView.viewed_at >= start)
+    db.execute(delete)
+
+    page_views = {}
+    views = db.query(models.Visit.project_id, models.PageView.viewed_at).join(
+        models.Visit, models.Visit.id == models.PageView.visit_id
+    ).filter(*view_filters).yield_per(chunk)
+    for pid, viewed_at in views:
+        key = (pid, bucket_start(viewed_at))
+        page_views[key] = page_views.get(key, 0) + 1
+
+    pending = []
+    written = 0
+
+    def emit(key, visits, sketches):
+        nonlocal written
+        row = {"project_id": key[0], "bucket_start": key[1], "page_views": page_views.pop(key, 0), "visits": visits}
+        row.update({column: sketch.to_bytes() if sketch else None for column, sketch in sketches.items()})
+        pending.append(row)
+        written += 1
+        if len(pending) >= 1000:
+            db.execute(table.insert(), pending)
+            pending.clear()
+
+    visits = db.query(
+        models.Visit.project_id, models.Visit.visited_at, models.Visit.visitor_id, models.Visit.is_unique
+    ).filter(*visit_filters).order_by(models.Visit.project_id, models.Visit.visited_at).yield_per(chunk)
+
+    current_key, visit_count, sketches = None, 0, None
+    for visit in visits:
+        key = (visit.project_id, bucket_start(visit.visited_at))
+        if key != current_key:
+            if current_key is not None:
+                emit(current_key, visit_count, sketches)
+            current_key, visit_count = key, 0
+            sketches = {column: HyperLogLog(HLL_BUCKET_PRECISION) for column in SKETCH_COLUMNS}
+        visit_count += 1
+        for column, item in sketch_items(visit).items():
+            if item is not None:
+                sketches[column].add(str(item))
+    if current_key is not None:
+        emit(current_key, visit_count, sketches)
+
+    # Buckets with page views but no visit starts
+    for key in list(page_views):
+        emit(key, 0, dict.fromkeys(SKETCH_COLUMNS))
+    if pending:
+        db.execute(table.insert(), pending)
+    db.commit()
+    return written
+
+
+def rebuild_visitors(db, project_id: Optional[int] = None) -> int:
+    """
+    Recompute the visitors table from visits (all-time, so --since does not apply).
+
+    Returns the number of visitor rows written.
+    """
+    visit = models.Visit
+    visitor = models.Visitor.__table__
+    filters = [visit.visitor_id.isnot(None)]
+    if project_id is not None:
+        filters.append(visit.project_id == project_id)
+
+    delete = db.query(models.Visitor)
+    if project_id is not None:
+        delete = delete.filter(models.Visitor.project_id == project_id)
+    delete.delete(synchronize_session=False)
+
+    written = db.execute(insert(visitor).from_select(
+        ["project_id", "visitor_id", "first_seen", "last_seen", "session_count"],
+        select(
+            visit.project_id, visit.visitor_id,
+            func.min(visit.visited_at), func.max(visit.visited_at), func.count(visit.id)
+        ).where(*filters).group_by(visit.project_id, visit.visitor_id)
+    )).rowcount
+
+    # Geo / device of each visitor's latest visit
+    def latest(column):
+        return select(column).where(
+            visit.project_id == visitor.c.project_id, visit.visitor_id == visitor.c.visitor_id
+        ).order_by(visit.visited_at.desc(), visit.id.desc()).limit(1).scalar_subquery()
+
+    stmt = update(visitor).values({column: latest(getattr(visit, column)) for column in ("country", "city", "device", "browser", "os")})
+    if project_id is not None:
+        stmt = stmt.where(visitor.c.project_id == project_id)
+    db.execute(stmt)
+    db.commit()
+    return written
+
+
+def _update_from_mapping(db, table, source: str, mapping: dict, where=(), chunk: int = 1000):
+    """
+    Set columns of every row of `table` from a per-value mapping of its `source`
+    column ({value: {target column: new value}}).
+
+    The mapping is loaded into a temporary table keyed by the value and applied
+    with one joined UPDATE ... FROM, so the cost is linear in the rows instead of
+    one full scan per distinct value (`source` columns are not indexed).
+    """
+    targets = list(next(iter(mapping.values()), {}))
+    if not targets:
+        return
+    temp = Table(
+        "rebuild_mapping", MetaData(),
+        Column("value", String, primary_key=True), *[Column(target, String) for target in targets],
+        prefixes=["TEMPORARY"],
+    )
+    conn = db.connection()
+    temp.create(conn)
+    try:
+        rows = [{"value": value, **columns} for value, columns in mapping.items()]
+        for offset in range(0, len(rows), chunk):
+            conn.execute(insert(temp), rows[offset:offset + chunk])
+        conn.execute(update(table).where(table.c[source] == temp.c.value, *where).values({t: temp.c[t] for t in targets}))
+    finally:
+        temp.drop(conn)
+
+
+def rebuild_visit_sources(db, project_id: Optional[int] = None, chunk: int = 1000) -> int:
+    """
+    Reclassify visits.source_category / referrer_domain with the ingest classifier.
+
+    Each distinct referrer is classified once in Python and the results are
+    applied with one joined UPDATE (see _update_from_mapping). Returns the
+    number of distinct referrers classified.
+    """
+    visits = models.Visit.__table__
+    scope = [visits.c.project_id == project_id] if project_id is not None else []
+
+    referrers = [r for (r,) in db.execute(select(visits.c.referrer).where(*scope, visits.c.referrer.isnot(None)).distinct())]
+    _update_from_mapping(db, visits, "referrer", {
+        r: {"source_category": utils.classify_source(r), "referrer_domain": utils.get_referrer_domain(r)}
+        for r in referrers
+    }, scope, chunk)
+    db.execute(update(visits).where(visits.c.referrer.is_(None), *scope).values(
+        source_category=utils.classify_source(None), referrer_domain=None
+    ))
+    db.commit()
+    return len(referrers)
+
+
+def rebuild_page_urls(db, project_id: Optional[int] = None, chunk: int = 1000) -> int:
+    """
+    Recompute page_views.base_url and visits.entry_base_url / exit_base_url.
+
+    Each distinct URL is normalized once in Python and applied with one joined
+    UPDATE (see _update_from_mapping); the exit page is the base URL of each
+    visit's latest page view. Returns the number of distinct URLs.
+    """
+    visits = models.Visit.__table__
+    page_views = models.PageView.__table__
+    scope = [visits.c.project_id == project_id] if project_id is not None else []
+    pageview_scope = [page_views.c.visit_id.in_(select(visits.c.id).where(*scope))] if scope else []
+
+    def normalize(table, source, target, where):
+        urls = [u for (u,) in db.execute(select(table.c[source]).where(*where, table.c[source].isnot(None)).distinct())]
+        _update_from_mapping(db, table, source, {u: {target: utils.normalize_page_url(u)} for u in urls}, where, chunk)
+        return len(urls)
+
+    normalized = normalize(page_views, "url", "base_url", pageview_scope)
+    normalized += normalize(visits, "entry_page", "entry_base_url", scope)
+
+    latest_page = select(page_views.c.base_url).where(page_views.c.visit_id == visits.c.id).order_by(
+        page_views.c.viewed_at.desc(), page_views.c.id.desc()
+    ).limit(1).scalar_subquery()
+    db.execute(update(visits).where(*scope).values(exit_base_url=latest_page))
+    db.commit()
+    return normalized
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard rollup tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_cmd = commands.add_parser("rebuild", help="recompute daily stats, visitor sketches, time buckets, visitors, visit sources and page base URLs from raw rows")
+    rebuild_cmd.add_argument("--project", type=int, help="only this project id")
+    rebuild_cmd.add_argument("--since", type=date.fromisoformat, help="only IST days on or after YYYY-MM-DD")
+
+    args = parser.parse_args()
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        written = rebuild(db, project_id=args.project, since=args.since)
+        sketches = rebuild_sketches(db, project_id=args.project, since=args.since)
+        buckets = rebuild_time_buckets(db, project_id=args.project, since=args.since)
+        visitors = rebuild_visitors(db, project_id=args.project)
+        referrers = rebuild_visit_sources(db, project_id=args.project)
+        urls = rebuild_page_urls(db, project_id=args.project)
+    finally:
+        db.close()
+    print(
+        f"Rebuilt {written} daily_project_stats rows, {sketches} visitor sketches, {buckets} time buckets, "
+        f"{visitors} visitors, sources for {referrers} referrers and base URLs for {urls} URLs"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,39 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, case
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, case, select
+from database import get_db, get_tracking_db
 import models, schemas
-from datetime import datetime, timedelta
+from datetime import date as date_type, datetime, timedelta
 from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import ValidationError
 import utils
-from utils import get_ist_start_of_day
-import re
+from utils import get_ist_start_of_day, classify_source, get_referrer_domain, normalize_page_url
+from ingestion import buffer as ingest_buffer, RowStage
+from geolocation import resolver as geo_resolver, update_visit_location
+from visit_index import index as visit_index
+from page_registry import registry as page_registry, pageview_owners
+from bot_filter import classifier as bot_classifier
+from cache_utils import LRUCache, MISSING
+from event_log import EVENT_LOG_REF_DAYS, EVENT_LOG_REF_WAIT
+import hll
+import rollups
 import pytz
+import re
 import time
+import uuid
 
 router = APIRouter()
 security = HTTPBearer(auto_error=False)  # Make authentication optional
 
-_BOT_UA_RE = re.compile(
-    r"(bot|spider|crawl|slurp|mediapartners-google|adsbot-google|googlebot|bingbot|bingpreview|msnbot|yandex|baidu|duckduckbot|ahrefs|semrush|mj12|dotbot|bytespider|facebookexternalhit|twitterbot|linkedinbot|whatsapp|telegram|discordbot|slackbot|curl|wget|python-requests|aiohttp|httpclient|libwww-perl|scrapy|selenium|puppeteer|playwright|headless|lighthouse|uptimerobot)",
-    re.IGNORECASE,
-)
-
-def _is_probable_bot_request(request: Request) -> bool:
-    # Allow all traffic - no bot protection
+def _is_probable_bot_request(request: Request, project_id: int) -> bool:
+    # Classified from headers and client IP only, before any query runs
+    reason = bot_classifier.classify(request.headers, get_client_ip(request))
+    if reason:
+        bot_classifier.record(project_id, reason)
+        return True
     return False
-  
-
-def _log_ignored(request: Request, reason: str) -> None:
-    try:
-        ip = getattr(getattr(request, "client", None), "host", None)
-        ua = (request.headers.get("user-agent") or "").strip()
-        path = getattr(getattr(request, "url", None), "path", "")
-        print(f"[Analytics] Ignored bot traffic ({reason}) ip={ip} path={path} ua={ua}")
-    except Exception:
-        pass
 
 def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
@@ -238,6 +239,100 @@ def get_current_user_optional(
 #     }
 
 
+def _summary_snapshot(db: Session, project_id: int, start_date, live_since: datetime, extras: bool = True) -> dict:
+    """
+    Everything the summary endpoints need, in one statement and one round trip.
+    
+    A UNION ALL of tagged rows: the project's daily rollup rows (the period
+    series, all-time series and visit totals are all cut from this one
+    read), the daily visitor sketches for the period, live visitors and,
+    with `extras`, top pages, top sources and devices.
+    """
+    from sqlalchemy import String, Integer, LargeBinary, cast, literal, null, union_all
+    
+    stats = models.DailyProjectStat.__table__
+    sketches = models.DailyVisitorSketch.__table__
+    visits = models.Visit.__table__
+    
+    def branch(kind, day=None, key=None, label=None, numbers=(), blob=None):
+        numbers = list(numbers) + [None] * (5 - len(numbers))
+        return [
+            literal(kind, String).label("kind"),
+            cast(day if day is not None else null(), String).label("day"),
+            cast(key if key is not None else null(), String).label("key"),
+            cast(label if label is not None else null(), String).label("label"),
+            *[cast(n if n is not None else null(), Integer).label(f"n{i}") for i, n in enumerate(numbers)],
+            cast(blob if blob is not None else null(), LargeBinary).label("blob"),
+        ]
+    
+    parts = [
+        select(*branch("daily", day=stats.c.stat_date, numbers=(
+            stats.c.page_views, stats.c.visits, stats.c.unique_visitors, stats.c.new_visitors, stats.c.returning_visitors
+        ))).where(stats.c.project_id == project_id),
+        select(*branch("sketch", blob=sketches.c.visitors)).where(
+            sketches.c.project_id == project_id, sketches.c.stat_date >= start_date
+        ),
+        select(*branch("live", numbers=(func.count(func.distinct(visits.c.visitor_id)),))).where(
+            visits.c.project_id == project_id, visits.c.visited_at >= live_since
+        ),
+    ]
+    if extras:
+        pages = models.Page.__table__
+        sources = models.TrafficSource.__table__
+        top_pages = select(pages.c.url, pages.c.title, pages.c.total_views).where(
+            pages.c.project_id == project_id
+        ).order_by(desc(pages.c.total_views)).limit(5).subquery()
+        source_count = func.sum(sources.c.visit_count)
+        top_sources = select(sources.c.source_name, source_count.label("count")).where(
+            sources.c.project_id == project_id
+        ).group_by(sources.c.source_name).order_by(desc(source_count)).limit(5).subquery()
+        parts += [
+            select(*branch("page", key=top_pages.c.url, label=top_pages.c.title, numbers=(top_pages.c.total_views,))),
+            select(*branch("source", key=top_sources.c.source_name, numbers=(top_sources.c["count"],))),
+            select(*branch("device", key=visits.c.device, numbers=(func.count(),))).where(
+                visits.c.project_id == project_id
+            ).group_by(visits.c.device),
+        ]
+    
+    snapshot = {"daily": {}, "sketches": [], "live": 0, "pages": [], "sources": [], "devices": {}}
+    for row in db.execute(union_all(*parts)):
+        if row.kind == "daily":
+            snapshot["daily"][date_type.fromisoformat(row.day[:10])] = row
+        elif row.kind == "sketch":
+            snapshot["sketches"].append(row.blob)
+        elif row.kind == "live":
+            snapshot["live"] = row.n0 or 0
+        elif row.kind == "page":
+            snapshot["pages"].append({"url": row.key, "title": row.label, "views": row.n0})
+        elif row.kind == "source":
+            snapshot["sources"].append({"source": row.key, "count": row.n0})
+        elif row.key:
+            snapshot["devices"][row.key] = row.n0
+    # Ties and NULL ordering differ between dialects once rows leave their subquery
+    snapshot["pages"].sort(key=lambda p: p["views"] or 0, reverse=True)
+    snapshot["sources"].sort(key=lambda s: s["count"] or 0, reverse=True)
+    return snapshot
+
+
+def _daily_series(daily: dict, days: int):
+    """Per-day stats for the last `days` IST days from the daily rollup rows, oldest first, plus total visits"""
+    daily_stats = []
+    total_visits = 0
+    for i in range(days - 1, -1, -1):
+        day_start_ist = get_ist_start_of_day(i)
+        row = daily.get(day_start_ist.date())
+        total_visits += row.n1 if row else 0
+        
+        daily_stats.append({
+            "date": day_start_ist.strftime("%a, %d %b %Y"),
+            "page_views": row.n0 if row else 0,
+            "unique_visits": row.n2 if row else 0,
+            "first_time_visits": row.n3 if row else 0,
+            "returning_visits": row.n4 if row else 0,
+        })
+    return daily_stats, total_visits
+
+
 @router.get("/{project_id}/summary")
 def get_summary(
     project_id: int,
@@ -259,133 +354,43 @@ def get_summary(
         raise HTTPException(status_code=403, detail="Access denied")
 
     # -----------------------------------
-    # 2. Date range calculation (IST → UTC)
+    # 2. Date range calculation (IST days)
     # -----------------------------------
     start_date_ist = get_ist_start_of_day(days - 1)
-    start_date_utc = start_date_ist.astimezone(pytz.UTC)
 
     # -----------------------------------
-    # 3. TOTAL VISITS (FILTERED BY DAYS) 
+    # 3. ONE ROUND TRIP: rollup rows, sketches, live visitors, top lists
     # -----------------------------------
-    total_visits = db.query(models.Visit).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).count()
+    five_min_ago = datetime.utcnow() - timedelta(minutes=5)
+    snapshot = _summary_snapshot(db, project_id, start_date_ist.date(), five_min_ago)
 
     # -----------------------------------
-    # 4. UNIQUE VISITORS (FILTERED BY DAYS) 
+    # 4. DAILY STATS + TOTAL VISITS (from the daily rollup)
     # -----------------------------------
-    unique_visitors = db.query(
-        func.count(func.distinct(models.Visit.visitor_id))
-    ).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).scalar()
+    daily_stats, total_visits = _daily_series(snapshot["daily"], days)
 
     # -----------------------------------
-    # 5. LIVE VISITORS (Last 5 minutes)
+    # 5. UNIQUE VISITORS (FILTERED BY DAYS, HLL estimate) + LIVE VISITORS
     # -----------------------------------
-    five_min_ago = datetime.utcnow() - timedelta(minutes=5)
-    live_visitors = db.query(
-        func.count(func.distinct(models.Visit.visitor_id))
-    ).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= five_min_ago
-    ).scalar()
+    unique_visitors = hll.HyperLogLog.union(snapshot["sketches"]).count()
+    live_visitors = snapshot["live"]
 
     # -----------------------------------
-    # 6. DAILY STATS (Period Based)
+    # 6. ALL TIME DAILY STATS (NO FILTER)
     # -----------------------------------
-    from sqlalchemy import case
-
-    dialect_name = db.bind.dialect.name
-    ist_date_expr = utils.get_ist_date_expr(
-        models.Visit.visited_at, dialect_name
-    )
-
-    daily_data = db.query(
-        ist_date_expr.label("visit_date"),
-        func.count(models.PageView.id).label("page_views"),
-        func.count(func.distinct(models.Visit.visitor_id)).label("unique_visits"),
-        func.count(func.distinct(
-            case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None)
-        )).label("first_time_visits"),
-        func.count(func.distinct(
-            case((models.Visit.is_unique == False, models.Visit.visitor_id), else_=None)
-        )).label("returning_visits")
-    ).join(
-        models.PageView, models.Visit.id == models.PageView.visit_id
-    ).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).group_by(ist_date_expr).all()
-
-    stats_dict = {
-        row.visit_date: {
-            "page_views": row.page_views,
-            "unique_visits": row.unique_visits,
-            "first_time_visits": row.first_time_visits or 0,
-            "returning_visits": row.returning_visits or 0,
+    all_daily_stats = [
+        {
+            "date": day.strftime("%a, %d %b %Y"),
+            "page_views": row.n0,
+            "unique_visits": row.n2,
+            "first_time_visits": row.n3,
+            "returning_visits": row.n4,
         }
-        for row in daily_data
-    }
-
-    daily_stats = []
-    for i in range(days - 1, -1, -1):
-        day_start_ist = get_ist_start_of_day(i)
-        day_date = day_start_ist.date()
-
-        stats = stats_dict.get(day_date) or stats_dict.get(
-            str(day_date),
-            {"page_views": 0, "unique_visits": 0, "first_time_visits": 0, "returning_visits": 0}
-        )
-
-        daily_stats.append({
-            "date": day_start_ist.strftime("%a, %d %b %Y"),
-            "page_views": stats["page_views"],
-            "unique_visits": stats["unique_visits"],
-            "first_time_visits": stats["first_time_visits"],
-            "returning_visits": stats["returning_visits"],
-        })
-
-    # -----------------------------------
-    # 7. ALL TIME DAILY STATS (NO FILTER)
-    # -----------------------------------
-    all_time_data = db.query(
-        ist_date_expr.label("visit_date"),
-        func.count(models.PageView.id).label("page_views"),
-        func.count(func.distinct(models.Visit.visitor_id)).label("unique_visits"),
-        func.count(func.distinct(
-            case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None)
-        )).label("first_time_visits"),
-        func.count(func.distinct(
-            case((models.Visit.is_unique == False, models.Visit.visitor_id), else_=None)
-        )).label("returning_visits")
-    ).join(
-        models.PageView, models.Visit.id == models.PageView.visit_id
-    ).filter(
-        models.Visit.project_id == project_id
-    ).group_by(ist_date_expr).order_by(ist_date_expr).all()
-
-    all_daily_stats = []
-    for row in all_time_data:
-        row_date = row.visit_date
-        if isinstance(row_date, str):
-            try:
-                row_date = datetime.strptime(row_date, "%Y-%m-%d").date()
-            except:
-                pass
-
-        all_daily_stats.append({
-            "date": row_date.strftime("%a, %d %b %Y") if hasattr(row_date, "strftime") else str(row_date),
-            "page_views": row.page_views,
-            "unique_visits": row.unique_visits,
-            "first_time_visits": row.first_time_visits or 0,
-            "returning_visits": row.returning_visits or 0,
-        })
+        for day, row in sorted(snapshot["daily"].items())
+    ]
 
     # -----------------------------------
-    # 8. AVERAGES (Period Based)
+    # 7. AVERAGES (Period Based)
     # -----------------------------------
     total_days = len(daily_stats) or 1
 
@@ -397,43 +402,19 @@ def get_summary(
     }
 
     # -----------------------------------
-    # 9. TOP PAGES / SOURCES / DEVICES
-    # -----------------------------------
-    top_pages = db.query(
-        models.Page.url,
-        models.Page.title,
-        models.Page.total_views
-    ).filter(
-        models.Page.project_id == project_id
-    ).order_by(desc(models.Page.total_views)).limit(5).all()
-
-    top_sources = db.query(
-        models.TrafficSource.source_name,
-        func.sum(models.TrafficSource.visit_count).label("count")
-    ).filter(
-        models.TrafficSource.project_id == project_id
-    ).group_by(models.TrafficSource.source_name).order_by(desc("count")).limit(5).all()
-
-    device_stats = db.query(
-        models.Visit.device,
-        func.count(models.Visit.id)
-    ).filter(
-        models.Visit.project_id == project_id
-    ).group_by(models.Visit.device).all()
-
-    # -----------------------------------
-    # 10. RESPONSE
+    # 8. RESPONSE
     # -----------------------------------
     return {
         "total_visits": total_visits,
         "unique_visitors": unique_visitors,
+        "unique_visitors_error": hll.error_bound(unique_visitors),
         "live_visitors": live_visitors,
         "daily_stats": daily_stats,
         "all_daily_stats": all_daily_stats,
         "averages": averages,
-        "top_pages": [{"url": p[0], "title": p[1], "views": p[2]} for p in top_pages],
-        "top_sources": [{"source": s[0], "count": s[1]} for s in top_sources],
-        "device_stats": {d[0]: d[1] for d in device_stats if d[0]},
+        "top_pages": snapshot["pages"],
+        "top_sources": snapshot["sources"],
+        "device_stats": snapshot["devices"],
     }
 
 
@@ -456,83 +437,17 @@ def get_summary_view(
     
     # IST calculation
     start_date_ist = get_ist_start_of_day(days - 1)
-    start_date_utc = start_date_ist.astimezone(pytz.UTC)
     
-    # Total visits (FILTERED BY DAYS)
-    total_visits = db.query(models.Visit).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).count()
-    
-    # Unique visitors (FILTERED BY DAYS)
-    unique_visitors = db.query(func.count(func.distinct(models.Visit.visitor_id))).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).scalar()
-    
-    # Live visitors (last 5 minutes)
+    # Rollup rows, visitor sketches and live visitors in one statement
     five_min_ago = datetime.utcnow() - timedelta(minutes=5)
-    live_visitors = db.query(func.count(func.distinct(models.Visit.visitor_id))).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= five_min_ago
-    ).scalar()
-    
-    # Daily stats
-    from sqlalchemy import case, cast, Date
+    snapshot = _summary_snapshot(db, project_id, start_date_ist.date(), five_min_ago, extras=False)
     
-    # IST calculation
-    start_date_ist = get_ist_start_of_day(days - 1)
-    start_date_utc = start_date_ist.astimezone(pytz.UTC)
-    print(start_date_utc)
-    
-    dialect_name = db.bind.dialect.name
-    ist_date_expr = utils.get_ist_date_expr(models.Visit.visited_at, dialect_name)
-    
-    # Single query to get all stats grouped by date - COUNTING ACTUAL PAGEVIEWS
-    daily_data = db.query(
-        ist_date_expr.label('visit_date'),
-        func.count(models.PageView.id).label('page_views'),
-        func.count(func.distinct(models.Visit.visitor_id)).label('unique_visits'),
-        func.count(func.distinct(case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None))).label('first_time_visits'),
-        func.count(func.distinct(
-            case(
-                (models.Visit.is_unique == False, models.Visit.visitor_id),
-                else_=None
-            )
-        )).label('returning_visits')
-    ).join(
-        models.PageView, models.Visit.id == models.PageView.visit_id
-    ).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).group_by(ist_date_expr).all()
-    
-    stats_dict = {
-        row.visit_date: {
-            'page_views': row.page_views,
-            'unique_visits': row.unique_visits,
-            'first_time_visits': row.first_time_visits or 0,
-            'returning_visits': row.returning_visits or 0
-        }
-        for row in daily_data
-    }
+    # Unique visitors (FILTERED BY DAYS) - union of the daily HLL sketches
+    unique_visitors = hll.HyperLogLog.union(snapshot["sketches"]).count()
+    live_visitors = snapshot["live"]
     
-    daily_stats = []
-    for i in range(days - 1, -1, -1):
-        day_start_ist = get_ist_start_of_day(i)
-        day_date = day_start_ist.date()
-        
-        stats = stats_dict.get(day_date)
-        if stats is None:
-            stats = stats_dict.get(str(day_date), {'page_views': 0, 'unique_visits': 0, 'first_time_visits': 0, 'returning_visits': 0})
-        
-        daily_stats.append({
-            "date": day_start_ist.strftime("%a, %d %b %Y"),
-            "page_views": stats['page_views'],
-            "unique_visits": stats['unique_visits'],
-            "first_time_visits": stats['first_time_visits'],
-            "returning_visits": stats['returning_visits']
-        })
+    # Daily stats and total visits come from the daily rollup
+    daily_stats, total_visits = _daily_series(snapshot["daily"], days)
     
     # Calculate averages
     total_days = len(daily_stats)
@@ -544,6 +459,7 @@ def get_summary_view(
     return {
         "total_visits": total_visits,
         "unique_visitors": unique_visitors,
+        "unique_visitors_error": hll.error_bound(unique_visitors),
         "live_visitors": live_visitors,
         "daily_stats": daily_stats,
         "averages": {
@@ -554,6 +470,37 @@ def get_summary_view(
         }
     }
 
+_EMPTY_HOUR = {"page_views": 0, "unique_visits": 0, "first_time_visits": 0, "returning_visits": 0}
+
+
+def _bucket_stats(rows) -> dict:
+    """Page views plus HLL-unioned visitor counts over time bucket rows"""
+    def distinct(column):
+        return hll.HyperLogLog.union((getattr(row, column) for row in rows), hll.HLL_BUCKET_PRECISION).count()
+    
+    return {
+        "page_views": sum(row.page_views for row in rows),
+        "unique_visits": distinct("visitors"),
+        "first_time_visits": distinct("new_visitors"),
+        "returning_visits": distinct("returning_visitors"),
+    }
+
+
+def _ist_hourly_stats(db: Session, project_id: int, start_utc: datetime, end_utc: datetime):
+    """
+    ({IST hour of day: stats}, range totals) for start_utc <= t < end_utc.
+    
+    Reads the project's 30-minute time buckets (two per hour per day) and
+    re-buckets them into IST hours; visitors are unioned, never summed, so a
+    visitor seen in several hours or days counts once.
+    """
+    rows = rollups.time_buckets(db, project_id, start=start_utc, end=end_utc, sketches=True)
+    by_hour = {}
+    for row in rows:
+        by_hour.setdefault(rollups.local_hour(row.bucket_start).hour, []).append(row)
+    return {hour: _bucket_stats(hour_rows) for hour, hour_rows in by_hour.items()}, _bucket_stats(rows)
+
+
 def get_hourly_analytics_range_logic(
     project_id: int, 
     start_date: str,
@@ -596,85 +543,36 @@ def get_hourly_analytics_range_logic(
     if not parsed_start_date or not parsed_end_date:
         raise HTTPException(status_code=400, detail="Invalid date format")
     
-    # Convert to IST timezone and get UTC ranges
-    ist = pytz.timezone('Asia/Kolkata')
-    start_datetime_ist = ist.localize(datetime.combine(parsed_start_date, datetime.min.time()))
-    end_datetime_ist = ist.localize(datetime.combine(parsed_end_date, datetime.max.time()))
-    
-    start_datetime_utc = start_datetime_ist.astimezone(pytz.UTC)
-    end_datetime_utc = end_datetime_ist.astimezone(pytz.UTC)
+    # IST day boundaries as naive UTC (end exclusive)
+    start_datetime_utc = datetime.combine(parsed_start_date, datetime.min.time()) - rollups.IST_OFFSET
+    end_datetime_utc = datetime.combine(parsed_end_date + timedelta(days=1), datetime.min.time()) - rollups.IST_OFFSET
     
     print(f" Getting hourly data for range {parsed_start_date} to {parsed_end_date} IST ({start_datetime_utc} to {end_datetime_utc})")
     
-    # Get hourly data for the date range - COUNTING ACTUAL PAGEVIEWS
-    hourly_data = db.query(
-        func.extract('hour', models.PageView.viewed_at).label('hour'),
-        func.count(models.PageView.id).label('page_views'),
-        func.count(func.distinct(models.Visit.visitor_id)).label('unique_visits'),
-        func.count(func.distinct(case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None))).label('first_time_visits'),
-        func.count(func.distinct(
-            case(
-                (models.Visit.is_unique == False, models.Visit.visitor_id),
-                else_=None
-            )
-        )).label('returning_visits')
-    ).join(
-        models.PageView, models.Visit.id == models.PageView.visit_id
-    ).filter(
-        models.Visit.project_id == project_id,
-        models.PageView.viewed_at >= start_datetime_utc,
-        models.PageView.viewed_at <= end_datetime_utc
-    ).group_by(
-        func.extract('hour', models.PageView.viewed_at)
-    ).all()
-    
-    print(f" Found {len(hourly_data)} hours with data for date range")
+    # Page views and visitor sketches per IST hour from the 30-minute time buckets
+    hours, totals = _ist_hourly_stats(db, project_id, start_datetime_utc, end_datetime_utc)
+    
+    print(f" Found {len(hours)} hours with data for date range")
     
     # Create hourly stats array for all 24 hours
     hourly_stats = []
     for hour in range(24):
-        hour_data = next((h for h in hourly_data if int(h.hour) == hour), None)
-        
-        if hour_data:
-            page_views = hour_data.page_views
-            unique_visits = hour_data.unique_visits
-            first_time_visits = hour_data.first_time_visits or 0
-            returning_visits = hour_data.returning_visits or 0
-        else:
-            page_views = 0
-            unique_visits = 0
-            first_time_visits = 0
-            returning_visits = 0
-        
+        stats = hours.get(hour, _EMPTY_HOUR)
         hourly_stats.append({
             "hour": f"{hour:02d}:00",
-            "page_views": page_views,
-            "unique_visits": unique_visits,
-            "first_time_visits": first_time_visits,
-            "returning_visits": returning_visits
+            "page_views": stats["page_views"],
+            "unique_visits": stats["unique_visits"],
+            "first_time_visits": stats["first_time_visits"],
+            "returning_visits": stats["returning_visits"]
         })
     
-    # Calculate totals correctly - avoid double counting visitors across hours
-    # For page_views: sum all hourly page_views (correct)
-    total_page_views = sum(h['page_views'] for h in hourly_stats)
-    
-    # For unique_visits and first_time_visits: use the original query results, not sum of hourly
-    # because same visitor can appear in multiple hours
-    total_unique_visits = sum(h.unique_visits for h in hourly_data)
-    total_first_time_visits = sum(h.first_time_visits or 0 for h in hourly_data)
-    total_returning_visits = sum(h.returning_visits or 0 for h in hourly_data)
-    
-    print(f" Hourly analytics for range calculated - Totals: {{'page_views': {total_page_views}, 'unique_visits': {total_unique_visits}, 'first_time_visits': {total_first_time_visits}, 'returning_visits': {total_returning_visits}}}")
+    print(f" Hourly analytics for range calculated - Totals: {totals}")
     
     return {
         "date_range": f"{decoded_start_date} to {decoded_end_date}",
         "hourly_stats": hourly_stats,
-        "totals": {
-            "page_views": total_page_views,
-            "unique_visits": total_unique_visits,
-            "first_time_visits": total_first_time_visits,
-            "returning_visits": total_returning_visits
-        }
+        "totals": totals,
+        "unique_visits_error": hll.error_bound(totals["unique_visits"], hll.HLL_BUCKET_PRECISION)
     }
 
 @router.get("/{project_id}/hourly-range")
@@ -870,69 +768,17 @@ def get_hourly_analytics(
             print(f"🚨 ERROR: Could not parse date '{decoded_date}' with any format!")
             raise HTTPException(status_code=400, detail=f"Invalid date format: {decoded_date}")
         
-        # Get start and end of the day in IST then convert to UTC for filtering
-        day_start_ist = datetime.combine(parsed_date, datetime.min.time())
-        day_end_ist = datetime.combine(parsed_date, datetime.max.time())
-        day_start_utc = utils.ist_to_utc(day_start_ist)
-        day_end_utc = utils.ist_to_utc(day_end_ist)
+        # IST day boundaries as naive UTC (end exclusive)
+        day_start_utc = datetime.combine(parsed_date, datetime.min.time()) - rollups.IST_OFFSET
+        day_end_utc = day_start_utc + timedelta(days=1)
         
         print(f" Getting hourly data for {parsed_date} IST ({day_start_utc} to {day_end_utc} UTC)")
         
-        # Query hourly data using SQL - COUNTING ACTUAL PAGEVIEWS
-        from sqlalchemy import extract, case
-        dialect_name = db.bind.dialect.name
-        ist_hour_expr = utils.get_ist_hour_expr(models.PageView.viewed_at, dialect_name)
+        # 48 time buckets re-bucketed into IST hours; day totals union the
+        # visitor sketches instead of summing hours
+        hours, totals = _ist_hourly_stats(db, project_id, day_start_utc, day_end_utc)
         
-        hourly_data = db.query(
-            ist_hour_expr.label('hour'),
-            func.count(models.PageView.id).label('page_views'),
-            func.count(func.distinct(models.Visit.visitor_id)).label('unique_visits'),
-            func.count(func.distinct(case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None))).label('first_time_visits'),
-            func.count(func.distinct(
-                case(
-                    (models.Visit.is_unique == False, models.Visit.visitor_id),
-                    else_=None
-                )
-            )).label('returning_visits')
-        ).join(
-            models.PageView, models.Visit.id == models.PageView.visit_id
-        ).filter(
-            models.Visit.project_id == project_id,
-            models.Visit.visited_at >= day_start_utc,
-            models.Visit.visited_at <= day_end_utc
-        ).group_by('hour').all()
-        
-        print(f" Found {len(hourly_data)} hours with data")
-        
-        # Get correct daily totals without double-counting - COUNTING ACTUAL PAGEVIEWS
-        daily_totals = db.query(
-            func.count(models.PageView.id).label('page_views'),
-            func.count(func.distinct(models.Visit.visitor_id)).label('unique_visits'),
-            func.count(func.distinct(case((models.Visit.is_unique == True, models.Visit.visitor_id), else_=None))).label('first_time_visits'),
-            func.count(func.distinct(
-                case(
-                    (models.Visit.is_unique == False, models.Visit.visitor_id),
-                    else_=None
-                )
-            )).label('returning_visits')
-        ).join(
-            models.PageView, models.Visit.id == models.PageView.visit_id
-        ).filter(
-            models.Visit.project_id == project_id,
-            models.Visit.visited_at >= day_start_utc,
-            models.Visit.visited_at <= day_end_utc
-        ).first()
-        
-        # Create a dict for quick lookup
-        hourly_dict = {
-            int(row.hour): {
-                'page_views': row.page_views,
-                'unique_visits': row.unique_visits,
-                'first_time_visits': row.first_time_visits or 0,
-                'returning_visits': row.returning_visits or 0
-            }
-            for row in hourly_data
-        }
+        print(f" Found {len(hours)} hours with data")
         
         # Build complete 24-hour array
         hourly_stats = []
@@ -940,7 +786,7 @@ def get_hourly_analytics(
             hour_str = f"{hour:02d}:00"
             time_range = f"{hour:02d}:00-{hour:02d}:59"
             
-            stats = hourly_dict.get(hour, {'page_views': 0, 'unique_visits': 0, 'first_time_visits': 0, 'returning_visits': 0})
+            stats = hours.get(hour, _EMPTY_HOUR)
             
             hourly_stats.append({
                 "date": hour_str,
@@ -951,23 +797,6 @@ def get_hourly_analytics(
                 "returning_visits": stats['returning_visits']
             })
         
-        # Calculate totals correctly - use daily totals to avoid double counting
-        # For page_views: sum all hourly page_views (correct)
-        total_page_views = sum(h['page_views'] for h in hourly_stats)
-        
-        # For unique_visits, first_time_visits, returning_visits: use daily totals
-        # because same visitor can appear in multiple hours
-        total_unique_visits = daily_totals.unique_visits or 0
-        total_first_time_visits = daily_totals.first_time_visits or 0
-        total_returning_visits = daily_totals.returning_visits or 0
-        
-        totals = {
-            'page_views': total_page_views,
-            'unique_visits': total_unique_visits,
-            'first_time_visits': total_first_time_visits,
-            'returning_visits': total_returning_visits
-        }
-        
         # Calculate averages
         averages = {
             'page_views': round(totals['page_views'] / 24, 1),
@@ -982,7 +811,8 @@ def get_hourly_analytics(
             "date": decoded_date,
             "hourly_stats": hourly_stats,
             "totals": totals,
-            "averages": averages
+            "averages": averages,
+            "unique_visits_error": hll.error_bound(totals["unique_visits"], hll.HLL_BUCKET_PRECISION)
         }
         
     except Exception as e:
@@ -1020,17 +850,19 @@ def test_location(ip_address: str):
             "success": False
         }
 
-@router.post("/{project_id}/pageview/{visit_id}")
-def track_pageview(project_id: int, visit_id: int, pageview: schemas.PageViewCreate, request: Request, db: Session = Depends(get_db)):
-    """Track a page view within a visit"""
+# ============================================
+# TRACKING (shared by the single-beacon endpoints and /batch)
+# ============================================
+#
+# The _record_* helpers do the work for one beacon inside the caller's
+# session without committing. Rows that nothing waits on go to `sink`
+# (the write-behind ingestion buffer by default); work that must only
+# happen once the transaction is committed goes to `after_commit`.
 
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "pageview")
-        return {
-            "message": "Ignored"
-        }
-    
-    # Verify visit exists
+MAX_BATCH_EVENTS = 100
+
+
+def _get_visit_or_404(db: Session, project_id: int, visit_id: int) -> models.Visit:
     visit = db.query(models.Visit).filter(
         models.Visit.id == visit_id,
         models.Visit.project_id == project_id
@@ -1038,123 +870,223 @@ def track_pageview(project_id: int, visit_id: int, pageview: schemas.PageViewCre
     
     if not visit:
         raise HTTPException(status_code=404, detail="Visit not found")
+    return visit
+
+
+def _record_visit(db: Session, project_id: int, visit: schemas.VisitCreate, ip_address: str, after_commit: list, now: Optional[datetime] = None) -> dict:
+    # Check if this session already exists (prevent duplicate tracking);
+    # answered from the in-memory visit index when possible
+    if visit.session_id:
+        existing_visit_id = visit_index.find_session(db, project_id, visit.session_id)
+        
+        if existing_visit_id:
+            # Session already tracked, don't create duplicate
+            return {
+                "visit_id": existing_visit_id, 
+                "message": "Session already tracked (deduplicated)",
+                "is_duplicate": True
+            }
     
-    # Get or create page record
-    page = db.query(models.Page).filter(
-        models.Page.project_id == project_id,
-        models.Page.url == pageview.url
-    ).first()
+    # Resolve location from the local GeoIP database (cached per IP, private IPs skipped)
+    location_data = geo_resolver.lookup(ip_address)
+    visited_at = now or datetime.utcnow()
     
-    if not page:
-        page = models.Page(
-            project_id=project_id,
-            url=pageview.url,
-            title=pageview.title,
-            total_views=0,
-            unique_views=0
-        )
-        db.add(page)
-        db.flush()
+    # Create visit record
+    db_visit = models.Visit(
+        project_id=project_id,
+        visited_at=visited_at,
+        visitor_id=visit.visitor_id,
+        session_id=visit.session_id,
+        ip_address=ip_address,
+        referrer=visit.referrer,
+        source_category=classify_source(visit.referrer),
+        referrer_domain=get_referrer_domain(visit.referrer),
+        entry_page=visit.entry_page,
+        entry_base_url=normalize_page_url(visit.entry_page),
+        device=visit.device,
+        browser=visit.browser,
+        os=visit.os,
+        screen_resolution=visit.screen_resolution,
+        language=visit.language,
+        timezone=visit.timezone,
+        local_time=visit.local_time,
+        local_time_formatted=visit.local_time_formatted,
+        timezone_offset=visit.timezone_offset,
+        utm_source=visit.utm_source,
+        utm_medium=visit.utm_medium,
+        utm_campaign=visit.utm_campaign,
+        **location_data
+    )
+    
+    # Unique visitor (first time ever) if this session created the visitor row
+    db_visit.is_unique = _upsert_visitor(db, project_id, db_visit) == 1
+    db_visit.is_new_session = True
+    
+    db.add(db_visit)
+    db.flush()
+    
+    visit_id = db_visit.id
+    visit_row = _row_of(db_visit)
+    after_commit.append(lambda: visit_index.remember(project_id, visit.session_id, visit_id))
+    after_commit.append(lambda: ingest_buffer.journal(models.Visit, visit_row))
+    
+    # Daily rollup for the summary endpoints
+    daily_key = {"project_id": project_id, "stat_date": rollups.ist_date(db_visit.visited_at)}
+    daily_deltas = rollups.visit_deltas(db, db_visit)
+    after_commit.append(lambda: ingest_buffer.submit("daily_stats", daily_key, **daily_deltas))
+    
+    # Distinct-visitor sketches, unioned at query time for any date range
+    sketch_items = rollups.sketch_items(db_visit)
+    bucket_key = {"project_id": project_id, "bucket_start": rollups.bucket_start(db_visit.visited_at)}
+    after_commit.append(lambda: ingest_buffer.submit("daily_sketches", daily_key, **sketch_items))
+    after_commit.append(lambda: ingest_buffer.submit("time_buckets", bucket_key, visits=1))
+    after_commit.append(lambda: ingest_buffer.submit("bucket_sketches", bucket_key, **sketch_items))
+    
+    # Optional ip-api.com fallback runs off the request path and patches the visit later
+    if geo_resolver.wants_remote(ip_address, location_data):
+        after_commit.append(lambda: geo_resolver.resolve_remote_async(
+            ip_address,
+            lambda location: update_visit_location(visit_id, location)
+        ))
+    
+    # Track traffic source (aggregated in memory, upserted by the ingestion buffer)
+    if visit.traffic_source and visit.traffic_name:
+        traffic_source = {
+            "project_id": project_id,
+            "source_type": visit.traffic_source,
+            "source_name": visit.traffic_name,
+            "referrer_url": visit.referrer if visit.referrer != 'direct' else None,
+            "utm_source": visit.utm_source,
+            "utm_medium": visit.utm_medium,
+            "utm_campaign": visit.utm_campaign,
+            "created_at": visited_at
+        }
+        after_commit.append(lambda: ingest_buffer.submit("traffic_sources", traffic_source, visit_count=1))
+    
+    return {
+        "visit_id": db_visit.id, 
+        "message": "Visit tracked",
+        "is_duplicate": False,
+        "is_unique_visitor": db_visit.is_unique
+    }
+
+
+def _upsert_visitor(db: Session, project_id: int, visit: models.Visit) -> int:
+    """Create or bump the visitor row for a new session; returns its session count"""
+    if not visit.visitor_id:
+        return 1
+    latest = {
+        "last_seen": visit.visited_at,
+        "country": visit.country,
+        "city": visit.city,
+        "device": visit.device,
+        "browser": visit.browser,
+        "os": visit.os,
+    }
+    table = models.Visitor.__table__
+    stmt = utils.get_insert_for_dialect(table, db.bind.dialect.name).values(
+        project_id=project_id, visitor_id=visit.visitor_id, first_seen=visit.visited_at, session_count=1, **latest
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["project_id", "visitor_id"],
+        set_={"session_count": table.c.session_count + 1, **{column: stmt.excluded[column] for column in latest}},
+    ).returning(table.c.session_count)
+    return db.execute(stmt).scalar_one()
+
+
+def _record_pageview(db: Session, project_id: int, visit_id: int, pageview: schemas.PageViewCreate, after_commit: list, now: Optional[datetime] = None) -> dict:
+    # Verify visit exists
+    visit = _get_visit_or_404(db, project_id, visit_id)
+    
+    # Resolve (or race-free create) the page record
+    page_id = page_registry.resolve(db, project_id, pageview.url, pageview.title, after_commit)
     
     # Create page view record
     db_pageview = models.PageView(
         visit_id=visit_id,
-        page_id=page.id,
+        page_id=page_id,
         url=pageview.url,
+        base_url=normalize_page_url(pageview.url),
         title=pageview.title,
         time_spent=pageview.time_spent,
-        scroll_depth=pageview.scroll_depth
+        scroll_depth=pageview.scroll_depth,
+        viewed_at=now or datetime.utcnow()
     )
     db.add(db_pageview)
+    db.flush()
     
-    # Update page stats
-    page.total_views += 1
+    pageview_id = db_pageview.id
+    pageview_row = _row_of(db_pageview)
+    after_commit.append(lambda: ingest_buffer.journal(models.PageView, pageview_row))
     
-    db.commit()
-    db.refresh(db_pageview)
+    # Update page stats (coalesced increment, applied by the ingestion buffer)
+    after_commit.append(lambda: ingest_buffer.submit("page_views", page_id, total_views=1))
+    after_commit.append(lambda: pageview_owners.remember(pageview_id, visit_id, project_id))
+    _record_pageview_rollups(project_id, visit, db_pageview.viewed_at, db_pageview.base_url, after_commit)
     
     return {
         "pageview_id": db_pageview.id,
         "message": "Page view tracked"
     }
 
-@router.put("/{project_id}/pageview/{visit_id}/update/{pageview_id}")
-def update_pageview_time(project_id: int, visit_id: int, pageview_id: int, data: dict, request: Request, db: Session = Depends(get_db)):
-    """Update time spent on a page view"""
 
+def _record_pageview_rollups(project_id: int, visit: models.Visit, viewed_at: datetime, base_url: Optional[str], after_commit: list) -> None:
+    # Visit engagement (incl. exit page), daily rollup (by the visit's IST date) and the 30-minute time bucket of the view;
+    # visitor sketches are counted once, in the bucket of the visit (see _record_visit)
+    visit_id = visit.id
+    after_commit.append(lambda: ingest_buffer.submit(
+        "visit_engagement", visit_id, page_views_count=1, last_activity_at=viewed_at, exit_base_url=base_url
+    ))
+    daily_key = {"project_id": project_id, "stat_date": rollups.ist_date(visit.visited_at)}
+    bucket_key = {"project_id": project_id, "bucket_start": rollups.bucket_start(viewed_at)}
+    after_commit.append(lambda: ingest_buffer.submit("daily_stats", daily_key, page_views=1))
+    after_commit.append(lambda: ingest_buffer.submit("time_buckets", bucket_key, page_views=1))
 
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "pageview_update")
-        return {
-            "message": "Ignored"
-        }
-    
-    # Find the page view
-    pageview = db.query(models.PageView).join(models.Visit).filter(
-        models.PageView.id == pageview_id,
-        models.Visit.id == visit_id,
-        models.Visit.project_id == project_id
-    ).first()
-    
-    if not pageview:
+
+def _record_pageview_time(db: Session, project_id: int, visit_id: int, pageview_id: int, data: dict, after_commit: list) -> dict:
+    # Check ownership against the cached pageview -> (visit, project) mapping
+    if pageview_owners.lookup(db, pageview_id) != (visit_id, project_id):
         raise HTTPException(status_code=404, detail="Page view not found")
     
-    # Update time spent
-    if 'time_spent' in data:
-        pageview.time_spent = data['time_spent']
-    
-    db.commit()
+    time_spent = data.get('time_spent')
+    if time_spent is not None:
+        try:
+            time_spent = int(time_spent)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="time_spent must be an integer")
+        
+        # Heartbeats are last-writer-wins; the ingestion buffer writes the newest value
+        after_commit.append(lambda: ingest_buffer.submit("time_spent", pageview_id, time_spent))
     
     return {
         "message": "Time spent updated",
-        "time_spent": pageview.time_spent
+        "time_spent": time_spent
     }
 
-@router.post("/{project_id}/exit/{visit_id}")
-def track_exit(project_id: int, visit_id: int, exit_data: dict, request: Request, db: Session = Depends(get_db)):
-    """Track exit page and final time spent"""
 
-
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "exit")
-        return {
-            "message": "Ignored"
-        }
-    
-    visit = db.query(models.Visit).filter(
-        models.Visit.id == visit_id,
-        models.Visit.project_id == project_id
-    ).first()
-    
-    if not visit:
-        raise HTTPException(status_code=404, detail="Visit not found")
+def _record_exit(db: Session, project_id: int, visit_id: int, exit_data: dict, after_commit: list, now: Optional[datetime] = None) -> dict:
+    visit = _get_visit_or_404(db, project_id, visit_id)
+    exited_at = now or datetime.utcnow()
     
     # Update exit page
     visit.exit_page = exit_data.get('exit_page')
     
     # Calculate total session duration
     if visit.visited_at:
-        session_duration = (datetime.utcnow() - visit.visited_at).total_seconds()
+        session_duration = (exited_at - visit.visited_at).total_seconds()
         visit.session_duration = int(session_duration)
     
-    db.commit()
+    changes = {"exit_page": visit.exit_page, "session_duration": visit.session_duration}
+    after_commit.append(lambda: ingest_buffer.journal_update(models.Visit, visit_id, changes))
+    after_commit.append(lambda: ingest_buffer.submit("visit_engagement", visit_id, last_activity_at=exited_at))
     
     return {
         "message": "Exit tracked",
         "session_duration": visit.session_duration
     }
 
-@router.post("/{project_id}/exit-link")
-def track_exit_link(project_id: int, link_data: dict, request: Request, db: Session = Depends(get_db)):
-    """Track external link clicks"""
 
-    
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "exit_link")
-        return {
-            "message": "Ignored"
-        }
-    
+def _record_exit_link(db: Session, project_id: int, link_data: dict, sink, after_commit: list, now: Optional[datetime] = None) -> dict:
     url = link_data.get('url')
     from_page = link_data.get('from_page')
     visitor_id = link_data.get('visitor_id')
@@ -1163,76 +1095,51 @@ def track_exit_link(project_id: int, link_data: dict, request: Request, db: Sess
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
     
-    # Track individual click
-    exit_click = models.ExitLinkClick(
-        project_id=project_id,
-        visitor_id=visitor_id,
-        session_id=session_id,
-        url=url,
-        from_page=from_page,
-        clicked_at=datetime.utcnow()
-    )
-    db.add(exit_click)
-    
-    # Update aggregated exit link stats
-    exit_link = db.query(models.ExitLink).filter(
-        models.ExitLink.project_id == project_id,
-        models.ExitLink.url == url,
-        models.ExitLink.from_page == from_page
-    ).first()
-    
-    if exit_link:
-        # Update existing exit link
-        exit_link.click_count += 1
-        exit_link.last_clicked = datetime.utcnow()
-    else:
-        # Create new exit link
-        exit_link = models.ExitLink(
-            project_id=project_id,
-            url=url,
-            from_page=from_page,
-            click_count=1,
-            last_clicked=datetime.utcnow()
-        )
-        db.add(exit_link)
+    clicked_at = now or datetime.utcnow()
     
-    db.commit()
+    # Track individual click (written behind by the ingestion buffer)
+    sink.add(models.ExitLinkClick, {
+        "project_id": project_id,
+        "visitor_id": visitor_id,
+        "session_id": session_id,
+        "url": url,
+        "from_page": from_page,
+        "clicked_at": clicked_at
+    })
+    
+    # Update aggregated exit link stats (upserted by the ingestion buffer);
+    # a missing from_page is stored as "" so it still matches the unique key
+    exit_link = {
+        "project_id": project_id,
+        "url": url,
+        "from_page": from_page or "",
+        "last_clicked": clicked_at
+    }
+    after_commit.append(lambda: ingest_buffer.submit("exit_links", exit_link, click_count=1))
     
     return {
         "message": "Exit link tracked",
         "url": url
     }
 
-@router.post("/{project_id}/cart-action/{visit_id}")
-def track_cart_action(project_id: int, visit_id: int, cart_action: schemas.CartActionCreate, request: Request, db: Session = Depends(get_db)):
-    """Track cart actions (add to cart / remove from cart)"""
 
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "cart_action")
-        return {
-            "message": "Ignored"
-        }
-    
+def _record_cart_action(db: Session, project_id: int, visit_id: int, cart_action: schemas.CartActionCreate, sink, after_commit: list, now: Optional[datetime] = None) -> dict:
     # Verify visit exists
-    visit = db.query(models.Visit).filter(
-        models.Visit.id == visit_id,
-        models.Visit.project_id == project_id
-    ).first()
-    
-    if not visit:
-        raise HTTPException(status_code=404, detail="Visit not found")
+    visit = _get_visit_or_404(db, project_id, visit_id)
     
-    # Create cart action record
-    db_cart_action = models.CartAction(
-        project_id=project_id,
-        visit_id=visit_id,
-        action=cart_action.action,
-        product_id=cart_action.product_id,
-        product_name=cart_action.product_name,
-        product_url=cart_action.product_url,
-        page_url=cart_action.page_url
-    )
-    db.add(db_cart_action)
+    now = now or datetime.utcnow()
+
+    # Create cart action record (written behind by the ingestion buffer)
+    sink.add(models.CartAction, {
+        "project_id": project_id,
+        "visit_id": visit_id,
+        "action": cart_action.action,
+        "product_id": cart_action.product_id,
+        "product_name": cart_action.product_name,
+        "product_url": cart_action.product_url,
+        "page_url": cart_action.page_url,
+        "created_at": now
+    })
     
     # Also create a page view for this cart action to show in analytics
     page_title = f"Cart Action: {cart_action.action}"
@@ -1244,46 +1151,180 @@ def track_cart_action(project_id: int, visit_id: int, cart_action: schemas.CartA
     if cart_action.product_id:
         virtual_page_url += f"-{cart_action.product_id}"
     
-    # Get or create page record for cart action
-    page = db.query(models.Page).filter(
-        models.Page.project_id == project_id,
-        models.Page.url == virtual_page_url
-    ).first()
-    
-    if not page:
-        page = models.Page(
-            project_id=project_id,
-            url=virtual_page_url,
-            title=page_title,
-            total_views=0,
-            unique_views=0
-        )
-        db.add(page)
-        db.flush()
+    # Resolve (or race-free create) the page record for cart action
+    page_id = page_registry.resolve(db, project_id, virtual_page_url, page_title, after_commit)
     
     # Create page view for cart action
-    db_pageview = models.PageView(
-        visit_id=visit_id,
-        page_id=page.id,
-        url=virtual_page_url,
-        title=page_title,
-        time_spent=0,
-        scroll_depth=0
-    )
-    db.add(db_pageview)
-    
-    # Update page stats
-    page.total_views += 1
-    
-    db.commit()
-    db.refresh(db_cart_action)
+    sink.add(models.PageView, {
+        "visit_id": visit_id,
+        "page_id": page_id,
+        "url": virtual_page_url,
+        "base_url": normalize_page_url(virtual_page_url),
+        "title": page_title,
+        "time_spent": 0,
+        "scroll_depth": 0,
+        "viewed_at": now
+    })
+    
+    # Update page stats (coalesced increment, applied by the ingestion buffer)
+    after_commit.append(lambda: ingest_buffer.submit("page_views", page_id, total_views=1))
+    _record_pageview_rollups(project_id, visit, now, normalize_page_url(virtual_page_url), after_commit)
     
     return {
-        "cart_action_id": db_cart_action.id,
         "message": "Cart action tracked",
+        "queued": True,
         "virtual_page_url": virtual_page_url
     }
 
+
+def _record_event(db: Session, project_id: int, visit_id: int, event_data: dict, sink, after_commit: list, now: Optional[datetime] = None) -> dict:
+    # Verify visit exists
+    _get_visit_or_404(db, project_id, visit_id)
+    
+    if not event_data.get("event_type"):
+        raise HTTPException(status_code=400, detail="event_type is required")
+    
+    # Create event record (written behind by the ingestion buffer)
+    sink.add(models.Event, {
+        "visit_id": visit_id,
+        "event_type": event_data.get("event_type"),
+        "event_data": event_data.get("event_data"),
+        "url": event_data.get("url"),
+        "timestamp": datetime.fromtimestamp(
+            event_data.get("timestamp", int(time.time() * 1000)) / 1000,
+            tz=pytz.UTC
+        )
+    })
+    
+    # Engagement counters on the visit (coalesced by the ingestion buffer)
+    received_at = now or datetime.utcnow()
+    after_commit.append(lambda: ingest_buffer.submit("visit_engagement", visit_id, events_count=1, last_activity_at=received_at))
+    
+    return {"status": "success", "queued": True}
+
+
+def _run_after_commit(callbacks: list) -> None:
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"[Analytics] ✗ Post-commit hook failed: {str(e)}")
+
+
+async def _acknowledge(after_commit: list) -> None:
+    # Run post-commit hooks, then wait until the event log (if enabled) has them on disk
+    _run_after_commit(after_commit)
+    await ingest_buffer.wait_durable_async()
+
+
+def _row_of(obj) -> dict:
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+@router.post("/{project_id}/pageview/{visit_id}")
+async def track_pageview(project_id: int, visit_id: schemas.TrackingId, pageview: schemas.PageViewCreate, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """Track a page view within a visit"""
+
+    if _is_probable_bot_request(request, project_id):
+        return {
+            "message": "Ignored"
+        }
+    
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="pageview", visit_id=visit_id, data=pageview.model_dump())
+        result = await _log_single(project_id, entry, get_client_ip(request))
+        return {"pageview_id": result["pageview_id"], "message": "Page view queued", "queued": True}
+    
+    after_commit = []
+    result = await db.run_sync(_record_pageview, project_id, _stored_id(visit_id), pageview, after_commit)
+    await db.commit()
+    await _acknowledge(after_commit)
+    return result
+
+@router.put("/{project_id}/pageview/{visit_id}/update/{pageview_id}")
+async def update_pageview_time(project_id: int, visit_id: schemas.TrackingId, pageview_id: schemas.TrackingId, data: dict, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """Update time spent on a page view"""
+
+
+    if _is_probable_bot_request(request, project_id):
+        return {
+            "message": "Ignored"
+        }
+    
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="pageview_update", visit_id=visit_id, pageview_id=pageview_id, data=data)
+        await _log_single(project_id, entry, get_client_ip(request))
+        return {"message": "Time spent queued", "time_spent": data.get("time_spent"), "queued": True}
+    
+    if not isinstance(pageview_id, int):
+        raise HTTPException(status_code=404, detail="Page view not found")
+    after_commit = []
+    result = await db.run_sync(_record_pageview_time, project_id, visit_id, pageview_id, data, after_commit)
+    await _acknowledge(after_commit)
+    return result
+
+@router.post("/{project_id}/exit/{visit_id}")
+async def track_exit(project_id: int, visit_id: schemas.TrackingId, exit_data: dict, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """Track exit page and final time spent"""
+
+
+    if _is_probable_bot_request(request, project_id):
+        return {
+            "message": "Ignored"
+        }
+    
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="exit", visit_id=visit_id, data=exit_data)
+        await _log_single(project_id, entry, get_client_ip(request))
+        return {"message": "Exit queued", "queued": True}
+    
+    after_commit = []
+    result = await db.run_sync(_record_exit, project_id, _stored_id(visit_id), exit_data, after_commit)
+    await db.commit()
+    await _acknowledge(after_commit)
+    return result
+
+@router.post("/{project_id}/exit-link")
+async def track_exit_link(project_id: int, link_data: dict, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """Track external link clicks"""
+
+    
+    if _is_probable_bot_request(request, project_id):
+        return {
+            "message": "Ignored"
+        }
+    
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="exit_link", data=link_data)
+        await _log_single(project_id, entry, get_client_ip(request))
+        return {"message": "Exit link queued", "url": link_data.get("url"), "queued": True}
+    
+    after_commit = []
+    result = await db.run_sync(_record_exit_link, project_id, link_data, ingest_buffer, after_commit)
+    await db.commit()
+    await _acknowledge(after_commit)
+    return result
+
+@router.post("/{project_id}/cart-action/{visit_id}")
+async def track_cart_action(project_id: int, visit_id: schemas.TrackingId, cart_action: schemas.CartActionCreate, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """Track cart actions (add to cart / remove from cart)"""
+
+    if _is_probable_bot_request(request, project_id):
+        return {
+            "message": "Ignored"
+        }
+    
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="cart_action", visit_id=visit_id, data=cart_action.model_dump())
+        await _log_single(project_id, entry, get_client_ip(request))
+        return {"message": "Cart action queued", "queued": True}
+    
+    after_commit = []
+    result = await db.run_sync(_record_cart_action, project_id, _stored_id(visit_id), cart_action, ingest_buffer, after_commit)
+    await db.commit()
+    await _acknowledge(after_commit)
+    return result
+
 def get_client_ip(request: Request) -> str:
     """Extract real client IP from request, checking proxy headers first"""
     # Check proxy headers in order of preference
@@ -1301,50 +1342,29 @@ def get_client_ip(request: Request) -> str:
         return cf_connecting_ip.strip()
     
     # Fallback to direct connection IP
-    return request.client.host
+    return request.client.host if request.client else None
 
 @router.post("/{project_id}/event/{visit_id}")
-def track_custom_event(project_id: int, visit_id: int, event_data: dict, request: Request, db: Session = Depends(get_db)):
+async def track_custom_event(project_id: int, visit_id: schemas.TrackingId, event_data: dict, request: Request, db: AsyncSession = Depends(get_tracking_db)):
     """Track custom events (product view, add to cart, etc.)"""
     
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "event")
+    if _is_probable_bot_request(request, project_id):
         return {"status": "ignored", "reason": "bot"}
     
-    # Verify visit exists
-    visit = db.query(models.Visit).filter(
-        models.Visit.id == visit_id,
-        models.Visit.project_id == project_id
-    ).first()
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="event", visit_id=visit_id, data=event_data)
+        await _log_single(project_id, entry, get_client_ip(request))
+        return {"status": "success", "queued": True}
     
-    if not visit:
-        raise HTTPException(status_code=404, detail="Visit not found")
-    
-    # Create event record
-    event = models.Event(
-        visit_id=visit_id,
-        event_type=event_data.get("event_type"),
-        event_data=event_data.get("event_data"),
-        url=event_data.get("url"),
-        timestamp = datetime.fromtimestamp(
-    event_data.get("timestamp", int(time.time() * 1000)) / 1000,
-    tz=pytz.UTC
-)
-    )
-    
-    db.add(event)
-    db.commit()
-    db.refresh(event)
-    
-    return {"status": "success", "event_id": event.id}
+    after_commit = []
+    result = await db.run_sync(_record_event, project_id, _stored_id(visit_id), event_data, ingest_buffer, after_commit)
+    await _acknowledge(after_commit)
+    return result
 
 @router.post("/{project_id}/track")
-def track_visit(project_id: int, visit: schemas.VisitCreate, request: Request, db: Session = Depends(get_db)):
-    import requests
-
+async def track_visit(project_id: int, visit: schemas.VisitCreate, request: Request, db: AsyncSession = Depends(get_tracking_db)):
 
-    if _is_probable_bot_request(request):
-        _log_ignored(request, "track")
+    if _is_probable_bot_request(request, project_id):
         return {
             "visit_id": None,
             "message": "Ignored",
@@ -1352,139 +1372,363 @@ def track_visit(project_id: int, visit: schemas.VisitCreate, request: Request, d
             "is_unique_visitor": False
         }
   
+    if ingest_buffer.log is not None:
+        entry = schemas.BatchEvent(type="visit", data=visit.model_dump())
+        result = await _log_single(project_id, entry, visit.ip_address or get_client_ip(request))
+        return {"visit_id": result["visit_id"], "message": "Visit queued", "queued": True}
+    
     # Check if project exists
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
+    project_exists = await db.scalar(select(models.Project.id).where(models.Project.id == project_id))
+    if not project_exists:
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Get IP address - prioritize frontend provided IP, then extract from headers
     ip_address = visit.ip_address or get_client_ip(request)
     
-    # Skip location lookup for localhost/private IPs
-    is_local = ip_address in ['127.0.0.1', 'localhost', '::1'] or ip_address.startswith('192.168.') or ip_address.startswith('10.')
-    
-    # Fetch location data from IP
-    location_data = {}
-    if not is_local:
+    after_commit = []
+    result = await db.run_sync(_record_visit, project_id, visit, ip_address, after_commit)
+    await db.commit()
+    await _acknowledge(after_commit)
+    return result
+
+def _journal_rows(drained) -> None:
+    for table, batch in drained.items():
+        for row in batch:
+            ingest_buffer.journal(table, row)
+
+
+def _process_batch(db: Session, project_id: int, events: list, ip_address: str) -> dict:
+    ids = {}
+    results = []
+    rows = RowStage()
+    after_commit = []
+
+    def resolve(ref):
+        if isinstance(ref, str):
+            if ref not in ids:
+                raise HTTPException(status_code=400, detail=f"Unknown temp id: {ref}")
+            return ids[ref]
+        if ref is None:
+            raise HTTPException(status_code=400, detail="Missing id reference")
+        return ref
+
+    for entry in events:
+        hooks_before = len(after_commit)
         try:
-            # Using ip-api.com (free, no API key needed)
-            # Limit: 45 requests per minute
-            response = requests.get(
-                f"http://ip-api.com/json/{ip_address}?fields=status,message,country,regionName,city,lat,lon,isp,query", 
-                timeout=3
-            )
-            
-            print(f"[Location API] IP: {ip_address}, Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"[Location API] Response: {data}")
-                
-                if data.get('status') == 'success':
-                    location_data = {
-                        'country': data.get('country'),
-                        'state': data.get('regionName'),
-                        'city': data.get('city'),
-                        'latitude': data.get('lat'),
-                        'longitude': data.get('lon'),
-                        'isp': data.get('isp')
-                    }
-                    print(f"[Location API] ✓ Success: {location_data}")
+            with db.begin_nested():
+                if entry.type == "visit":
+                    visit = schemas.VisitCreate(**entry.data)
+                    result = _record_visit(db, project_id, visit, visit.ip_address or ip_address, after_commit)
+                    created_id = result["visit_id"]
+                elif entry.type == "pageview":
+                    pageview = schemas.PageViewCreate(**entry.data)
+                    result = _record_pageview(db, project_id, resolve(entry.visit_id), pageview, after_commit)
+                    created_id = result["pageview_id"]
+                elif entry.type == "pageview_update":
+                    result = _record_pageview_time(db, project_id, resolve(entry.visit_id), resolve(entry.pageview_id), entry.data, after_commit)
+                    created_id = None
+                elif entry.type == "exit":
+                    result = _record_exit(db, project_id, resolve(entry.visit_id), entry.data, after_commit)
+                    created_id = None
+                elif entry.type == "exit_link":
+                    result = _record_exit_link(db, project_id, entry.data, rows, after_commit)
+                    created_id = None
+                elif entry.type == "cart_action":
+                    cart_action = schemas.CartActionCreate(**entry.data)
+                    result = _record_cart_action(db, project_id, resolve(entry.visit_id), cart_action, rows, after_commit)
+                    created_id = None
                 else:
-                    print(f"[Location API] ✗ Failed: {data.get('message', 'Unknown error')}")
+                    result = _record_event(db, project_id, resolve(entry.visit_id), entry.data, rows, after_commit)
+                    created_id = None
+        except HTTPException as e:
+            del after_commit[hooks_before:]
+            results.append({"type": entry.type, "status": "error", "detail": e.detail})
+            continue
+        except ValidationError as e:
+            del after_commit[hooks_before:]
+            results.append({"type": entry.type, "status": "error", "detail": e.errors(include_url=False)})
+            continue
+
+        if entry.temp_id and created_id is not None:
+            ids[entry.temp_id] = created_id
+        results.append({"type": entry.type, **result, "status": "ok"})
+    
+    drained = rows.drain()
+    rows.apply(db, drained)
+    after_commit.append(lambda: _journal_rows(drained))
+    return {"ids": ids, "results": results, "after_commit": after_commit}
+
+
+# ============================================
+# LOG-FIRST TRACKING (EVENT_LOG_DIR set, see event_log.py)
+# ============================================
+#
+# The endpoints validate a beacon, append it to the event log as it arrived
+# and acknowledge once it is fsynced; they never touch the database. New
+# visits and page views get a ref instead of an id. LoggedBeacons, run by the
+# log consumer, does the database work with the same _record_* helpers.
+
+_REF_PATTERN = re.compile(r"^[vp]-[0-9a-f]{32}$")
+
+
+class _UnresolvedRef(Exception):
+    pass
+
+
+def _check_entry(entry: schemas.BatchEvent) -> None:
+    """The checks the _record_* helpers make before touching the database"""
+    if entry.type == "visit":
+        schemas.VisitCreate(**entry.data)
+        return
+    if entry.type == "pageview":
+        schemas.PageViewCreate(**entry.data)
+    elif entry.type == "cart_action":
+        schemas.CartActionCreate(**entry.data)
+    elif entry.type == "exit_link":
+        if not entry.data.get("url"):
+            raise HTTPException(status_code=400, detail="URL is required")
+        return
+    elif entry.type == "event" and not entry.data.get("event_type"):
+        raise HTTPException(status_code=400, detail="event_type is required")
+    elif entry.type == "pageview_update":
+        if entry.pageview_id is None:
+            raise HTTPException(status_code=400, detail="Missing id reference")
+        if entry.data.get("time_spent") is not None:
+            try:
+                int(entry.data["time_spent"])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="time_spent must be an integer")
+    if entry.visit_id is None:
+        raise HTTPException(status_code=400, detail="Missing id reference")
+
+
+def _log_beacon(project_id: int, events: list, ip_address: str) -> dict:
+    """Append a beacon to the event log; returns temp id -> ref and a result per entry"""
+    ids = {}
+    results = []
+    entries = []
+
+    def ref_for(value):
+        if isinstance(value, str):
+            if value in ids:
+                return ids[value]
+            if not _REF_PATTERN.match(value):
+                raise HTTPException(status_code=400, detail=f"Unknown temp id: {value}")
+        return value
+
+    for entry in events:
+        try:
+            _check_entry(entry)
+            visit_id, pageview_id = ref_for(entry.visit_id), ref_for(entry.pageview_id)
+        except HTTPException as e:
+            results.append({"type": entry.type, "status": "error", "detail": e.detail})
+            continue
+        except ValidationError as e:
+            results.append({"type": entry.type, "status": "error", "detail": e.errors(include_url=False)})
+            continue
+
+        result = {"type": entry.type, "status": "queued"}
+        ref = None
+        if entry.type in ("visit", "pageview"):
+            ref = f"{entry.type[0]}-{uuid.uuid4().hex}"
+            result[f"{entry.type}_id"] = ref
+            if entry.temp_id:
+                ids[entry.temp_id] = ref
+        entries.append({"type": entry.type, "ref": ref, "visit_id": visit_id, "pageview_id": pageview_id, "data": entry.data})
+        results.append(result)
+
+    if entries:
+        ingest_buffer.log.append({
+            "beacon": project_id,
+            "ip": ip_address,
+            "received_at": datetime.utcnow(),
+            "entries": entries
+        })
+    return {"ids": ids, "results": results}
+
+
+async def _log_single(project_id: int, entry: schemas.BatchEvent, ip_address: str) -> dict:
+    """One beacon through the log-first path; invalid beacons are rejected as on the direct path"""
+    result = _log_beacon(project_id, [entry], ip_address)["results"][0]
+    if result["status"] == "error":
+        raise HTTPException(status_code=400, detail=result["detail"])
+    await ingest_buffer.wait_durable_async()
+    return result
+
+
+def _stored_id(value) -> int:
+    # Refs only exist on the log-first path
+    if not isinstance(value, int):
+        raise HTTPException(status_code=404, detail="Visit not found")
+    return value
+
+
+class LoggedBeacons:
+    """
+    Applies beacon records for the event log consumer.
+
+    Each entry runs in a savepoint of the consumer's session, at the time
+    the beacon was received. Post-commit hooks run before the consumer
+    commits, so the stage work they submit is committed with the rows and
+    the log position; `reset` drops what they cached if that commit fails.
+    """
+
+    def __init__(self, cache_size: int = 100000):
+        self.refs = LRUCache(cache_size)
+        self.projects = LRUCache(10000)
+
+    def apply(self, db: Session, record: dict, deferred: list) -> None:
+        project_id = record["beacon"]
+        if not self._project_exists(db, project_id):
+            print(f"[Analytics] ✗ Dropped beacon for unknown project {project_id}")
+            return
+
+        after_commit = []
+        entries = record["entries"]
+        for index, entry in enumerate(entries):
+            hooks_before = len(after_commit)
+            try:
+                with db.begin_nested():
+                    self._apply_entry(db, project_id, entry, record, after_commit)
+            except _UnresolvedRef as e:
+                del after_commit[hooks_before:]
+                if datetime.utcnow() - record["received_at"] < timedelta(seconds=EVENT_LOG_REF_WAIT):
+                    deferred.append({**record, "entries": entries[index:]})
+                else:
+                    print(f"[Analytics] ✗ Dropped {len(entries) - index} beacon entries: ref {e} was never applied")
+                break
+            except (HTTPException, ValidationError) as e:
+                del after_commit[hooks_before:]
+                print(f"[Analytics] ✗ Dropped {entry['type']} beacon entry: {getattr(e, 'detail', e)}")
+        _run_after_commit(after_commit)
+
+    def _apply_entry(self, db: Session, project_id: int, entry: dict, record: dict, after_commit: list) -> None:
+        kind, data, now = entry["type"], entry["data"], record["received_at"]
+        if entry["ref"] and self._lookup(db, entry["ref"]) is not None:
+            # Already applied (a replayed range)
+            return
+
+        if kind == "visit":
+            visit = schemas.VisitCreate(**data)
+            result = _record_visit(db, project_id, visit, visit.ip_address or record["ip"], after_commit, now)
+            self._remember(db, entry["ref"], result["visit_id"], after_commit)
+        elif kind == "exit_link":
+            _record_exit_link(db, project_id, data, ingest_buffer, after_commit, now)
+        else:
+            visit_id = self._resolve(db, entry["visit_id"])
+            if kind == "pageview":
+                result = _record_pageview(db, project_id, visit_id, schemas.PageViewCreate(**data), after_commit, now)
+                self._remember(db, entry["ref"], result["pageview_id"], after_commit)
+            elif kind == "pageview_update":
+                _record_pageview_time(db, project_id, visit_id, self._resolve(db, entry["pageview_id"]), data, after_commit)
+            elif kind == "exit":
+                _record_exit(db, project_id, visit_id, data, after_commit, now)
+            elif kind == "cart_action":
+                _record_cart_action(db, project_id, visit_id, schemas.CartActionCreate(**data), ingest_buffer, after_commit, now)
             else:
-                print(f"[Location API] ✗ HTTP Error: {response.status_code}")
-                
-        except requests.Timeout:
-            print(f"[Location API] ✗ Timeout for IP: {ip_address}")
-        except Exception as e:
-            print(f"[Location API] ✗ Error: {str(e)}")
-    else:
-        print(f"[Location API] ⚠ Skipping localhost IP: {ip_address}")
-    
-    # Check if this session already exists (prevent duplicate tracking)
-    if visit.session_id:
-        existing_session = db.query(models.Visit).filter(
-            models.Visit.project_id == project_id,
-            models.Visit.session_id == visit.session_id
-        ).first()
-        
-        if existing_session:
-            # Session already tracked, don't create duplicate
-            return {
-                "visit_id": existing_session.id, 
-                "message": "Session already tracked (deduplicated)",
-                "is_duplicate": True
-            }
+                _record_event(db, project_id, visit_id, data, ingest_buffer, after_commit, now)
+
+    def _project_exists(self, db: Session, project_id: int) -> bool:
+        if project_id in self.projects:
+            return True
+        if db.scalar(select(models.Project.id).where(models.Project.id == project_id)) is None:
+            return False
+        self.projects.set(project_id, True)
+        return True
+
+    def _lookup(self, db: Session, ref: str) -> Optional[int]:
+        row_id = self.refs.get(ref)
+        if row_id is not MISSING:
+            return row_id
+        row_id = db.scalar(select(models.IngestRef.row_id).where(models.IngestRef.ref == ref))
+        if row_id is not None:
+            self.refs.set(ref, row_id)
+        return row_id
+
+    def _resolve(self, db: Session, value) -> int:
+        if not isinstance(value, str):
+            return value
+        row_id = self._lookup(db, value)
+        if row_id is None:
+            raise _UnresolvedRef(value)
+        return row_id
+
+    def _remember(self, db: Session, ref: str, row_id: int, after_commit: list) -> None:
+        table = models.IngestRef.__table__
+        db.execute(utils.get_insert_for_dialect(table, db.bind.dialect.name).values(
+            ref=ref, row_id=row_id, created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["ref"]))
+        after_commit.append(lambda: self.refs.set(ref, row_id))
+
+    def reset(self) -> None:
+        """Forget everything cached while applying a transaction that was rolled back"""
+        self.refs.clear()
+        self.projects.clear()
+        visit_index.sessions.clear()
+        page_registry.cache.clear()
+        pageview_owners.cache.clear()
+
+    def prune(self, session_factory) -> None:
+        """Delete refs older than EVENT_LOG_REF_DAYS"""
+        db = session_factory()
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=EVENT_LOG_REF_DAYS)
+            db.query(models.IngestRef).filter(models.IngestRef.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+logged_beacons = LoggedBeacons()
+
+
+@router.post("/{project_id}/batch")
+async def track_batch(project_id: int, batch: schemas.BatchRequest, request: Request, db: AsyncSession = Depends(get_tracking_db)):
+    """
+    Process an ordered array of tracking events in one transaction.
+
+    Entries that create a visit or page view may carry a client-side
+    `temp_id`; later entries can use that temp id in `visit_id` /
+    `pageview_id`. The response maps every temp id to the stored id, or
+    with the event log enabled to a ref that later beacons can use the
+    same way.
+    """
+
+    if _is_probable_bot_request(request, project_id):
+        return {"message": "Ignored", "ids": {}, "results": []}
     
-    # Create visit record
-    db_visit = models.Visit(
-        project_id=project_id,
-        visitor_id=visit.visitor_id,
-        session_id=visit.session_id,
-        ip_address=ip_address,
-        referrer=visit.referrer,
-        entry_page=visit.entry_page,
-        device=visit.device,
-        browser=visit.browser,
-        os=visit.os,
-        screen_resolution=visit.screen_resolution,
-        language=visit.language,
-        timezone=visit.timezone,
-        local_time=visit.local_time,
-        local_time_formatted=visit.local_time_formatted,
-        timezone_offset=visit.timezone_offset,
-        utm_source=visit.utm_source,
-        utm_medium=visit.utm_medium,
-        utm_campaign=visit.utm_campaign,
-        **location_data
-    )
+    if len(batch.events) > MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_EVENTS} events")
     
-    # Check if unique visitor (first time ever)
-    existing_visitor = db.query(models.Visit).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visitor_id == visit.visitor_id
-    ).first()
-    db_visit.is_unique = existing_visitor is None
-    db_visit.is_new_session = True
+    if ingest_buffer.log is not None:
+        logged = _log_beacon(project_id, batch.events, get_client_ip(request))
+        await ingest_buffer.wait_durable_async()
+        return {"message": "Batch queued", **logged}
     
-    db.add(db_visit)
-    db.commit()
-    db.refresh(db_visit)
+    # Check if project exists
+    project_exists = await db.scalar(select(models.Project.id).where(models.Project.id == project_id))
+    if not project_exists:
+        raise HTTPException(status_code=404, detail="Project not found")
     
-    # Track traffic source
-    if visit.traffic_source and visit.traffic_name:
-        # Check if this traffic source already exists
-        traffic_source = db.query(models.TrafficSource).filter(
-            models.TrafficSource.project_id == project_id,
-            models.TrafficSource.source_type == visit.traffic_source,
-            models.TrafficSource.source_name == visit.traffic_name
-        ).first()
-        
-        if traffic_source:
-            # Update existing traffic source
-            traffic_source.visit_count += 1
-        else:
-            # Create new traffic source
-            traffic_source = models.TrafficSource(
-                project_id=project_id,
-                source_type=visit.traffic_source,
-                source_name=visit.traffic_name,
-                referrer_url=visit.referrer if visit.referrer != 'direct' else None,
-                utm_source=visit.utm_source,
-                utm_medium=visit.utm_medium,
-                utm_campaign=visit.utm_campaign,
-                visit_count=1
-            )
-            db.add(traffic_source)
-        
-        db.commit()
+    processed = await db.run_sync(_process_batch, project_id, batch.events, get_client_ip(request))
+    await db.commit()
+    await _acknowledge(processed["after_commit"])
     
     return {
-        "visit_id": db_visit.id, 
-        "message": "Visit tracked",
-        "is_duplicate": False,
-        "is_unique_visitor": db_visit.is_unique
+        "message": "Batch processed",
+        "ids": processed["ids"],
+        "results": processed["results"]
+    }
+
+@router.get("/{project_id}/bot-stats")
+def get_bot_stats(project_id: int):
+    """
+    Tracking beacons rejected as bot traffic since this worker started.
+    Counts are kept in memory per worker and are never stored.
+    """
+    return {
+        "project_id": project_id,
+        **bot_classifier.rejections(project_id)
     }
 
 # ============================================
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
+from sqlalchemy import func, desc, and_, case
 from database import get_db
 import models
+import rollups
 import utils
 from datetime import datetime, time
 from typing import Optional, Dict
@@ -42,52 +43,6 @@ import pytz
 
 IST = pytz.timezone("Asia/Kolkata")
 
-# Constants for traffic source classification
-SEARCH_ENGINES = ["google", "bing", "yahoo", "duckduckgo", "baidu"]
-SOCIAL_SITES = ["facebook", "twitter", "instagram", "linkedin", "youtube", "tiktok", "pinterest"]
-AI_TOOLS = ["chatgpt", "claude", "gemini", "copilot", "perplexity"]
-EMAIL_PROVIDERS = ["mail", "gmail", "outlook", "yahoo.com"]
-PAID_MARKERS = ["ads", "adwords", "facebook.com/tr"]
-UTM_MARKERS = ["utm_", "campaign"]
-
-def classify_source(referrer: str) -> str:
-    """
-    Classify traffic source based on referrer URL.
-    This ensures consistency with traffic_sources endpoint.
-    """
-    r = (referrer or "").lower().strip()
-    
-    # Direct traffic
-    if not r or r in ("direct", "null", "undefined"):
-        return "direct"
-    
-    # Organic Search
-    if any(x in r for x in SEARCH_ENGINES):
-        return "organic"
-    
-    # Social Media
-    if any(x in r for x in SOCIAL_SITES):
-        return "social"
-    
-    # AI Tools
-    if any(x in r for x in AI_TOOLS):
-        return "ai"
-    
-    # Email
-    if any(x in r for x in EMAIL_PROVIDERS):
-        return "email"
-    
-    # Paid Traffic
-    if any(x in r for x in PAID_MARKERS):
-        return "paid"
-    
-    # UTM Campaigns
-    if any(x in r for x in UTM_MARKERS):
-        return "utm"
-    
-    # Everything else is referral
-    return "referral"
-
 # Filter mapping dictionary - maps frontend filter IDs to database fields
 FILTER_MAP = {
     "country_city": "country",
@@ -105,7 +60,7 @@ FILTER_MAP = {
     "sessions_per_visitor": "sessions_per_visitor",
     "engagement_sessions_per_visitor": "sessions_per_visitor",
     "engagement_exit_link": "exit_page",
-    "traffic_sources": "referrer",
+    "traffic_sources": "source_category",
     "traffic_utm_campaign": "utm_campaign",
     "traffic_utm_source": "utm_source",
     "traffic_utm_medium": "utm_medium",
@@ -122,6 +77,7 @@ def apply_filters_to_query(query, filters, db):
         return query
         
     print(f"🔍 Applying {len(filters)} filters to query")
+    visitor_joined = False
     
     for filter_key, filter_value in filters.items():
         print(f"  Processing filter: {filter_key} = {filter_value}")
@@ -229,101 +185,51 @@ def apply_filters_to_query(query, filters, db):
                 operator_key = f"{filter_key}_operator"
                 operator = filters.get(operator_key, 'equals')
                 
-                # Create subquery that counts page views per visit
-                page_views_subquery = db.query(
-                    models.PageView.visit_id,
-                    func.count(models.PageView.id).label('page_view_count')
-                ).group_by(models.PageView.visit_id).subquery()
-                
-                # Join with the subquery
-                query = query.join(
-                    page_views_subquery,
-                    models.Visit.id == page_views_subquery.c.visit_id
-                )
-                
-                # Apply the filter on the calculated page view count
+                # Page views per visit are kept on the visit row
+                page_view_count = models.Visit.page_views_count
                 if operator == 'equals':
-                    query = query.filter(page_views_subquery.c.page_view_count == int(filter_value))
+                    query = query.filter(page_view_count == int(filter_value))
                 elif operator == 'greater':
-                    query = query.filter(page_views_subquery.c.page_view_count > int(filter_value))
+                    query = query.filter(page_view_count > int(filter_value))
                 elif operator == 'less':
-                    query = query.filter(page_views_subquery.c.page_view_count < int(filter_value))
+                    query = query.filter(page_view_count < int(filter_value))
                 elif operator == 'greater_equal':
-                    query = query.filter(page_views_subquery.c.page_view_count >= int(filter_value))
+                    query = query.filter(page_view_count >= int(filter_value))
                 elif operator == 'less_equal':
-                    query = query.filter(page_views_subquery.c.page_view_count <= int(filter_value))
+                    query = query.filter(page_view_count <= int(filter_value))
                 else:
-                    query = query.filter(page_views_subquery.c.page_view_count == int(filter_value))
+                    query = query.filter(page_view_count == int(filter_value))
                 
                 print(f"    ✅ Applied page_views_per_session {operator} {filter_value}")
             
-            # Special handling for sessions_per_visitor (calculated metric)
-            elif filter_key == "sessions_per_visitor":
+            # sessions_per_visitor and its engagement_ alias read the visitors table
+            elif filter_key in ("sessions_per_visitor", "engagement_sessions_per_visitor"):
                 # Check if there's an operator for this filter
                 operator_key = f"{filter_key}_operator"
                 operator = filters.get(operator_key, 'equals')
                 
-                # Create subquery that counts sessions per visitor
-                sessions_per_visitor_subquery = db.query(
-                    models.Visit.visitor_id,
-                    func.count(models.Visit.id).label('session_count')
-                ).group_by(models.Visit.visitor_id).subquery()
-                
-                # Join with the subquery
-                query = query.join(
-                    sessions_per_visitor_subquery,
-                    models.Visit.visitor_id == sessions_per_visitor_subquery.c.visitor_id
-                )
+                if not visitor_joined:
+                    query = query.join(models.Visitor, and_(
+                        models.Visitor.project_id == models.Visit.project_id,
+                        models.Visitor.visitor_id == models.Visit.visitor_id
+                    ))
+                    visitor_joined = True
                 
-                # Apply the filter on the calculated session count
+                session_count = models.Visitor.session_count
                 if operator == 'equals':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
+                    query = query.filter(session_count == int(filter_value))
                 elif operator == 'greater':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count > int(filter_value))
+                    query = query.filter(session_count > int(filter_value))
                 elif operator == 'less':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count < int(filter_value))
+                    query = query.filter(session_count < int(filter_value))
                 elif operator == 'greater_equal':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count >= int(filter_value))
+                    query = query.filter(session_count >= int(filter_value))
                 elif operator == 'less_equal':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count <= int(filter_value))
+                    query = query.filter(session_count <= int(filter_value))
                 else:
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
+                    query = query.filter(session_count == int(filter_value))
                 
-                print(f"    ✅ Applied sessions_per_visitor {operator} {filter_value}")
-            
-            # Special handling for engagement_sessions_per_visitor (alias for sessions_per_visitor)
-            elif filter_key == "engagement_sessions_per_visitor":
-                # Check if there's an operator for this filter
-                operator_key = f"{filter_key}_operator"
-                operator = filters.get(operator_key, 'equals')
-                
-                # Create subquery that counts sessions per visitor
-                sessions_per_visitor_subquery = db.query(
-                    models.Visit.visitor_id,
-                    func.count(models.Visit.id).label('session_count')
-                ).group_by(models.Visit.visitor_id).subquery()
-                
-                # Join with the subquery
-                query = query.join(
-                    sessions_per_visitor_subquery,
-                    models.Visit.visitor_id == sessions_per_visitor_subquery.c.visitor_id
-                )
-                
-                # Apply the filter on the calculated session count
-                if operator == 'equals':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
-                elif operator == 'greater':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count > int(filter_value))
-                elif operator == 'less':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count < int(filter_value))
-                elif operator == 'greater_equal':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count >= int(filter_value))
-                elif operator == 'less_equal':
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count <= int(filter_value))
-                else:
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
-                
-                print(f"    ✅ Applied engagement_sessions_per_visitor {operator} {filter_value}")
+                print(f"    ✅ Applied {filter_key} {operator} {filter_value}")
             
             # Special handling for page URL filtering (page, page_page, entry_page, last_page_of_session, engagement_exit_link)
             elif filter_key in ["page", "page_page", "entry_page", "last_page_of_session", "engagement_exit_link"]:
@@ -340,68 +246,9 @@ def apply_filters_to_query(query, filters, db):
                 
                 print(f"    📝 Page filter {filter_key} {operator} {filter_value} marked for endpoint-level processing")
             
-            # Special handling for traffic_sources (classification-based filtering)
+            # traffic_sources matches the source category stored on the visit at ingest
             elif filter_key == "traffic_sources":
-                # Traffic source filtering requires custom logic since it's based on classification
-                # We need to filter visits based on their referrer classification
-                
-                if filter_value == "direct":
-                    # Direct traffic: no referrer or null/undefined
-                    query = query.filter(
-                        (models.Visit.referrer.is_(None)) | 
-                        (models.Visit.referrer == "") |
-                        (models.Visit.referrer.in_(["direct", "null", "undefined"]))
-                    )
-                elif filter_value == "organic":
-                    # Organic search: contains search engine domains
-                    organic_conditions = []
-                    for engine in SEARCH_ENGINES:
-                        organic_conditions.append(models.Visit.referrer.ilike(f"%{engine}%"))
-                    query = query.filter(func.or_(*organic_conditions))
-                elif filter_value == "social":
-                    # Social media: contains social media domains
-                    social_conditions = []
-                    for social in SOCIAL_SITES:
-                        social_conditions.append(models.Visit.referrer.ilike(f"%{social}%"))
-                    query = query.filter(func.or_(*social_conditions))
-                elif filter_value == "ai":
-                    # AI tools: contains AI tool domains
-                    ai_conditions = []
-                    for ai in AI_TOOLS:
-                        ai_conditions.append(models.Visit.referrer.ilike(f"%{ai}%"))
-                    query = query.filter(func.or_(*ai_conditions))
-                elif filter_value == "email":
-                    # Email: contains email provider domains
-                    email_conditions = []
-                    for email in EMAIL_PROVIDERS:
-                        email_conditions.append(models.Visit.referrer.ilike(f"%{email}%"))
-                    query = query.filter(func.or_(*email_conditions))
-                elif filter_value == "paid":
-                    # Paid traffic: contains paid markers
-                    paid_conditions = []
-                    for paid in PAID_MARKERS:
-                        paid_conditions.append(models.Visit.referrer.ilike(f"%{paid}%"))
-                    query = query.filter(func.or_(*paid_conditions))
-                elif filter_value == "utm":
-                    # UTM campaigns: contains UTM markers
-                    utm_conditions = []
-                    for utm in UTM_MARKERS:
-                        utm_conditions.append(models.Visit.referrer.ilike(f"%{utm}%"))
-                    query = query.filter(func.or_(*utm_conditions))
-                elif filter_value == "referral":
-                    # Referral: everything else that's not direct and not empty
-                    query = query.filter(
-                        models.Visit.referrer.isnot(None),
-                        models.Visit.referrer != "",
-                        ~models.Visit.referrer.in_(["direct", "null", "undefined"])
-                    )
-                    # Exclude search engines, social, AI tools, email, paid, and UTM
-                    exclude_conditions = []
-                    all_excludes = SEARCH_ENGINES + SOCIAL_SITES + AI_TOOLS + EMAIL_PROVIDERS + PAID_MARKERS + UTM_MARKERS
-                    for exclude in all_excludes:
-                        exclude_conditions.append(~models.Visit.referrer.ilike(f"%{exclude}%"))
-                    query = query.filter(func.and_(*exclude_conditions))
-                
+                query = query.filter(models.Visit.source_category == filter_value)
                 print(f"    ✅ Applied traffic_sources filter: {filter_value}")
             else:
                 # Check if there's an operator for this filter
@@ -592,7 +439,8 @@ def get_most_visited_pages(
 
         start_dt, end_dt = normalize_date_range(start_date, end_date)
 
-        base_url_exp = func.split_part(models.PageView.url, '?', 1)
+        # Base URL (query string / fragment stripped) stored on the page view at ingest
+        base_url_exp = models.PageView.base_url
 
         # Single optimized query with pagination
         query = db.query(
@@ -617,25 +465,22 @@ def get_most_visited_pages(
         # Apply page-specific filtering if page_page filter is provided
         if page_page:
             print(f"🔍 Applying page_page filter: {page_page}")
-            # For most visited pages, we filter on the base_url_exp which comes from PageView.url
-            # This needs to be applied after the main query but before grouping
-            query = query.having(func.split_part(models.PageView.url, '?', 1).ilike(f"%{page_page}%"))
+            # For most visited pages, we filter on the stored PageView.base_url
+            query = query.filter(models.PageView.base_url.ilike(f"%{page_page}%"))
             print(f"    ✅ Applied page_page filter to most visited pages")
         
         # Apply page_entry_page filtering if provided
         if page_entry_page:
             print(f"🔍 Applying page_entry_page filter: {page_entry_page}")
-            # For most visited pages, we filter on the base_url_exp which comes from PageView.url
-            # This needs to be applied after the main query but before grouping
-            query = query.having(func.split_part(models.PageView.url, '?', 1).ilike(f"%{page_entry_page}%"))
+            # For most visited pages, we filter on the stored PageView.base_url
+            query = query.filter(models.PageView.base_url.ilike(f"%{page_entry_page}%"))
             print(f"    ✅ Applied page_entry_page filter to most visited pages")
         
         # Apply engagement_exit_link filtering if provided
         if engagement_exit_link:
             print(f"🔍 Applying engagement_exit_link filter: {engagement_exit_link}")
-            # For most visited pages, we filter on the base_url_exp which comes from PageView.url
-            # This needs to be applied after the main query but before grouping
-            query = query.having(func.split_part(models.PageView.url, '?', 1).ilike(f"%{engagement_exit_link}%"))
+            # For most visited pages, we filter on the stored PageView.base_url
+            query = query.filter(models.PageView.base_url.ilike(f"%{engagement_exit_link}%"))
             print(f"    ✅ Applied engagement_exit_link filter to most visited pages")
         
         # Debug: Check if filters were actually applied
@@ -657,7 +502,7 @@ def get_most_visited_pages(
             # Get all visits for this page
             page_visits_query = db.query(models.Visit).join(models.PageView).filter(
                 models.Visit.project_id == project_id,
-                func.split_part(models.PageView.url, '?', 1) == base_url
+                models.PageView.base_url == base_url
             )
             
             if start_dt:
@@ -675,15 +520,11 @@ def get_most_visited_pages(
             total_filtered_visits = len(page_visit_ids)
             
             if total_filtered_visits > 0:
-                # Check page view count for each page visit
-                visit_page_counts = db.query(
-                    models.PageView.visit_id,
-                    func.count(models.PageView.id).label('page_count')
-                ).filter(
-                    models.PageView.visit_id.in_(page_visit_ids)
-                ).group_by(models.PageView.visit_id).all()
-                
-                single_page_visits = sum(1 for visit_id, page_count in visit_page_counts if page_count == 1)
+                # Single-page visits are flagged on the visit row
+                single_page_visits = db.query(func.count(models.Visit.id)).filter(
+                    models.Visit.id.in_(page_visit_ids),
+                    models.Visit.is_bounce == True
+                ).scalar()
                 
             # Calculate bounce rate based on filtered visits
             bounce_rate = (single_page_visits / total_filtered_visits * 100) if total_filtered_visits > 0 else 0.0
@@ -856,7 +697,8 @@ def get_entry_pages(
 
         start_dt, end_dt = normalize_date_range(start_date, end_date)
 
-        base_url_exp = func.split_part(models.Visit.entry_page, '?', 1)
+        # Base URL of the entry page, stored on the visit at ingest
+        base_url_exp = models.Visit.entry_base_url
 
         # Single optimized query with pagination
         query = db.query(
@@ -865,7 +707,7 @@ def get_entry_pages(
             func.count(func.distinct(models.Visit.visitor_id)).label("unique_visitors")
         ).filter(
             models.Visit.project_id == project_id,
-            models.Visit.entry_page.isnot(None)
+            models.Visit.entry_base_url.isnot(None)
         )
 
         if start_dt:
@@ -879,22 +721,22 @@ def get_entry_pages(
         # Apply page-specific filtering if page_page filter is provided
         if page_page:
             print(f"🔍 Applying page_page filter to entry pages: {page_page}")
-            # For entry pages, we filter on the entry_page field
-            query = query.having(func.split_part(models.Visit.entry_page, '?', 1).ilike(f"%{page_page}%"))
+            # For entry pages, we filter on the stored entry_base_url
+            query = query.filter(models.Visit.entry_base_url.ilike(f"%{page_page}%"))
             print(f"    ✅ Applied page_page filter to entry pages")
 
         # Apply page_entry_page filtering if provided
         if page_entry_page:
             print(f"🔍 Applying page_entry_page filter to entry pages: {page_entry_page}")
-            # For entry pages, we filter on the entry_page field
-            query = query.having(func.split_part(models.Visit.entry_page, '?', 1).ilike(f"%{page_entry_page}%"))
+            # For entry pages, we filter on the stored entry_base_url
+            query = query.filter(models.Visit.entry_base_url.ilike(f"%{page_entry_page}%"))
             print(f"    ✅ Applied page_entry_page filter to entry pages")
 
         # Apply engagement_exit_link filtering if provided
         if engagement_exit_link:
             print(f"🔍 Applying engagement_exit_link filter to entry pages: {engagement_exit_link}")
-            # For entry pages, we filter on the entry_page field
-            query = query.having(func.split_part(models.Visit.entry_page, '?', 1).ilike(f"%{engagement_exit_link}%"))
+            # For entry pages, we filter on the stored entry_base_url
+            query = query.filter(models.Visit.entry_base_url.ilike(f"%{engagement_exit_link}%"))
             print(f"    ✅ Applied engagement_exit_link filter to entry pages")
 
         # Apply pagination
@@ -914,7 +756,7 @@ def get_entry_pages(
             # Get all visits that started from this entry page
             entry_visits_query = db.query(models.Visit.id).filter(
                 models.Visit.project_id == project_id,
-                func.split_part(models.Visit.entry_page, '?', 1) == base_url
+                models.Visit.entry_base_url == base_url
             )
             
             if start_dt:
@@ -926,20 +768,14 @@ def get_entry_pages(
             visit_ids = [row[0] for row in entry_visits_query.all()]
             
             if visit_ids:
-                # Count page views per visit for entry pages
-                visit_page_counts = db.query(
-                    models.PageView.visit_id,
-                    func.count(models.PageView.id).label('page_count')
+                # Only count visits that have actual page view data (counters kept on the visit row)
+                total_visits_with_data, single_page_visits = db.query(
+                    func.count(models.Visit.id),
+                    func.count(case((models.Visit.is_bounce == True, models.Visit.id)))
                 ).filter(
-                    models.PageView.visit_id.in_(visit_ids)
-                ).group_by(models.PageView.visit_id).all()
-                
-                # Purely dynamic calculation based on actual page view data
-                visits_with_page_data = {visit_id: count for visit_id, count in visit_page_counts}
-                
-                # Only count visits that have actual page view data
-                single_page_visits = sum(1 for visit_id, count in visits_with_page_data.items() if count == 1)
-                total_visits_with_data = len(visits_with_page_data)
+                    models.Visit.id.in_(visit_ids),
+                    models.Visit.page_views_count > 0
+                ).one()
                 
                 # Calculate bounce rate only from visits with page view data
                 bounce_rate = (single_page_visits / total_visits_with_data * 100) if total_visits_with_data > 0 else 0.0
@@ -953,7 +789,7 @@ def get_entry_pages(
             visits_for_page = []
             entry_visits = db.query(models.Visit).filter(
                 models.Visit.project_id == project_id,
-                func.split_part(models.Visit.entry_page, '?', 1) == base_url
+                models.Visit.entry_base_url == base_url
             )
             
             if start_dt:
@@ -1121,97 +957,60 @@ def get_exit_pages(
         
         start_dt, end_dt = normalize_date_range(start_date, end_date)
 
-        # Simple query: Get last page view for each session
-        last_page_query = db.query(
-            models.PageView.url,
-            models.PageView.visit_id,
-            models.PageView.viewed_at,
-            models.Visit.visitor_id
-        ).join(models.Visit).filter(
-            models.Visit.project_id == project_id
+        # Exit page = base URL of each visit's latest page view, kept on the visit at ingest
+        base_url_exp = models.Visit.exit_base_url
+
+        query = db.query(
+            base_url_exp.label("exit_page"),
+            func.count(models.Visit.id).label("exits"),
+            func.count(func.distinct(models.Visit.visitor_id)).label("unique_visitors"),
+            func.count(case((models.Visit.is_bounce == True, models.Visit.id))).label("bounces")
+        ).filter(
+            models.Visit.project_id == project_id,
+            models.Visit.exit_base_url.isnot(None)
         )
         
         if start_dt:
-            last_page_query = last_page_query.filter(models.Visit.visited_at >= start_dt)
+            query = query.filter(models.Visit.visited_at >= start_dt)
         if end_dt:
-            last_page_query = last_page_query.filter(models.Visit.visited_at <= end_dt)
+            query = query.filter(models.Visit.visited_at <= end_dt)
         
         # Apply custom filters
-        last_page_query = apply_filters_to_query(last_page_query, filters, db)
+        query = apply_filters_to_query(query, filters, db)
         
-        # Get all page views and find the last one for each visit
-        all_views = last_page_query.order_by(models.PageView.visit_id, models.PageView.viewed_at.desc()).all()
+        # Apply page_page, page_entry_page and engagement_exit_link filters on the exit page
+        for page_filter in (page_page, page_entry_page, engagement_exit_link):
+            if page_filter:
+                query = query.filter(models.Visit.exit_base_url.ilike(f"%{page_filter}%"))
         
-        # Group by visit_id and get the last page view for each visit
-        visit_last_pages = {}
-        for view in all_views:
-            if view.visit_id not in visit_last_pages:
-                visit_last_pages[view.visit_id] = view
+        exit_pages = (
+            query.group_by(base_url_exp)
+            .order_by(desc("exits"))
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
         
-        # Count exit pages
-        exit_page_counts = {}
-        for visit_id, last_view in visit_last_pages.items():
-            base_url = last_view.url.split('?')[0] if last_view.url else 'Unknown'
-            
-            # Apply page_page filter if provided
-            if page_page and page_page.lower() not in base_url.lower():
-                continue  # Skip this page if it doesn't match the filter
+        # Calculate proper exit rate
+        # Get total visits for this project in the date range
+        total_project_visits_query = db.query(models.Visit).filter(
+            models.Visit.project_id == project_id
+        )
         
-            # Apply page_entry_page filter if provided
-            if page_entry_page and page_entry_page.lower() not in base_url.lower():
-                continue  # Skip this page if it doesn't match the filter
+        if start_dt:
+            total_project_visits_query = total_project_visits_query.filter(models.Visit.visited_at >= start_dt)
+        if end_dt:
+            total_project_visits_query = total_project_visits_query.filter(models.Visit.visited_at <= end_dt)
         
-            # Apply engagement_exit_link filter if provided
-            if engagement_exit_link and engagement_exit_link.lower() not in base_url.lower():
-                continue  # Skip this page if it doesn't match the filter
-                
-            exit_page_counts[base_url] = exit_page_counts.get(base_url, 0) + 1
+        # Apply filters to get total visits
+        total_project_visits_query = apply_filters_to_query(total_project_visits_query, filters, db)
+        total_project_visits = total_project_visits_query.count() if exit_pages else 0
         
         # Convert to result format
         result = []
-        for base_url, count in sorted(exit_page_counts.items(), key=lambda x: x[1], reverse=True):
-            if len(result) >= limit:
-                break
-                
-            # Calculate bounce rate for exit pages
-            # Get all visits that ended on this exit page
-            exit_visit_ids = []
-            for visit_id, last_view in visit_last_pages.items():
-                if last_view.url and last_view.url.split('?')[0] == base_url:
-                    exit_visit_ids.append(visit_id)
-            
-            # Calculate bounce rate - count visits with single page view
-            single_page_visits = 0
-            total_exit_visits = len(exit_visit_ids)
-            
-            if total_exit_visits > 0:
-                # Check page view count for each exit visit
-                visit_page_counts = db.query(
-                    models.PageView.visit_id,
-                    func.count(models.PageView.id).label('page_count')
-                ).filter(
-                    models.PageView.visit_id.in_(exit_visit_ids)
-                ).group_by(models.PageView.visit_id).all()
-                
-                single_page_visits = sum(1 for visit_id, page_count in visit_page_counts if page_count == 1)
-                
-            # Calculate bounce rate
-            bounce_rate = (single_page_visits / total_exit_visits * 100) if total_exit_visits > 0 else 0.0
-                
-            # Calculate proper exit rate and bounce rate
-            # Get total visits for this project in the date range
-            total_project_visits_query = db.query(models.Visit).filter(
-                models.Visit.project_id == project_id
-            )
-            
-            if start_dt:
-                total_project_visits_query = total_project_visits_query.filter(models.Visit.visited_at >= start_dt)
-            if end_dt:
-                total_project_visits_query = total_project_visits_query.filter(models.Visit.visited_at <= end_dt)
-            
-            # Apply filters to get total visits
-            total_project_visits_query = apply_filters_to_query(total_project_visits_query, filters, db)
-            total_project_visits = total_project_visits_query.count()
+        for base_url, count, unique_visitors, single_page_visits in exit_pages:
+            # Bounce rate - share of the visits exiting here that had a single page view
+            bounce_rate = (single_page_visits / count * 100) if count > 0 else 0.0
             
             # Calculate exit rate: (exits from this page / total project visits) * 100
             exit_rate = (count / total_project_visits * 100) if total_project_visits > 0 else 0.0
@@ -1226,7 +1025,7 @@ def get_exit_pages(
             visits_for_page = []
             page_visits = db.query(models.Visit).join(models.PageView).filter(
                 models.Visit.project_id == project_id,
-                models.PageView.url.like(f"{base_url}%")
+                models.PageView.base_url == base_url
             )
             
             if start_dt:
@@ -1261,8 +1060,7 @@ def get_exit_pages(
                 "page": base_url,
                 "title": base_url,
                 "exits": count,
-                "unique_visitors": len(set(v.visitor_id for v in visit_last_pages.values() 
-                                        if v.url and v.url.split('?')[0] == base_url)),
+                "unique_visitors": unique_visitors,
                 "exit_rate": round(exit_rate, 1),  # Proper exit rate calculation
                 "bounce_rate": round(bounce_rate, 1),  # Proper bounce rate calculation
                 "total_page_views": total_page_visits,  # Use accurate total count
@@ -1295,46 +1093,22 @@ def get_page_activity(
     db: Session = Depends(get_db)
 ):
     from datetime import datetime, timedelta
-    import pytz
-
-    IST = pytz.timezone("Asia/Kolkata")
-
-    # IST now → UTC
-    ist_now = IST.localize(datetime.now())
-    utc_now = ist_now.astimezone(pytz.UTC)
-
-    time_ago = utc_now - timedelta(hours=hours)
 
-    dialect_name = db.bind.dialect.name
-    hour_expr = utils.get_truncated_hour_expr(
-        models.PageView.viewed_at,
-        dialect_name
-    )
+    # Page views per IST hour from the 30-minute time buckets (see rollups.py)
+    since = rollups.bucket_start(datetime.utcnow() - timedelta(hours=hours))
 
-    activity = (
-        db.query(
-            hour_expr.label("hour"),
-            func.count(models.PageView.id).label("views")
-        )
-        .join(models.Visit)
-        .filter(
-            models.Visit.project_id == project_id,
-            models.PageView.viewed_at >= time_ago
-        )
-        .group_by(hour_expr)
-        .order_by(hour_expr)
-        .all()
-    )
+    views_by_hour = {}
+    for bucket in rollups.time_buckets(db, project_id, start=since):
+        hour = rollups.local_hour(bucket.bucket_start)
+        views_by_hour[hour] = views_by_hour.get(hour, 0) + bucket.page_views
 
     return [
         {
-            "hour": (
-                h.strftime("%Y-%m-%d %H:%M:%S")
-                if hasattr(h, "strftime") else h
-            ),
+            "hour": hour.strftime("%Y-%m-%d %H:%M:%S"),
             "views": views
         }
-        for h, views in activity
+        for hour, views in sorted(views_by_hour.items())
+        if views
     ]
 
 
@@ -10,6 +10,10 @@ import models, schemas
 
 import secrets
 
+import hll
+
+import rollups
+
 from datetime import datetime, timedelta
 
 from typing import Optional
@@ -334,39 +338,24 @@ def get_all_projects_stats(
 
 
 
-    def visitor_stats(start=None, end=None):
-
-        q = (
-
-            db.query(
-
-                models.Visit.project_id,
-
-                func.count(func.distinct(models.Visit.visitor_id)).label("count")
-
-            )
-            .filter(models.Visit.project_id.in_(project_ids))
-
-        )
+    # Distinct visitors are unions of HyperLogLog sketches (estimates, see hll.py):
+    # the 30-minute time buckets (by visit start) line up with the UTC days and
+    # month used for page views above; daily (IST) sketches cover the all-time total
 
-        if start:
+    def bucket_visitors(start, end=None):
 
-            q = q.filter(models.Visit.visited_at >= start)
+        start = start.replace(tzinfo=None)
 
-        if end:
+        return rollups.unique_visitors(db, project_ids, start=start, end=end, buckets=True)
 
-            q = q.filter(models.Visit.visited_at <= end)
-
-        return {r.project_id: r.count for r in q.group_by(models.Visit.project_id).all()}
 
+    total_visitors = rollups.unique_visitors(db, project_ids)
 
-    total_visitors = visitor_stats()
+    today_visitors = bucket_visitors(today_start_utc, today_start_utc.replace(tzinfo=None) + timedelta(days=1))
 
-    today_visitors = visitor_stats(start=today_start_utc, end=today_end_utc)
+    yesterday_visitors = bucket_visitors(yesterday_start_utc, today_start_utc.replace(tzinfo=None))
 
-    yesterday_visitors = visitor_stats(start=yesterday_start_utc, end=yesterday_end_utc)
-
-    month_visitors = visitor_stats(start=month_start_utc)
+    month_visitors = bucket_visitors(month_start_utc)
 
     # Live visitors (last 5 minutes)
 
@@ -477,6 +466,8 @@ def get_all_projects_stats(
 
             "month_visitors": month_visitors.get(project.id, 0),
 
+            "visitors_error": hll.error_bound(total_visitors.get(project.id, 0)),
+
             "live_visitors": live_visitors.get(project.id, 0),
 
         })
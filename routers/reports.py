@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, Response, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from database import get_db
 import models
 from datetime import datetime, timedelta
-import csv
-import io
 import utils
+import exports
+import hll
+import rollups
 import pytz
 router = APIRouter()
 
@@ -149,36 +151,69 @@ def normalize_date_range(start_date_str: str, end_date_str: str):
 # EXPORT CSV
 # ---------------------------------------
 @router.get("/{project_id}/export/csv")
-def export_csv(project_id: int, days: int = 30, db: Session = Depends(get_db)):
+def export_csv(project_id: int, days: int = 30, dataset: str = "visits", gzip: bool = False, db: Session = Depends(get_db)):
+    """
+    Stream visits, page views or events of the last `days` IST days as CSV.
+
+    Rows come from a server-side cursor in chunks (see exports.py), so the
+    export never holds the whole result in memory; `gzip=true` sends a
+    .csv.gz file instead.
+    """
+    if dataset not in exports.DATASETS:
+        raise HTTPException(status_code=400, detail=f"dataset must be one of {', '.join(exports.DATASETS)}")
+    if not db.query(models.Project.id).filter(models.Project.id == project_id).first():
+        raise HTTPException(status_code=404, detail="Project not found")
+
     start_date_ist = utils.get_ist_start_of_day(days - 1)
     start_date_utc = utils.ist_to_utc(start_date_ist)
-    
-    visits = db.query(models.Visit).filter(
-        models.Visit.project_id == project_id,
-        models.Visit.visited_at >= start_date_utc
-    ).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow([
-        'Visitor ID', 'IP Address', 'Country', 'State', 'City',
-        'Device', 'Browser', 'OS', 'Referrer', 'Entry Page',
-        'Exit Page', 'Session Duration', 'Visited At'
-    ])
-    
-    for v in visits:
-        writer.writerow([
-            v.visitor_id, v.ip_address, v.country, v.state, v.city,
-            v.device, v.browser, v.os, v.referrer, v.entry_page,
-            v.exit_page, v.session_duration, v.visited_at
-        ])
-    
-    output.seek(0)
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=analytics_{project_id}.csv"}
+
+    stmt = exports.export_query(dataset, project_id, start=start_date_utc)
+    body = exports.csv_stream(dataset, exports.iter_chunks(stmt), gzip=gzip)
+    suffix = "" if dataset == "visits" else f"_{dataset}"
+    filename = f"analytics_{project_id}{suffix}.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# ---------------------------------------
+# EXPORT PARQUET
+# ---------------------------------------
+@router.get("/{project_id}/export/parquet")
+def export_parquet(
+    project_id: int,
+    dataset: str = "visits",
+    start_date: str = None,
+    end_date: str = None,
+    days: int = 30,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream visits, page views, events or cart actions as a typed Parquet file.
+
+    The range is the full IST days from `start_date` to `end_date` (ISO
+    timestamps, as the other reports take them), or the last `days` IST days.
+    Each server-side cursor chunk is written as one row group (see exports.py).
+    """
+    if dataset not in exports.COLUMNAR:
+        raise HTTPException(status_code=400, detail=f"dataset must be one of {', '.join(exports.COLUMNAR)}")
+    if exports.pa is None:
+        raise HTTPException(status_code=501, detail="Parquet export is not available (pyarrow is not installed)")
+    if not db.query(models.Project.id).filter(models.Project.id == project_id).first():
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if start_date and end_date:
+        start_utc, end_utc = normalize_date_range(start_date, end_date)
+    else:
+        start_utc, end_utc = utils.ist_to_utc(utils.get_ist_start_of_day(days - 1)), None
+
+    stmt = exports.export_query(dataset, project_id, start=start_utc, end=end_utc, columnar=True)
+    body = exports.parquet_stream(dataset, exports.iter_chunks(stmt, chunk_rows=exports.PARQUET_ROW_GROUP_ROWS))
+    return StreamingResponse(
+        body,
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f"attachment; filename=analytics_{project_id}_{dataset}.parquet"}
     )
 
 # ---------------------------------------
@@ -295,6 +330,7 @@ def get_summary_report(
     query = db.query(models.Visit).filter(
         models.Visit.project_id == project_id
     )
+    start_day = end_day = None
 
     if start_date and end_date:
         start_dt, end_dt = normalize_date_range(start_date, end_date)
@@ -306,12 +342,15 @@ def get_summary_report(
             models.Visit.visited_at >= start_dt,
             models.Visit.visited_at <= end_dt
         )
+        start_day = rollups.ist_date(start_dt.replace(tzinfo=None))
+        end_day = rollups.ist_date(end_dt.replace(tzinfo=None))
 
     total_visits = query.count()
 
-    unique_visitors = query.with_entities(
-        func.count(func.distinct(models.Visit.visitor_id))
-    ).scalar()
+    # Union of the daily HLL sketches instead of COUNT(DISTINCT visitor_id)
+    unique_visitors = rollups.unique_visitors(
+        db, [project_id], start=start_day, end=end_day
+    ).get(project_id, 0)
 
     countries = query.with_entities(
         models.Visit.country,
@@ -326,6 +365,7 @@ def get_summary_report(
         },
         "total_visits": total_visits,
         "unique_visitors": unique_visitors,
+        "unique_visitors_error": hll.error_bound(unique_visitors),
         "countries": [
             {"country": c.country or "Unknown", "count": c.count} 
             for c in countries if c.country
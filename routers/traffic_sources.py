@@ -2,12 +2,13 @@ from fastapi import APIRouter, Depends
 
 from sqlalchemy.orm import Session
 
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, and_, case, literal, or_, select, union_all
 
 from database import get_db
 
 import models
 
+
 from datetime import datetime, timedelta
 
 from typing import Optional
@@ -107,31 +108,7 @@ router = APIRouter()
 
 # ================================
 
-# Constants for classification
-
-SEARCH_ENGINES = ["google", "bing", "yahoo", "duckduckgo", "baidu"]
-
-
-
-SOCIAL_SITES = ["facebook", "twitter", "instagram", "linkedin", "youtube", "tiktok", "pinterest"]
-
-
-
-AI_TOOLS = ["chatgpt", "claude", "gemini", "copilot", "perplexity"]
-
-
-
-EMAIL_PROVIDERS = ["mail", "gmail", "outlook", "yahoo.com"]
-
-
-
-PAID_MARKERS = ["ads", "adwords", "facebook.com/tr"]
-
-
-
-UTM_MARKERS = ["utm_", "campaign"]
-
-
+# Categories are assigned at ingest by utils.classify_source and stored on the visit
 
 # Filter mapping dictionary - maps frontend filter IDs to database fields
 
@@ -167,7 +144,7 @@ FILTER_MAP = {
 
     "engagement_exit_link": "exit_page",
 
-    "traffic_sources": "referrer",
+    "traffic_sources": "source_category",
 
     "traffic_utm_campaign": "utm_campaign",
 
@@ -207,6 +184,8 @@ def apply_filters_to_query(query, filters, db, start_dt=None, end_dt=None):
 
     print(f"🔍 Filter keys received: {list(filters.keys())}")
 
+    visitor_joined = False
+
     print(f"🔍 Filter values: {filters}")
 
     
@@ -291,57 +270,35 @@ def apply_filters_to_query(query, filters, db, start_dt=None, end_dt=None):
 
                 
 
-                # Create subquery that counts page views per visit
-
-                from sqlalchemy import select
+                # Page views per visit are kept on the visit row
 
-                page_views_subquery = select(
-
-                    models.PageView.visit_id,
-
-                    func.count(models.PageView.id).label('page_view_count')
-
-                ).group_by(models.PageView.visit_id).subquery()
-
-                
-
-                # Join with the subquery
-
-                query = query.outerjoin(
-
-                    page_views_subquery,
-
-                    models.Visit.id == page_views_subquery.c.visit_id
-
-                )
+                page_view_count = models.Visit.page_views_count
 
                 
 
-                # Apply the filter on the calculated page view count
-
                 if operator == 'equals':
 
-                    query = query.filter(page_views_subquery.c.page_view_count == int(filter_value))
+                    query = query.filter(page_view_count == int(filter_value))
 
                 elif operator == 'greater':
 
-                    query = query.filter(page_views_subquery.c.page_view_count > int(filter_value))
+                    query = query.filter(page_view_count > int(filter_value))
 
                 elif operator == 'less':
 
-                    query = query.filter(page_views_subquery.c.page_view_count < int(filter_value))
+                    query = query.filter(page_view_count < int(filter_value))
 
                 elif operator == 'greater_equal':
 
-                    query = query.filter(page_views_subquery.c.page_view_count >= int(filter_value))
+                    query = query.filter(page_view_count >= int(filter_value))
 
                 elif operator == 'less_equal':
 
-                    query = query.filter(page_views_subquery.c.page_view_count <= int(filter_value))
+                    query = query.filter(page_view_count <= int(filter_value))
 
                 else:
 
-                    query = query.filter(page_views_subquery.c.page_view_count == int(filter_value))
+                    query = query.filter(page_view_count == int(filter_value))
 
                 
 
@@ -349,9 +306,9 @@ def apply_filters_to_query(query, filters, db, start_dt=None, end_dt=None):
 
             
 
-            # Special handling for engagement_sessions_per_visitor (calculated metric)
+            # sessions_per_visitor and its engagement_ alias read the visitors table
 
-            elif filter_key == "engagement_sessions_per_visitor":
+            elif filter_key in ("sessions_per_visitor", "engagement_sessions_per_visitor"):
 
                 # Check if there's an operator for this filter
 
@@ -361,61 +318,49 @@ def apply_filters_to_query(query, filters, db, start_dt=None, end_dt=None):
 
                 
 
-                # Create subquery that counts sessions per visitor
-
-                from sqlalchemy import select
-
-                sessions_per_visitor_subquery = select(
-
-                    models.Visit.visitor_id,
+                if not visitor_joined:
 
-                    func.count(models.Visit.id).label('session_count')
+                    query = query.outerjoin(models.Visitor, and_(
 
-                ).group_by(models.Visit.visitor_id).subquery()
+                        models.Visitor.project_id == models.Visit.project_id,
 
-                
-
-                # Join with the subquery
-
-                query = query.outerjoin(
+                        models.Visitor.visitor_id == models.Visit.visitor_id
 
-                    sessions_per_visitor_subquery,
+                    ))
 
-                    models.Visit.visitor_id == sessions_per_visitor_subquery.c.visitor_id
-
-                )
+                    visitor_joined = True
 
                 
 
-                # Apply the filter on the calculated session count
+                session_count = models.Visitor.session_count
 
                 if operator == 'equals':
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
+                    query = query.filter(session_count == int(filter_value))
 
                 elif operator == 'greater':
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count > int(filter_value))
+                    query = query.filter(session_count > int(filter_value))
 
                 elif operator == 'less':
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count < int(filter_value))
+                    query = query.filter(session_count < int(filter_value))
 
                 elif operator == 'greater_equal':
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count >= int(filter_value))
+                    query = query.filter(session_count >= int(filter_value))
 
                 elif operator == 'less_equal':
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count <= int(filter_value))
+                    query = query.filter(session_count <= int(filter_value))
 
                 else:
 
-                    query = query.filter(sessions_per_visitor_subquery.c.session_count == int(filter_value))
+                    query = query.filter(session_count == int(filter_value))
 
                 
 
-                print(f"    ✅ Applied engagement_sessions_per_visitor {operator} {filter_value}")
+                print(f"    ✅ Applied {filter_key} {operator} {filter_value}")
 
             
 
@@ -501,64 +446,6 @@ def apply_filters_to_query(query, filters, db, start_dt=None, end_dt=None):
 
     return query
 
-def classify_source(referrer: str) -> str:
-
-    """
-
-    Single source of truth for traffic source classification.
-
-    This ensures consistency between summary and detail APIs.
-
-    """
-
-    r = (referrer or "").lower().strip()
-
-    # Direct traffic
-
-    if not r or r in ("direct", "null", "undefined"):
-
-        return "direct"
-
-    # Organic Search
-
-    if any(x in r for x in SEARCH_ENGINES):
-
-        return "organic"
-
-    # Social Media
-
-    if any(x in r for x in SOCIAL_SITES):
-
-        return "social"
-
-    # AI Tools
-
-    if any(x in r for x in AI_TOOLS):
-
-        return "ai"
-
-    # Email
-
-    if any(x in r for x in EMAIL_PROVIDERS):
-
-        return "email"
-
-    # Paid Traffic
-
-    if any(x in r for x in PAID_MARKERS):
-
-        return "paid"
-
-    # UTM Campaigns
-
-    if any(x in r for x in UTM_MARKERS):
-
-        return "utm"
-
-    # Everything else is referral
-
-    return "referral"
-
 @router.get("/{project_id}/landing-pages")
 def get_landing_pages(
     project_id: int,
@@ -677,6 +564,61 @@ def get_utm_campaigns(
         print(f"❌ Error getting UTM campaigns: {e}")
         return []
 
+# Conversion signals counted per traffic source (see _conversion_counts)
+CONVERSION_CART_ACTIONS = ['add_to_cart', 'purchase_completed', 'checkout_started']
+CONVERSION_EVENTS = {
+    'purchase_events': ['purchase', 'order_completed', 'payment_successful'],
+    'signup_events': ['signup', 'register', 'user_registered'],
+    'lead_events': ['lead', 'form_submit', 'contact_submit', 'newsletter_signup'],
+}
+CONVERSION_PAGE_PATTERNS = ['%thank%', '%confirm%', '%success%', '%complete%', '%checkout%']
+CONVERSION_LINK_PATTERNS = ['%payment%', '%checkout%', '%buy%', '%order%']
+
+
+def _conversion_counts(db: Session, visits_query):
+    """
+    Conversion signals of the visits matched by `visits_query`, per source category,
+    in one statement (UNION ALL of grouped joins against the filtered visits):
+    {source_category: {'cart_actions': rows, 'cart_visits': visits with a cart conversion, 'purchase_events': n, ...}}
+    """
+    visits = visits_query.with_entities(
+        models.Visit.id.label('id'),
+        models.Visit.project_id.label('project_id'),
+        models.Visit.session_id.label('session_id'),
+        models.Visit.source_category.label('source_category')
+    ).subquery()
+    category = visits.c.source_category
+
+    def cart(kind, count):
+        return select(category, literal(kind).label('kind'), count.label('n')).join(
+            models.CartAction, models.CartAction.visit_id == visits.c.id
+        ).where(models.CartAction.action.in_(CONVERSION_CART_ACTIONS)).group_by(category)
+
+    event_kind = case(*[(models.Event.event_type.in_(types), kind) for kind, types in CONVERSION_EVENTS.items()])
+    events = select(category, event_kind.label('kind'), func.count(models.Event.id).label('n')).join(
+        models.Event, models.Event.visit_id == visits.c.id
+    ).where(models.Event.event_type.in_([t for types in CONVERSION_EVENTS.values() for t in types])).group_by(category, event_kind)
+
+    pages = select(category, literal('custom_conversions').label('kind'), func.count(models.PageView.id).label('n')).join(
+        models.PageView, models.PageView.visit_id == visits.c.id
+    ).where(or_(*[models.PageView.url.ilike(p) for p in CONVERSION_PAGE_PATTERNS])).group_by(category)
+
+    # Exit link clicks carry the session, not the visit id
+    links = select(category, literal('link_conversions').label('kind'), func.count(models.ExitLinkClick.id).label('n')).join(
+        models.ExitLinkClick,
+        (models.ExitLinkClick.project_id == visits.c.project_id) & (models.ExitLinkClick.session_id == visits.c.session_id)
+    ).where(or_(*[models.ExitLinkClick.url.ilike(p) for p in CONVERSION_LINK_PATTERNS])).group_by(category)
+
+    counts = {}
+    for source_category, kind, n in db.execute(union_all(
+        cart('cart_actions', func.count(models.CartAction.id)),
+        cart('cart_visits', func.count(func.distinct(models.CartAction.visit_id))),
+        events, pages, links
+    )):
+        counts.setdefault(source_category, {})[kind] = n
+    return counts
+
+
 @router.get("/{project_id}/sources")
 
 def get_traffic_sources(
@@ -851,86 +793,7 @@ def get_traffic_sources(
         # Apply traffic_sources filter BEFORE categorization if specified
         if traffic_sources:
             print(f"🎯 Applying traffic_sources filter to visits query: {traffic_sources}")
-            # Filter visits by referrer pattern that matches the requested source type
-            if traffic_sources == 'direct':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.in_([None, '', 'direct', 'null', 'undefined'])
-                )
-            elif traffic_sources == 'organic':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%google%') |
-                    models.Visit.referrer.ilike('%bing%') |
-                    models.Visit.referrer.ilike('%yahoo%') |
-                    models.Visit.referrer.ilike('%duckduckgo%') |
-                    models.Visit.referrer.ilike('%baidu%')
-                )
-            elif traffic_sources == 'social':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%facebook%') |
-                    models.Visit.referrer.ilike('%twitter%') |
-                    models.Visit.referrer.ilike('%instagram%') |
-                    models.Visit.referrer.ilike('%linkedin%') |
-                    models.Visit.referrer.ilike('%youtube%') |
-                    models.Visit.referrer.ilike('%tiktok%') |
-                    models.Visit.referrer.ilike('%pinterest%')
-                )
-            elif traffic_sources == 'ai':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%chatgpt%') |
-                    models.Visit.referrer.ilike('%claude%') |
-                    models.Visit.referrer.ilike('%gemini%') |
-                    models.Visit.referrer.ilike('%copilot%') |
-                    models.Visit.referrer.ilike('%perplexity%')
-                )
-            elif traffic_sources == 'email':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%mail%') |
-                    models.Visit.referrer.ilike('%gmail%') |
-                    models.Visit.referrer.ilike('%outlook%') |
-                    models.Visit.referrer.ilike('%yahoo.com%')
-                )
-            elif traffic_sources == 'paid':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%ads%') |
-                    models.Visit.referrer.ilike('%adwords%') |
-                    models.Visit.referrer.ilike('%facebook.com/tr%')
-                )
-            elif traffic_sources == 'utm':
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.ilike('%utm_%') |
-                    models.Visit.referrer.ilike('%campaign%')
-                )
-            elif traffic_sources == 'referral':
-                # For referral, exclude all other specific types
-                visits_query = visits_query.filter(
-                    models.Visit.referrer.notin_([None, '', 'direct', 'null', 'undefined']),
-                    ~models.Visit.referrer.ilike('%google%'),
-                    ~models.Visit.referrer.ilike('%bing%'),
-                    ~models.Visit.referrer.ilike('%yahoo%'),
-                    ~models.Visit.referrer.ilike('%duckduckgo%'),
-                    ~models.Visit.referrer.ilike('%baidu%'),
-                    ~models.Visit.referrer.ilike('%facebook%'),
-                    ~models.Visit.referrer.ilike('%twitter%'),
-                    ~models.Visit.referrer.ilike('%instagram%'),
-                    ~models.Visit.referrer.ilike('%linkedin%'),
-                    ~models.Visit.referrer.ilike('%youtube%'),
-                    ~models.Visit.referrer.ilike('%tiktok%'),
-                    ~models.Visit.referrer.ilike('%pinterest%'),
-                    ~models.Visit.referrer.ilike('%chatgpt%'),
-                    ~models.Visit.referrer.ilike('%claude%'),
-                    ~models.Visit.referrer.ilike('%gemini%'),
-                    ~models.Visit.referrer.ilike('%copilot%'),
-                    ~models.Visit.referrer.ilike('%perplexity%'),
-                    ~models.Visit.referrer.ilike('%mail%'),
-                    ~models.Visit.referrer.ilike('%gmail%'),
-                    ~models.Visit.referrer.ilike('%outlook%'),
-                    ~models.Visit.referrer.ilike('%yahoo.com%'),
-                    ~models.Visit.referrer.ilike('%ads%'),
-                    ~models.Visit.referrer.ilike('%adwords%'),
-                    ~models.Visit.referrer.ilike('%facebook.com/tr%'),
-                    ~models.Visit.referrer.ilike('%utm_%'),
-                    ~models.Visit.referrer.ilike('%campaign%')
-                )
+            visits_query = visits_query.filter(models.Visit.source_category == traffic_sources)
             print(f"🎯 Applied traffic_sources filter, visits query updated")
 
         # Apply custom filters using the unified filter function
@@ -1044,7 +907,7 @@ def get_traffic_sources(
 
         for visit in visits:
 
-            source_type = classify_source(visit.referrer)
+            source_type = visit.source_category
 
             source_groups[source_type]["count"] += 1
 
@@ -1067,6 +930,16 @@ def get_traffic_sources(
         # Store total visits from all sources for percentage calculation
         total_visits_all_sources = len(visits)
         
+        try:
+
+            conversions_by_source = _conversion_counts(db, visits_query)
+
+        except Exception as e:
+
+            print(f"⚠️ Error calculating conversions: {e}")
+
+            conversions_by_source = {}
+
         source_names = {
 
             "direct": "Direct Traffic",
@@ -1123,9 +996,8 @@ def get_traffic_sources(
 
                 engagement_rate = round(100 - bounce_rate, 1) if bounce_rate is not None else 0
 
-                # Calculate Conversions - Multiple conversion tracking methods
-
-                conversions = 0
+                # Calculate Conversions - visits with cart actions, purchase / signup / lead
+                # events, thank-you pages and checkout links, counted for all sources at once
 
                 conversion_details = {
                     'cart_actions': 0,
@@ -1133,93 +1005,22 @@ def get_traffic_sources(
                     'purchase_events': 0,
                     'signup_events': 0,
                     'lead_events': 0,
-                    'custom_conversions': 0
+                    'custom_conversions': 0,
+                    'link_conversions': 0
                 }
+                conversion_details.update(conversions_by_source.get(source_type, {}))
 
-                try:
-
-                    # Get visit IDs for this traffic source
-
-                    visit_ids = [v.id for v in data["visits"]]
-
-                    if visit_ids:
-
-                        # Method 1: Cart actions (add_to_cart, purchase_completed)
-
-                        cart_actions = db.query(models.CartAction).filter(
-                            models.CartAction.visit_id.in_(visit_ids),
-                            models.CartAction.action.in_(['add_to_cart', 'purchase_completed', 'checkout_started'])
-                        ).all()
-
-                        conversion_details['cart_actions'] = len(cart_actions)
-
-                        # Method 2: Custom events (more comprehensive)
-
-                        purchase_events = db.query(models.Event).filter(
-                            models.Event.visit_id.in_(visit_ids),
-                            models.Event.event_type.in_(['purchase', 'order_completed', 'payment_successful'])
-                        ).count()
-
-                        conversion_details['purchase_events'] = purchase_events
-
-                        signup_events = db.query(models.Event).filter(
-                            models.Event.visit_id.in_(visit_ids),
-                            models.Event.event_type.in_(['signup', 'register', 'user_registered'])
-                        ).count()
-
-                        conversion_details['signup_events'] = signup_events
-
-                        lead_events = db.query(models.Event).filter(
-                            models.Event.visit_id.in_(visit_ids),
-                            models.Event.event_type.in_(['lead', 'form_submit', 'contact_submit', 'newsletter_signup'])
-                        ).count()
-
-                        conversion_details['lead_events'] = lead_events
-
-                        # Method 3: Page view based conversions (thank you pages, confirmation pages)
-
-                        conversion_pages = db.query(models.PageView).filter(
-                            models.PageView.visit_id.in_(visit_ids),
-                            models.PageView.url.ilike('%thank%') |
-                            models.PageView.url.ilike('%confirm%') |
-                            models.PageView.url.ilike('%success%') |
-                            models.PageView.url.ilike('%complete%') |
-                            models.PageView.url.ilike('%checkout%')
-                        ).count()
-
-                        conversion_details['custom_conversions'] = conversion_pages
-
-                        # Method 4: Exit link clicks to external conversion sites
-
-                        conversion_link_clicks = db.query(models.ExitLinkClick).filter(
-                            models.ExitLinkClick.visit_id.in_(visit_ids),
-                            models.ExitLinkClick.url.ilike('%payment%') |
-                            models.ExitLinkClick.url.ilike('%checkout%') |
-                            models.ExitLinkClick.url.ilike('%buy%') |
-                            models.ExitLinkClick.url.ilike('%order%')
-                        ).count()
-
-                        conversion_details['link_conversions'] = conversion_link_clicks
-
-                        # Calculate total conversions (unique visits with any conversion activity)
-
-                        all_conversion_activities = (
-                            len(set([ca.visit_id for ca in cart_actions])) +
-                            purchase_events + signup_events + lead_events +
-                            conversion_pages + conversion_link_clicks
-                        )
-
-                        conversions = all_conversion_activities
-
-                        print(f"🎯 Conversion details for {source_type}:")
-                        for conversion_type, count in conversion_details.items():
-                            print(f"   {conversion_type}: {count}")
-                        print(f"   Total conversions: {conversions}")
+                # Cart actions count once per visit towards the total; the detail keeps the row count
+                cart_visits = conversion_details.pop('cart_visits', 0)
 
-                except Exception as e:
-                    print(f"⚠️ Error calculating conversions for {source_type}: {e}")
+                conversions = cart_visits + sum(
+                    count for conversion_type, count in conversion_details.items() if conversion_type != 'cart_actions'
+                )
 
-                    conversions = 0
+                print(f"🎯 Conversion details for {source_type}:")
+                for conversion_type, count in conversion_details.items():
+                    print(f"   {conversion_type}: {count}")
+                print(f"   Total conversions: {conversions}")
 
                 # Calculate Trend - Compare with previous period
 
@@ -1252,21 +1053,9 @@ def get_traffic_sources(
                         if filter_params:
                             prev_visits_query = apply_filters_to_query(prev_visits_query, filter_params, db)
 
-                        prev_visits = prev_visits_query.all()
-
-                        # Categorize previous period visits
-
-                        prev_source_groups = {
-                            "direct": {"count": 0}, "organic": {"count": 0}, "social": {"count": 0},
-                            "referral": {"count": 0}, "email": {"count": 0}, "paid": {"count": 0},
-                            "ai": {"count": 0}, "utm": {"count": 0}
-                        }
-
-                        for prev_visit in prev_visits:
-                            prev_source_type = classify_source(prev_visit.referrer)
-                            prev_source_groups[prev_source_type]["count"] += 1
-
-                        prev_count = prev_source_groups[source_type]["count"]
+                        prev_count = prev_visits_query.filter(
+                            models.Visit.source_category == source_type
+                        ).count()
                         current_count = data["count"]
 
                         # Calculate trend percentage
@@ -1467,21 +1256,10 @@ def get_traffic_source_detail(
         if filter_params:
 
             visits_query = apply_filters_to_query(visits_query, filter_params, db)
-        all_visits = visits_query.all()
 
-        print(f"📊 Found {len(all_visits)} total visits in date range with engagement and page views filters")
+        # Filter visits by the source category stored at ingest
 
-        # Filter visits by source type using unified classification
-
-        matching_visits = []
-
-        for visit in all_visits:
-
-            classified_source = classify_source(visit.referrer)
-
-            if classified_source == source_type:
-
-                matching_visits.append(visit)
+        matching_visits = visits_query.filter(models.Visit.source_category == source_type).all()
 
         print(f"📊 Found {len(matching_visits)} matching visits for {source_type}")
 
@@ -1677,6 +1455,8 @@ def get_referrers(project_id: int, db: Session = Depends(get_db)):
 
         models.Visit.referrer,
 
+        models.Visit.referrer_domain,
+
         func.count(models.Visit.id).label('count')
 
     ).filter(
@@ -1685,9 +1465,9 @@ def get_referrers(project_id: int, db: Session = Depends(get_db)):
 
         models.Visit.referrer.isnot(None)
 
-    ).group_by(models.Visit.referrer).order_by(desc('count')).limit(20).all()
+    ).group_by(models.Visit.referrer, models.Visit.referrer_domain).order_by(desc('count')).limit(20).all()
 
-    return [{"referrer": r[0], "count": r[1]} for r in referrers]
+    return [{"referrer": r[0], "domain": r[1], "count": r[2]} for r in referrers]
 
 
 
@@ -1947,11 +1727,11 @@ def get_exit_links(
 
     
 
-    # Traffic sources filter (using referrer field from Visit) (only if Visit data exists)
+    # Traffic sources filter (source category stored on the Visit) (only if Visit data exists)
 
     if traffic_sources:
 
-        query = query.filter(models.Visit.referrer.like(f'%{traffic_sources}%'))
+        query = query.filter(models.Visit.source_category == traffic_sources)
 
         print(f"🔍 Exit Links - Applied traffic sources filter: {traffic_sources}")
 
@@ -2011,39 +1791,17 @@ def get_exit_links(
 
     if engagement_sessions_per_visitor is not None:
 
-        # This is a complex filter that requires counting sessions per visitor
-
-        # We'll need to use a subquery to count sessions per visitor
-
-        from sqlalchemy import func
-
-        
-
-        # Create a subquery to count sessions per visitor
-
-        sessions_per_visitor_subquery = db.query(
-
-            models.Visit.visitor_id,
-
-            func.count(models.Visit.id).label('session_count')
-
-        ).filter(
-
-            models.Visit.project_id == project_id
+        # Sessions per visitor come from the visitors table; LEFT JOIN to include orphaned exit links
 
-        ).group_by(models.Visit.visitor_id).subquery()
+        query = query.outerjoin(models.Visitor, and_(
 
-        
-
-        # LEFT JOIN with subquery to include orphaned exit links
-
-        query = query.outerjoin(
+            models.Visitor.project_id == models.ExitLinkClick.project_id,
 
-            sessions_per_visitor_subquery,
+            models.Visitor.visitor_id == models.ExitLinkClick.visitor_id
 
-            models.ExitLinkClick.visitor_id == sessions_per_visitor_subquery.c.visitor_id
+        ))
 
-        )
+        session_count = models.Visitor.session_count
 
         
 
@@ -2051,29 +1809,29 @@ def get_exit_links(
 
         if engagement_sessions_per_visitor_operator == 'equals':
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count == engagement_sessions_per_visitor)
+            query = query.filter(session_count == engagement_sessions_per_visitor)
 
         elif engagement_sessions_per_visitor_operator == 'greater_than':
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count > engagement_sessions_per_visitor)
+            query = query.filter(session_count > engagement_sessions_per_visitor)
 
         elif engagement_sessions_per_visitor_operator == 'less_than':
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count < engagement_sessions_per_visitor)
+            query = query.filter(session_count < engagement_sessions_per_visitor)
 
         elif engagement_sessions_per_visitor_operator == 'greater_than_or_equal':
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count >= engagement_sessions_per_visitor)
+            query = query.filter(session_count >= engagement_sessions_per_visitor)
 
         elif engagement_sessions_per_visitor_operator == 'less_than_or_equal':
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count <= engagement_sessions_per_visitor)
+            query = query.filter(session_count <= engagement_sessions_per_visitor)
 
         else:
 
             # Default to equals if no operator specified
 
-            query = query.filter(sessions_per_visitor_subquery.c.session_count == engagement_sessions_per_visitor)
+            query = query.filter(session_count == engagement_sessions_per_visitor)
 
         
 
@@ -2085,25 +1843,17 @@ def get_exit_links(
 
     if page_views_per_session is not None:
 
-        # This is a complex filter that requires counting page views per session
-
-        # We'll need to use a subquery to count page views per session
+        # Page views per session, summed from the counters kept on the visit rows
 
         from sqlalchemy import func
 
         
 
-        # Create a subquery to count page views per session
-
         page_views_per_session_subquery = db.query(
 
             models.Visit.session_id,
 
-            func.count(models.PageView.id).label('page_view_count')
-
-        ).join(
-
-            models.PageView, models.Visit.id == models.PageView.visit_id
+            func.sum(models.Visit.page_views_count).label('page_view_count')
 
         ).filter(
 
@@ -2291,7 +2041,7 @@ def get_exit_links(
         exit_pages_query = exit_pages_query.filter(models.Visit.device.like(f'%{device}%'))
     
     if traffic_sources:
-        exit_pages_query = exit_pages_query.filter(models.Visit.referrer.like(f'%{traffic_sources}%'))
+        exit_pages_query = exit_pages_query.filter(models.Visit.source_category == traffic_sources)
     
     if entry_page:
         exit_pages_query = exit_pages_query.filter(models.Visit.entry_page.like(f'%{entry_page}%'))
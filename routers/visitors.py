@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 
 from sqlalchemy.orm import Session
 
-from sqlalchemy import desc, func
+from sqlalchemy import and_, desc, func, or_
 
 from database import get_db
 
@@ -20,6 +20,10 @@ from pytz import timezone
 
 from urllib.parse import unquote_plus
 
+import base64
+
+import os
+
 
 # Local date normalization function to avoid circular dependency
 def normalize_date_range(start_date: str | None, end_date: str | None):
@@ -71,6 +75,44 @@ router = APIRouter()
 
 security = HTTPBearer(auto_error=False)
 
+# Activity view pages: default size when no limit is given, and the hard cap
+ACTIVITY_PAGE_SIZE = int(os.getenv("ACTIVITY_PAGE_SIZE", "100"))
+ACTIVITY_MAX_PAGE_SIZE = int(os.getenv("ACTIVITY_MAX_PAGE_SIZE", "500"))
+
+
+def _encode_cursor(visit) -> str:
+    """Opaque keyset cursor for the (visited_at, id) position after `visit`"""
+    raw = f"{visit.visited_at.isoformat()}|{visit.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    """(visited_at, id) from a cursor made by _encode_cursor; 400 if it is not one"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        visited_at, visit_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(visited_at), int(visit_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _join_visitor(query):
+    """Join each visit to its row in the visitors table"""
+    return query.join(models.Visitor, and_(
+        models.Visitor.project_id == models.Visit.project_id,
+        models.Visitor.visitor_id == models.Visit.visitor_id
+    ))
+
+
+def _session_count_condition(operator: str, sessions_count: int):
+    """Condition on the visitor's all-time session count, or None for an unknown operator"""
+    if operator == 'equals':
+        return models.Visitor.session_count == sessions_count
+    if operator == 'greater_than':
+        return models.Visitor.session_count > sessions_count
+    if operator == 'less_than':
+        return models.Visitor.session_count < sessions_count
+    return None
 
 
 @router.get("/countries")
@@ -339,6 +381,10 @@ def get_visitor_activity_view(
 
     limit: Optional[int] = None,
 
+    cursor: Optional[str] = None,
+
+    response: Response = None,
+
     # Filter parameters
     country_city: Optional[str] = None,
     traffic_sources: Optional[str] = None,
@@ -375,7 +421,14 @@ def get_visitor_activity_view(
 
 ):
 
-    """Dedicated endpoint for Visitor Activity Page with date filtering"""
+    """
+    Dedicated endpoint for Visitor Activity Page with date filtering.
+
+    Visits are returned newest first, one page at a time: `limit` defaults to
+    ACTIVITY_PAGE_SIZE and is capped at ACTIVITY_MAX_PAGE_SIZE. When more
+    visits match, the `X-Next-Cursor` response header carries an opaque
+    cursor; pass it back as `cursor` to get the next page.
+    """
 
     try:
 
@@ -435,12 +488,6 @@ def get_visitor_activity_view(
 
                 )
 
-                # Check how many records match the filter
-
-                count = query.count()
-
-                print(f"📊 Records after date filtering: {count}")
-
             except ValueError as e:
 
                 print(f"❌ Date parsing error: {e}")
@@ -471,24 +518,9 @@ def get_visitor_activity_view(
                 # Country only
                 query = query.filter(models.Visit.country == country_city)
         
-        # Traffic sources filter
+        # Traffic sources filter (source category stored on the visit at ingest)
         if traffic_sources:
-            if traffic_sources == 'direct':
-                query = query.filter(models.Visit.referrer == 'direct')
-            elif traffic_sources == 'organic':
-                query = query.filter(models.Visit.referrer.like('%google%') | 
-                                       models.Visit.referrer.like('%bing%') | 
-                                       models.Visit.referrer.like('%yahoo%'))
-            elif traffic_sources == 'referral':
-                query = query.filter(models.Visit.referrer != 'direct',
-                                       ~models.Visit.referrer.like('%google%'),
-                                       ~models.Visit.referrer.like('%bing%'),
-                                       ~models.Visit.referrer.like('%yahoo%'))
-            elif traffic_sources == 'social':
-                query = query.filter(models.Visit.referrer.like('%facebook%') | 
-                                       models.Visit.referrer.like('%twitter%') | 
-                                       models.Visit.referrer.like('%linkedin%') |
-                                       models.Visit.referrer.like('%instagram%'))
+            query = query.filter(models.Visit.source_category == traffic_sources)
         
         # Page filters
         if page_page:
@@ -599,104 +631,56 @@ def get_visitor_activity_view(
             try:
                 page_views_count = int(page_views_per_session)
                 
-                # Subquery to count page views per visit
-                page_views_subquery = db.query(
-                    models.PageView.visit_id,
-                    func.count(models.PageView.id).label('page_views_count')
-                ).group_by(models.PageView.visit_id).subquery()
-                
-                # Join with the subquery
-                query = query.join(page_views_subquery, models.Visit.id == page_views_subquery.c.visit_id)
-                
+                # Page views per visit are kept on the visit row
                 if page_views_per_session_operator == 'equals':
-                    query = query.filter(page_views_subquery.c.page_views_count == page_views_count)
+                    query = query.filter(models.Visit.page_views_count == page_views_count)
                 elif page_views_per_session_operator == 'greater_than':
-                    query = query.filter(page_views_subquery.c.page_views_count > page_views_count)
+                    query = query.filter(models.Visit.page_views_count > page_views_count)
                 elif page_views_per_session_operator == 'less_than':
-                    query = query.filter(page_views_subquery.c.page_views_count < page_views_count)
+                    query = query.filter(models.Visit.page_views_count < page_views_count)
                 print(f"🔍 Applied page views filter: {page_views_per_session_operator} {page_views_count}")
             except ValueError:
                 print(f"❌ Invalid page views value: {page_views_per_session}")
         
-        # Sessions per visitor filter  
-        if sessions_per_visitor and sessions_per_visitor_operator:
-            try:
-                sessions_count = int(sessions_per_visitor)
-                if sessions_per_visitor_operator == 'equals':
-                    # Subquery for session count per visitor
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count == sessions_count)
-                elif sessions_per_visitor_operator == 'greater_than':
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count > sessions_count)
-                elif sessions_per_visitor_operator == 'less_than':
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count < sessions_count)
-                print(f"🔍 Applied sessions per visitor filter: {sessions_per_visitor_operator} {sessions_count}")
-            except ValueError:
-                print(f"❌ Invalid sessions per visitor value: {sessions_per_visitor}")
-        
-        # Engagement sessions per visitor filter  
-        if engagement_sessions_per_visitor and engagement_sessions_per_visitor_operator:
-            try:
-                sessions_count = int(engagement_sessions_per_visitor)
-                if engagement_sessions_per_visitor_operator == 'equals':
-                    # Subquery for session count per visitor
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count == sessions_count)
-                elif engagement_sessions_per_visitor_operator == 'greater_than':
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count > sessions_count)
-                elif engagement_sessions_per_visitor_operator == 'less_than':
-                    subquery = db.query(models.Visit.visitor_id,
-                                     func.count(models.Visit.id).label('session_count')) \
-                                 .filter(models.Visit.project_id == project_id) \
-                                 .group_by(models.Visit.visitor_id) \
-                                 .subquery()
-                    query = query.join(subquery, models.Visit.visitor_id == subquery.c.visitor_id) \
-                             .filter(subquery.c.session_count < sessions_count)
-                print(f"🔍 Applied engagement sessions per visitor filter: {engagement_sessions_per_visitor_operator} {sessions_count}")
-            except ValueError:
-                print(f"❌ Invalid engagement sessions per visitor value: {engagement_sessions_per_visitor}")
+        # Sessions per visitor filters (both read the visitors table)
+        session_count_filters = []
+        for label, value, operator in (
+            ("sessions per visitor", sessions_per_visitor, sessions_per_visitor_operator),
+            ("engagement sessions per visitor", engagement_sessions_per_visitor, engagement_sessions_per_visitor_operator),
+        ):
+            if value and operator:
+                try:
+                    condition = _session_count_condition(operator, int(value))
+                except ValueError:
+                    print(f"❌ Invalid {label} value: {value}")
+                    continue
+                if condition is not None:
+                    session_count_filters.append(condition)
+                    print(f"🔍 Applied {label} filter: {operator} {value}")
+        if session_count_filters:
+            query = _join_visitor(query).filter(*session_count_filters)
         
 
-        # Get all visits filtered by date range and other filters - apply limit only if provided
-        if limit is not None:
-
-            visits = query.order_by(desc(models.Visit.visited_at)).limit(limit).all()
+        # Keyset pagination on (visited_at, id), newest first; the page size is capped server-side
+        page_size = min(limit or ACTIVITY_PAGE_SIZE, ACTIVITY_MAX_PAGE_SIZE)
+        if page_size < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
 
-        else:
+        if cursor:
+            cursor_at, cursor_id = _decode_cursor(cursor)
+            query = query.filter(or_(
+                models.Visit.visited_at < cursor_at,
+                and_(models.Visit.visited_at == cursor_at, models.Visit.id < cursor_id)
+            ))
 
-            visits = query.order_by(desc(models.Visit.visited_at)).all()
+        visits = query.order_by(desc(models.Visit.visited_at), desc(models.Visit.id)).limit(page_size + 1).all()
 
-        
+        has_more = len(visits) > page_size
+        visits = visits[:page_size]
+        if has_more and response is not None:
+            response.headers["X-Next-Cursor"] = _encode_cursor(visits[-1])
 
-        print(f"🔍 Backend: Returning {len(visits)} visits (limit: {limit})")
+        print(f"🔍 Backend: Returning {len(visits)} visits (page size: {page_size}, more: {has_more})")
 
         
 
@@ -1523,7 +1507,7 @@ def get_map_view(
         query = query.filter(models.Visit.os == os_filter)
     
     if traffic_sources:
-        query = query.filter(models.Visit.referrer.like(f'%{traffic_sources}%'))
+        query = query.filter(models.Visit.source_category == traffic_sources)
     
     if page_page:
         query = query.filter(
@@ -1539,31 +1523,23 @@ def get_map_view(
         try:
             page_views_count = int(page_views_per_session)
             
-            # Subquery to count page views per visit
-            page_views_subquery = db.query(
-                models.PageView.visit_id,
-                func.count(models.PageView.id).label('page_views_count')
-            ).group_by(models.PageView.visit_id).subquery()
-            
-            # Join with the subquery
-            query = query.join(page_views_subquery, models.Visit.id == page_views_subquery.c.visit_id)
-            
+            # Page views per visit are kept on the visit row
             if page_views_per_session_operator == 'equals':
-                query = query.filter(page_views_subquery.c.page_views_count == page_views_count)
+                query = query.filter(models.Visit.page_views_count == page_views_count)
             elif page_views_per_session_operator == 'greater_than':
-                query = query.filter(page_views_subquery.c.page_views_count > page_views_count)
+                query = query.filter(models.Visit.page_views_count > page_views_count)
             elif page_views_per_session_operator == 'less_than':
-                query = query.filter(page_views_subquery.c.page_views_count < page_views_count)
+                query = query.filter(models.Visit.page_views_count < page_views_count)
             print(f" Applied page views filter: {page_views_per_session_operator} {page_views_count}")
         except ValueError:
             print(f" Invalid page views value: {page_views_per_session}")
     
     # Handle legacy page_views_per_session range filters (for backward compatibility)
     elif page_views_per_session_min is not None:
-        query = query.filter(models.Visit.page_views >= page_views_per_session_min)
+        query = query.filter(models.Visit.page_views_count >= page_views_per_session_min)
     
     if page_views_per_session_max is not None:
-        query = query.filter(models.Visit.page_views <= page_views_per_session_max)
+        query = query.filter(models.Visit.page_views_count <= page_views_per_session_max)
     
     # Handle engagement_session_length range filters
     if engagement_session_length_min is not None:
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 
 
@@ -6,7 +6,7 @@ from datetime import datetime
 
 
 
-from typing import Optional, List
+from typing import Annotated, Optional, List, Dict, Any, Union, Literal
 
 
 
@@ -635,3 +635,21 @@ class TeamInviteAccept(BaseModel):
 
 
 
+
+
+# Batch Tracking Schemas
+
+# Stored id, or a ref handed out while the beacon creating the row is still in the event log
+TrackingId = Annotated[Union[int, str], Field(union_mode="left_to_right")]
+
+
+class BatchEvent(BaseModel):
+    type: Literal["visit", "pageview", "pageview_update", "event", "cart_action", "exit", "exit_link"]
+    temp_id: Optional[str] = None  # client-side id for a visit/pageview created by this entry
+    visit_id: Optional[Union[int, str]] = None  # stored id, or a temp id from an earlier entry
+    pageview_id: Optional[Union[int, str]] = None
+    data: Dict[str, Any] = {}
+
+
+class BatchRequest(BaseModel):
+    events: List[BatchEvent]
@@ -0,0 +1,60 @@
+import asyncio
+
+from admission import AdmissionController, AdmissionMiddleware
+
+
+async def _ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def _call(middleware, path):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": []}
+    asyncio.run(middleware(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"])
+
+
+def test_token_bucket_sheds_per_project():
+    controller = AdmissionController(rate=1, burst=2, max_in_flight=100, max_queue=100, enabled=True)
+    middleware = AdmissionMiddleware(_ok_app, controller)
+
+    assert _call(middleware, "/api/analytics/1/event/5")[0] == 200
+    assert _call(middleware, "/api/analytics/1/event/5")[0] == 200
+    status, headers = _call(middleware, "/api/analytics/1/event/5")
+    assert status == 429
+    assert int(headers[b"retry-after"]) >= 1
+
+    # Other projects and non-tracking routes are unaffected
+    assert _call(middleware, "/api/analytics/2/batch")[0] == 200
+    assert _call(middleware, "/api/analytics/1/summary")[0] == 200
+
+    metrics = controller.metrics()
+    assert metrics["admitted"] == 3
+    assert metrics["shed"] == {"project_rate": 1}
+    assert metrics["top_shed_projects"] == {1: 1}
+    assert metrics["in_flight"] == 0
+
+
+def test_queue_depth_and_in_flight_limits():
+    depth = {"value": 0}
+    controller = AdmissionController(
+        rate=1000, burst=1000, max_in_flight=1, max_queue=10,
+        queue_depth=lambda: depth["value"], enabled=True,
+    )
+
+    assert controller.admit(1) is None
+    assert controller.admit(1) == ("in_flight", controller.retry_after)
+    controller.release()
+
+    depth["value"] = 10
+    assert controller.admit(1)[0] == "queue_depth"
+    assert controller.metrics()["shed"] == {"in_flight": 1, "queue_depth": 1}
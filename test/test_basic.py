@@ -25,3 +25,21 @@ async def test_database_connection():
         assert result.fetchone()[0] == 1
     finally:
         db.close()
+
+
+@pytest.mark.asyncio
+async def test_tracking_db_uses_sync_engine_on_sqlite():
+    """SQLite tracking requests stay on the sync driver unless TRACKING_ASYNC is set"""
+    import database
+    from sqlalchemy import text
+
+    if database.TRACKING_ASYNC != "auto" or not database.DATABASE_URL.startswith("sqlite"):
+        pytest.skip("only meaningful with the default setting on SQLite")
+
+    dependency = database.get_tracking_db()
+    db = await dependency.__anext__()
+    try:
+        assert isinstance(db, database.ThreadedSession)
+        assert await db.scalar(text("SELECT 1")) == 1
+    finally:
+        await dependency.aclose()
@@ -0,0 +1,31 @@
+from bot_filter import BotClassifier, IPRanges
+
+BROWSER = {
+    "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+    "accept-language": "en-GB,en;q=0.9",
+    "origin": "https://shop.example.com",
+}
+
+
+def test_ip_ranges_merge_and_match():
+    ranges = IPRanges(["10.0.0.0/24", "10.0.1.0/24", "2001:db8::/32", "not-a-cidr"])
+    assert len(ranges) == 2
+    assert "10.0.1.200" in ranges
+    assert "10.0.2.1" not in ranges
+    assert "2001:db8::1" in ranges
+    assert "garbage" not in ranges
+
+
+def test_classifier_verdicts():
+    classifier = BotClassifier(ip_ranges=IPRanges(["34.64.0.0/10"]), enabled=True)
+
+    assert classifier.classify(BROWSER, "81.2.69.160") is None
+    assert classifier.classify({**BROWSER, "user-agent": "curl/8.5.0"}, "81.2.69.160") == "user_agent"
+    assert classifier.classify({**BROWSER, "user-agent": ""}, "81.2.69.160") == "user_agent"
+    assert classifier.classify({"user-agent": BROWSER["user-agent"]}, "81.2.69.160") == "headers"
+    assert classifier.classify({**BROWSER, "sec-purpose": "prefetch"}, "81.2.69.160") == "headers"
+    assert classifier.classify(BROWSER, "34.100.1.1") == "ip"
+
+    # Second request with the same UA is answered from the verdict cache
+    classifier.classify({**BROWSER, "user-agent": "curl/8.5.0"}, None)
+    assert classifier.ua_verdicts.hits >= 1
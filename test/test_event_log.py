@@ -0,0 +1,221 @@
+import os
+import uuid
+from datetime import datetime
+
+import models
+from database import SessionLocal
+from event_log import EventLog, LogConsumer, replay
+from ingestion import IngestionBuffer
+
+
+def _project_id():
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Log", domain="example.com", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def test_segments_rotate_survive_torn_writes_and_compact(tmp_path):
+    log = EventLog(str(tmp_path), segment_bytes=200).open(start_sync_thread=False)
+    for i in range(10):
+        log.append({"stage": "rows", "args": ["events", {"i": i, "at": datetime(2026, 1, 1)}], "kwargs": {}})
+    log.sync()
+
+    records = list(log.read())
+    assert [r["args"][1]["i"] for _, r in records] == list(range(10))
+    assert records[0][1]["args"][1]["at"] == datetime(2026, 1, 1)
+    segments = log.segment_files()
+    assert len(segments) > 1
+    log.close()
+
+    # A crash mid-write leaves a partial line in the live segment
+    with open(segments[-1][1], "ab") as f:
+        f.write(b'{"stage": "ro')
+    log = EventLog(str(tmp_path), segment_bytes=200).open(start_sync_thread=False)
+    assert len(list(log.read())) == 10
+
+    log.compact(records[4][0])
+    archived = [number for number, _, is_archive in log.segment_files() if is_archive]
+    assert archived and max(archived) <= records[4][0][0]
+    assert len(list(log.read())) == 10
+    log.close()
+
+
+def test_consumer_applies_log_and_checkpoints_with_the_rows(tmp_path):
+    project_id = _project_id()
+    log = EventLog(str(tmp_path)).open(start_sync_thread=False)
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.attach_log(log)
+    consumer = LogConsumer(log, buf)
+
+    for i in range(5):
+        buf.add(models.ExitLinkClick, {"project_id": project_id, "url": f"https://out.example.com/{i}", "clicked_at": datetime.utcnow()})
+    assert buf.pending() == 0
+    log.sync()
+
+    assert consumer.consume() == 5
+    buf.flush()
+
+    db = SessionLocal()
+    try:
+        assert db.query(models.ExitLinkClick).filter_by(project_id=project_id).count() == 5
+        checkpoint = db.get(models.EventLogCheckpoint, log.name)
+        assert (checkpoint.segment, checkpoint.offset) == log.durable_position()
+    finally:
+        db.close()
+
+    # A restarted consumer resumes after the checkpoint
+    restarted = LogConsumer(log, IngestionBuffer(batch_size=1000, flush_interval=60))
+    assert restarted.consume() == 0
+    log.close()
+
+
+def test_consumer_rewinds_when_the_database_is_down(tmp_path):
+    import pytest
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+
+    project_id = _project_id()
+    log = EventLog(str(tmp_path)).open(start_sync_thread=False)
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.attach_log(log)
+    consumer = LogConsumer(log, buf)
+
+    for i in range(6):
+        buf.add(models.ExitLinkClick, {"project_id": project_id, "url": f"https://out.example.com/{i}", "clicked_at": datetime.utcnow()})
+    log.sync()
+
+    start = consumer.position
+    consumer.session_factory = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path}/missing/down.db"))
+    with pytest.raises(OperationalError):
+        consumer.consume()
+    assert consumer.position == start
+    assert buf.pending() == 0
+
+    # Once the database is back the same records are applied, none skipped
+    consumer.session_factory = SessionLocal
+    assert consumer.consume() == 6
+    db = SessionLocal()
+    try:
+        assert db.query(models.ExitLinkClick).filter_by(project_id=project_id).count() == 6
+    finally:
+        db.close()
+    log.close()
+
+
+def test_tracking_beacons_reach_the_log_before_the_database(tmp_path, monkeypatch):
+    from collections import OrderedDict
+
+    from fastapi.testclient import TestClient
+
+    from ingestion import buffer
+    from main import app
+    from routers.analytics import logged_beacons
+
+    project_id = _project_id()
+    log = EventLog(str(tmp_path)).open()
+    monkeypatch.setattr(buffer, "_stages", OrderedDict(buffer._stages))
+    monkeypatch.setattr(buffer, "log", log)
+    consumer = LogConsumer(log, buffer, beacons=logged_beacons)
+    client = TestClient(app, headers={"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) Chrome/126.0 Safari/537.36", "Accept-Language": "en"})
+
+    def visits():
+        db = SessionLocal()
+        try:
+            return db.query(models.Visit).filter_by(project_id=project_id).all()
+        finally:
+            db.close()
+
+    session_id = uuid.uuid4().hex
+    res = client.post(f"/api/analytics/{project_id}/batch", json={"events": [
+        {"type": "visit", "temp_id": "v1", "data": {"visitor_id": "a", "session_id": session_id, "entry_page": "https://example.com/", "referrer": "direct"}},
+        {"type": "pageview", "temp_id": "p1", "visit_id": "v1", "data": {"url": "https://example.com/", "title": "Home"}},
+        {"type": "event", "visit_id": "v1", "data": {"event_type": "signup"}},
+    ]})
+    assert res.status_code == 200
+    ids = res.json()["ids"]
+    assert ids["v1"].startswith("v-") and ids["p1"].startswith("p-")
+    assert visits() == []
+
+    assert consumer.consume() == 1
+    [visit] = visits()
+    assert (visit.session_id, visit.page_views_count, visit.events_count) == (session_id, 1, 1)
+
+    # Later beacons use the refs in place of ids
+    res = client.put(f"/api/analytics/{project_id}/pageview/{ids['v1']}/update/{ids['p1']}", json={"time_spent": 42})
+    assert res.status_code == 200
+    res = client.post(f"/api/analytics/{project_id}/event/{ids['v1']}", json={"event_type": "purchase"})
+    assert res.status_code == 200
+    # A ref no consumer has applied yet waits at the back of the log
+    client.post(f"/api/analytics/{project_id}/event/v-{uuid.uuid4().hex}", json={"event_type": "purchase"})
+    assert consumer.consume() == 3
+
+    db = SessionLocal()
+    try:
+        assert db.query(models.PageView).filter_by(visit_id=visit.id).one().time_spent == 42
+        assert db.query(models.Event).filter_by(visit_id=visit.id).count() == 2
+        checkpoint = db.get(models.EventLogCheckpoint, log.name)
+        assert (checkpoint.segment, checkpoint.offset) == consumer.position
+    finally:
+        db.close()
+    log.sync()
+    assert [record["entries"][0]["type"] for _, record in log.read(consumer.position)] == ["event"]
+    log.close()
+
+
+def test_replay_rebuilds_rows_from_the_log(tmp_path):
+    project_id = _project_id()
+    log = EventLog(str(tmp_path)).open(start_sync_thread=False)
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.attach_log(log)
+
+    visit_id = 900000 + project_id
+    buf.journal(models.Visit, {"id": visit_id, "project_id": project_id, "visitor_id": "v", "session_id": uuid.uuid4().hex, "visited_at": datetime.utcnow()})
+    buf.journal_update(models.Visit, visit_id, {"exit_page": "https://example.com/bye"})
+    buf.add(models.Event, {"visit_id": visit_id, "event_type": "product_view", "event_data": {}, "url": "https://example.com/p", "timestamp": datetime.utcnow()})
+    log.close()
+
+    counts = replay(str(tmp_path))
+    assert counts["rows"] == 1 and counts["updates"] == 1 and counts["stage_items"] == 1
+
+    db = SessionLocal()
+    try:
+        assert db.get(models.Visit, visit_id).exit_page == "https://example.com/bye"
+        assert db.query(models.Event).filter_by(visit_id=visit_id).count() == 1
+    finally:
+        db.close()
+
+
+def test_compact_command_archives_consumed_segments_offline(tmp_path, monkeypatch):
+    import sys
+    import event_log
+
+    log = EventLog(str(tmp_path), segment_bytes=200).open(start_sync_thread=False)
+    for i in range(10):
+        log.append({"stage": "rows", "args": ["events", {"i": i}], "kwargs": {}})
+    log.sync()
+    end = log.durable_position()
+    log.close()
+    segments = [number for number, _, _ in log.segment_files()]
+    assert len(segments) > 2
+
+    db = SessionLocal()
+    try:
+        db.merge(models.EventLogCheckpoint(name=log.name, segment=end[0], offset=end[1]))
+        db.commit()
+    finally:
+        db.close()
+
+    monkeypatch.setattr(sys, "argv", ["event_log.py", "compact", "--dir", str(tmp_path)])
+    event_log.main()
+
+    # Everything but the newest segment (where a writer would resume) is archived
+    files = EventLog(str(tmp_path)).segment_files()
+    assert [number for number, _, archived in files if archived] == segments[:-1]
+    assert [number for number, _, archived in files if not archived] == segments[-1:]
+    assert len(list(EventLog(str(tmp_path)).read(end=end))) == 10
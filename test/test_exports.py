@@ -0,0 +1,70 @@
+"""
+Memory budget for the streaming CSV export.
+
+A child process seeds EXPORT_TEST_ROWS (default 1,000,000) visits into a
+throwaway SQLite file and streams them through exports.csv_stream; the growth
+of its peak RSS over the export must stay under EXPORT_TEST_BUDGET_MB. The
+export is measured in its own process so the test runner's own high-water mark
+does not hide it.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+ROWS = int(os.getenv("EXPORT_TEST_ROWS", "1000000"))
+BUDGET_MB = int(os.getenv("EXPORT_TEST_BUDGET_MB", "48"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = textwrap.dedent("""
+    import resource, sys
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    import exports
+    import models
+    from database import Base
+
+    path, rows = sys.argv[1], int(sys.argv[2])
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # only the export's index, so seeding stays fast
+        for index in models.Visit.__table__.indexes:
+            if index.name != "ix_visits_project_visited_at":
+                index.drop(conn)
+        conn.execute(text("INSERT INTO projects (id, name, domain, tracking_code) VALUES (1, 'Export', 'example.com', 'export')"))
+        conn.execute(text('''
+            WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < :n)
+            INSERT INTO visits (project_id, visitor_id, session_id, country, device, referrer, source_category, entry_page,
+                                session_duration, visited_at)
+            SELECT 1, 'v' || (i % 5000), 's' || i, 'IN', 'desktop', 'https://google.com/', 'organic', 'https://example.com/',
+                   i % 600, datetime('2026-01-01', '+' || i || ' seconds')
+            FROM seq
+        '''), {"n": rows})
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    chunks = exports.iter_chunks(exports.export_query("visits", 1), session_factory=sessionmaker(bind=engine))
+    lines = size = 0
+    for block in exports.csv_stream("visits", chunks):
+        lines += block.count(b"\\n")
+        size += len(block)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(lines, size, (after - before) / 1024)
+""")
+
+
+def test_csv_export_of_a_million_rows_stays_within_budget(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tmp_path / 'unused.db'}")
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(tmp_path / "export.db"), str(ROWS)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    lines, size, growth_mb = result.stdout.split()
+
+    assert int(lines) == ROWS + 1
+    assert int(size) > ROWS * 50
+    assert float(growth_mb) < BUDGET_MB, f"export grew peak RSS by {growth_mb} MB"
@@ -0,0 +1,60 @@
+import threading
+
+from cache_utils import MISSING
+from geolocation import GeoResolver, is_private_ip
+
+
+def test_private_and_invalid_ips_are_not_resolved():
+    assert is_private_ip("127.0.0.1")
+    assert is_private_ip("10.1.2.3")
+    assert is_private_ip("localhost")
+    assert not is_private_ip("8.8.8.8")
+
+
+def test_misses_are_cached():
+    resolver = GeoResolver(db_path="/nonexistent/GeoLite2-City.mmdb", cache_size=10)
+
+    assert resolver.lookup("8.8.8.8") == {}
+    assert resolver.cache.get("8.8.8.8") == {}
+    assert resolver.lookup("8.8.8.8") == {}
+    assert resolver.cache.hits == 2
+
+
+def test_cache_is_bounded():
+    resolver = GeoResolver(db_path="/nonexistent/GeoLite2-City.mmdb", cache_size=2)
+
+    for ip in ("1.1.1.1", "1.0.0.1", "9.9.9.9"):
+        resolver.lookup(ip)
+
+    assert len(resolver.cache) == 2
+    assert resolver.cache.get("1.1.1.1") is MISSING
+
+
+def test_remote_fallback_runs_off_the_caller_thread(monkeypatch):
+    import requests
+
+    class FakeResponse:
+        status_code = 200
+
+        def json(self):
+            return {"status": "success", "country": "India", "regionName": "Gujarat", "city": "Surat", "lat": 21.1, "lon": 72.8, "isp": "X"}
+
+    monkeypatch.setattr(requests, "get", lambda *a, **kw: FakeResponse())
+    resolver = GeoResolver(db_path="/nonexistent/GeoLite2-City.mmdb", remote_fallback=True)
+
+    location = resolver.lookup("8.8.4.4")
+    assert resolver.wants_remote("8.8.4.4", location)
+
+    done = threading.Event()
+    results = []
+
+    def on_result(loc):
+        results.append((loc, threading.current_thread() is threading.main_thread()))
+        done.set()
+
+    assert resolver.resolve_remote_async("8.8.4.4", on_result)
+    assert done.wait(5)
+    assert results[0][0]["city"] == "Surat"
+    assert results[0][1] is False
+    assert resolver.lookup("8.8.4.4")["country"] == "India"
+    resolver.close()
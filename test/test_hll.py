@@ -0,0 +1,30 @@
+from hll import HyperLogLog, error_bound
+
+
+def _sketch(items):
+    sketch = HyperLogLog()
+    for item in items:
+        sketch.add(item)
+    return sketch
+
+
+def test_small_counts_are_exact_and_large_counts_within_bound():
+    assert HyperLogLog().count() == 0
+    assert _sketch(["a", "b", "a", "c"]).count() == 3
+
+    sketch = _sketch(f"visitor-{i}" for i in range(50000))
+    assert abs(sketch.count() - 50000) <= 3 * error_bound(50000)["absolute"]
+
+
+def test_union_of_serialised_sketches_counts_overlap_once():
+    monday = _sketch(f"v{i}" for i in range(0, 3000))
+    tuesday = _sketch(f"v{i}" for i in range(2000, 5000))
+    quiet_day = _sketch(["v1", "v4999", "only-here"])
+
+    # Sparse and dense encodings both round-trip
+    assert len(quiet_day.to_bytes()) < 20
+    assert HyperLogLog.from_bytes(monday.to_bytes()).registers == monday.registers
+
+    union = HyperLogLog.union([monday.to_bytes(), None, tuesday.to_bytes(), quiet_day.to_bytes()])
+    assert abs(union.count() - 5001) <= 3 * error_bound(5001)["absolute"]
+    assert union.registers == _sketch(f"v{i}" for i in range(5000)).merge(_sketch(["only-here"])).registers
@@ -0,0 +1,141 @@
+import uuid
+from datetime import datetime
+
+import models
+from database import SessionLocal
+from ingestion import IngestionBuffer, UpsertStage
+
+
+def _make_visit():
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Ingest", domain="example.com", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.flush()
+        visit = models.Visit(project_id=project.id, visitor_id=uuid.uuid4().hex, session_id=uuid.uuid4().hex)
+        db.add(visit)
+        db.commit()
+        return project.id, visit.id
+    finally:
+        db.close()
+
+
+def _count(model, **filters):
+    db = SessionLocal()
+    try:
+        return db.query(model).filter_by(**filters).count()
+    finally:
+        db.close()
+
+
+def test_flush_writes_rows_grouped_by_table():
+    project_id, visit_id = _make_visit()
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+
+    for i in range(25):
+        buf.add(models.Event, {
+            "visit_id": visit_id,
+            "event_type": "product_view",
+            "event_data": {"i": i},
+            "url": "https://example.com/p",
+            "timestamp": datetime.utcnow(),
+        })
+    buf.add(models.ExitLinkClick, {
+        "project_id": project_id,
+        "url": "https://other.example",
+        "clicked_at": datetime.utcnow(),
+    })
+
+    assert buf.pending() == 26
+    assert _count(models.Event, visit_id=visit_id) == 0
+
+    assert buf.flush() == 26
+    assert buf.pending() == 0
+    assert _count(models.Event, visit_id=visit_id) == 25
+    assert _count(models.ExitLinkClick, project_id=project_id) == 1
+
+
+def test_invalid_row_is_dropped_without_losing_the_batch():
+    _, visit_id = _make_visit()
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+
+    buf.add(models.Event, {"visit_id": visit_id, "event_type": "ok", "timestamp": datetime.utcnow()})
+    buf.add(models.Event, {"visit_id": visit_id, "event_type": None, "timestamp": datetime.utcnow()})
+
+    assert buf.flush() == 1
+    assert buf.stats["dropped"] == 1
+    assert _count(models.Event, visit_id=visit_id) == 1
+
+
+def test_stop_drains_pending_rows():
+    _, visit_id = _make_visit()
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.start()
+
+    buf.add(models.Event, {"visit_id": visit_id, "event_type": "exit", "timestamp": datetime.utcnow()})
+    buf.stop()
+
+    assert buf.pending() == 0
+    assert _count(models.Event, visit_id=visit_id) == 1
+
+
+def test_upsert_stage_coalesces_counters_across_flushes():
+    project_id, _ = _make_visit()
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.register_stage("exit_links", UpsertStage(
+        models.ExitLink,
+        key=("project_id", "url", "from_page"),
+        counters=("click_count",),
+        latest=("last_clicked",)
+    ))
+
+    def click(when):
+        buf.submit("exit_links", {
+            "project_id": project_id,
+            "url": "https://other.example.com/",
+            "from_page": "https://example.com/",
+            "last_clicked": when
+        }, click_count=1)
+
+    for day in range(1, 4):
+        click(datetime(2026, 1, day))
+    assert buf.pending() == 1
+    buf.flush()
+    click(datetime(2026, 1, 9))
+    buf.flush()
+
+    db = SessionLocal()
+    try:
+        links = db.query(models.ExitLink).filter_by(project_id=project_id).all()
+        assert len(links) == 1
+        assert links[0].click_count == 4
+        assert links[0].last_clicked == datetime(2026, 1, 9)
+    finally:
+        db.close()
+
+
+def test_invalid_stage_item_is_dropped_without_wedging_the_queue():
+    project_id, visit_id = _make_visit()
+    buf = IngestionBuffer(batch_size=1000, flush_interval=60)
+    buf.register_stage("exit_links", UpsertStage(
+        models.ExitLink,
+        key=("project_id", "url", "from_page"),
+        counters=("click_count",),
+        latest=("last_clicked",)
+    ))
+
+    def click(url):
+        buf.submit("exit_links", {"project_id": project_id, "url": url, "from_page": "", "last_clicked": datetime.utcnow()}, click_count=1)
+
+    buf.add(models.Event, {"visit_id": visit_id, "event_type": "ok", "timestamp": datetime.utcnow()})
+    click("https://other.example.com/")
+    click(None)  # exit_link.url is NOT NULL
+
+    assert buf.flush() == 2
+    assert buf.pending() == 0 and buf.stats["dropped"] == 1
+    assert _count(models.Event, visit_id=visit_id) == 1
+    assert _count(models.ExitLink, project_id=project_id) == 1
+
+    # Later flushes are not stuck behind the bad item
+    click("https://other.example.com/")
+    assert buf.flush() == 1
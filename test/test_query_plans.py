@@ -0,0 +1,133 @@
+"""
+EXPLAIN regression test for the dashboard's hottest queries.
+
+Each query mirrors one issued by the routers; its SQLite plan must reach the
+listed index instead of scanning the table. Plans are taken on an empty
+in-memory schema built from models.py, which the composite-index migration
+(4f2b8d6e0c13) keeps in step with.
+"""
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, desc, func, select
+
+import models
+from database import Base
+
+SINCE = datetime(2026, 1, 1)
+UNTIL = SINCE + timedelta(days=30)
+
+visit, pageview, event, cart = models.Visit, models.PageView, models.Event, models.CartAction
+in_range = (visit.project_id == 1, visit.visited_at >= SINCE, visit.visited_at <= UNTIL)
+visit_ids = select(visit.id).where(*in_range)
+
+QUERIES = {
+    "live visitors": (
+        select(func.count(func.distinct(visit.visitor_id))).where(visit.project_id == 1, visit.visited_at >= SINCE),
+        ["ix_visits_project_visited_at"],
+    ),
+    "activity view page": (
+        select(visit).where(*in_range).order_by(desc(visit.visited_at)).limit(50),
+        ["ix_visits_project_visited_at"],
+    ),
+    "devices in range": (
+        select(visit.device, func.count(visit.id)).where(*in_range).group_by(visit.device),
+        ["ix_visits_project_visited_at"],
+    ),
+    "session dedup": (
+        select(visit.id).where(visit.project_id == 1, visit.session_id == "s"),
+        ["ix_visits_project_session"],
+    ),
+    "visitor timeline": (
+        select(visit).where(visit.project_id == 1, visit.visitor_id == "v").order_by(visit.visited_at),
+        ["ix_visits_project_visitor"],
+    ),
+    "source category filter": (
+        select(visit).where(*in_range, visit.source_category == "organic"),
+        ["ix_visits_project_source_category"],
+    ),
+    "referrer domains": (
+        select(visit.referrer_domain, func.count(visit.id)).where(
+            visit.project_id == 1, visit.referrer_domain.isnot(None)
+        ).group_by(visit.referrer_domain),
+        ["ix_visits_project_referrer_domain"],
+    ),
+    "bounced visits": (
+        select(func.count(visit.id)).where(visit.project_id == 1, visit.is_bounce == True),  # noqa: E712
+        ["ix_visits_project_is_bounce"],
+    ),
+    "sessions per visitor": (
+        select(visit.id).join(models.Visitor, (models.Visitor.project_id == visit.project_id) & (models.Visitor.visitor_id == visit.visitor_id))
+        .where(*in_range, models.Visitor.session_count > 1),
+        ["ix_visits_project_visited_at", "sqlite_autoindex_visitors_1"],
+    ),
+    "visit page views": (
+        select(pageview).where(pageview.visit_id == 7).order_by(pageview.viewed_at),
+        ["ix_page_views_visit_viewed_at"],
+    ),
+    "page views in range": (
+        select(pageview.url, func.count(pageview.id)).join(visit, visit.id == pageview.visit_id)
+        .where(*in_range).group_by(pageview.url),
+        ["ix_visits_project_visited_at", "ix_page_views_visit_viewed_at"],
+    ),
+    "conversion events": (
+        select(func.count(event.id)).where(event.visit_id.in_(visit_ids), event.event_type.in_(["lead", "form_submit"])),
+        ["ix_events_visit_event_type"],
+    ),
+    "cart conversions": (
+        select(func.count(cart.id)).where(cart.visit_id.in_(visit_ids), cart.action.in_(["add_to_cart", "checkout_started"])),
+        ["ix_cart_actions_visit_action"],
+    ),
+    "exit link clicks": (
+        select(models.ExitLinkClick).where(
+            models.ExitLinkClick.project_id == 1,
+            models.ExitLinkClick.clicked_at >= SINCE, models.ExitLinkClick.clicked_at <= UNTIL,
+        ),
+        ["ix_exit_link_clicks_project_clicked_at"],
+    ),
+    "daily rollup series": (
+        select(models.DailyProjectStat).where(
+            models.DailyProjectStat.project_id == 1, models.DailyProjectStat.stat_date >= SINCE.date()
+        ),
+        ["sqlite_autoindex_daily_project_stats_1"],
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def plan_engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _plan(engine, query):
+    compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_dashboard_query_uses_its_index(plan_engine, name):
+    query, indexes = QUERIES[name]
+    plan = _plan(plan_engine, query)
+    for index in indexes:
+        assert any(index in step for step in plan), f"{name}: {index} not used in {plan}"
+    scans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+    assert not scans, f"{name}: full table scan in {plan}"
+
+
+def test_migration_indexes_match_models():
+    path = os.path.join(os.path.dirname(__file__), "..", "alembic", "versions", "4f2b8d6e0c13_add_dashboard_composite_indexes.py")
+    spec = importlib.util.spec_from_file_location("composite_indexes", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    declared = {
+        index.name: (table.name, [column.name for column in index.columns])
+        for table in Base.metadata.tables.values() for index in table.indexes
+    }
+    for name, table, columns, _ in migration.INDEXES:
+        assert declared[name] == (table, columns)
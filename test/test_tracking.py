@@ -0,0 +1,557 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import models
+from database import SessionLocal
+
+
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Origin": "https://example.com",
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    from main import app
+    return TestClient(app, headers=BROWSER_HEADERS)
+
+
+@pytest.fixture
+def project_id():
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Tracking", domain="example.com", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def _visit_payload(**overrides):
+    payload = {
+        "visitor_id": uuid.uuid4().hex,
+        "session_id": uuid.uuid4().hex,
+        "entry_page": "https://example.com/",
+        "referrer": "direct",
+    }
+    payload.update(overrides)
+    return payload
+
+
+def test_track_visit_then_pageview(client, project_id):
+    res = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload())
+    assert res.status_code == 200
+    visit_id = res.json()["visit_id"]
+    assert res.json()["is_unique_visitor"] is True
+
+    res = client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/", "title": "Home"})
+    assert res.status_code == 200
+    assert res.json()["pageview_id"]
+
+
+def test_batch_resolves_temp_ids_in_one_request(client, project_id):
+    from ingestion import buffer
+
+    payload = _visit_payload()
+    res = client.post(f"/api/analytics/{project_id}/batch", json={"events": [
+        {"type": "visit", "temp_id": "v1", "data": payload},
+        {"type": "pageview", "temp_id": "p1", "visit_id": "v1", "data": {"url": "https://example.com/a", "title": "A"}},
+        {"type": "pageview_update", "visit_id": "v1", "pageview_id": "p1", "data": {"time_spent": 12}},
+        {"type": "event", "visit_id": "v1", "data": {"event_type": "product_view", "url": "https://example.com/a"}},
+        {"type": "exit", "visit_id": "v1", "data": {"exit_page": "https://example.com/a"}},
+    ]})
+    assert res.status_code == 200
+    body = res.json()
+    assert set(body["ids"]) == {"v1", "p1"}
+    assert [r["status"] for r in body["results"]] == ["ok"] * 5
+
+    buffer.flush()
+    db = SessionLocal()
+    try:
+        visit = db.get(models.Visit, body["ids"]["v1"])
+        assert visit.session_id == payload["session_id"]
+        assert visit.exit_page == "https://example.com/a"
+        pageview = db.get(models.PageView, body["ids"]["p1"])
+        assert pageview.time_spent == 12
+        assert db.query(models.Event).filter(models.Event.visit_id == visit.id).count() == 1
+    finally:
+        db.close()
+
+
+def test_batch_reports_bad_entries_without_failing_the_rest(client, project_id):
+    res = client.post(f"/api/analytics/{project_id}/batch", json={"events": [
+        {"type": "pageview", "visit_id": "missing", "data": {"url": "https://example.com/"}},
+        {"type": "visit", "temp_id": "v1", "data": _visit_payload()},
+    ]})
+    assert res.status_code == 200
+    results = res.json()["results"]
+    assert results[0]["status"] == "error"
+    assert results[1]["status"] == "ok"
+    assert "v1" in res.json()["ids"]
+
+
+def test_pageviews_share_one_page_row_and_coalesce_views(client, project_id):
+    from ingestion import buffer
+
+    visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    for _ in range(3):
+        res = client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/p", "title": "P"})
+        assert res.status_code == 200
+
+    buffer.flush()
+    db = SessionLocal()
+    try:
+        pages = db.query(models.Page).filter(models.Page.project_id == project_id, models.Page.url == "https://example.com/p").all()
+        assert len(pages) == 1
+        assert pages[0].total_views == 3
+    finally:
+        db.close()
+
+
+def test_time_spent_heartbeats_keep_the_latest_value(client, project_id):
+    from ingestion import buffer
+
+    visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    pageview_id = client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/t"}).json()["pageview_id"]
+
+    buffer.flush()
+    for seconds in (5, 10, 15):
+        res = client.put(f"/api/analytics/{project_id}/pageview/{visit_id}/update/{pageview_id}", json={"time_spent": seconds})
+        assert res.status_code == 200
+    assert buffer.pending() == 1
+
+    res = client.put(f"/api/analytics/{project_id}/pageview/{visit_id + 1}/update/{pageview_id}", json={"time_spent": 99})
+    assert res.status_code == 404
+
+    buffer.flush()
+    db = SessionLocal()
+    try:
+        assert db.get(models.PageView, pageview_id).time_spent == 15
+    finally:
+        db.close()
+
+
+def test_bot_beacons_are_counted_not_stored(client, project_id):
+    payload = _visit_payload()
+    res = client.post(f"/api/analytics/{project_id}/track", json=payload, headers={"User-Agent": "Googlebot/2.1 (+http://www.google.com/bot.html)"})
+    assert res.status_code == 200
+    assert res.json()["visit_id"] is None
+
+    res = client.post(f"/api/analytics/{project_id}/track", json=payload, headers={"Accept-Language": "", "Origin": ""})
+    assert res.json()["visit_id"] is None
+
+    stats = client.get(f"/api/analytics/{project_id}/bot-stats").json()
+    assert stats["by_reason"] == {"user_agent": 1, "headers": 1}
+
+    db = SessionLocal()
+    try:
+        assert db.query(models.Visit).filter(models.Visit.session_id == payload["session_id"]).count() == 0
+    finally:
+        db.close()
+
+
+def test_daily_rollup_is_maintained_at_ingest_and_matches_rebuild(client, project_id):
+    from ingestion import buffer
+    import rollups
+
+    visitor = uuid.uuid4().hex
+    for _ in range(2):
+        visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(visitor_id=visitor)).json()["visit_id"]
+        client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/"})
+    visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/"})
+
+    buffer.flush()
+    today = client.get(f"/api/analytics/{project_id}/summary-view?days=1").json()
+    assert today["total_visits"] == 3
+    assert today["daily_stats"][-1] == {
+        "date": today["daily_stats"][-1]["date"],
+        "page_views": 3,
+        "unique_visits": 2,
+        "first_time_visits": 2,
+        "returning_visits": 0,
+    }
+
+    db = SessionLocal()
+    try:
+        ingested = {k: [getattr(r, c) for c in rollups.DAILY_COUNTERS] for k, r in rollups.daily_stats(db, project_id).items()}
+        assert rollups.rebuild(db, project_id=project_id) == 1
+        rebuilt = {k: [getattr(r, c) for c in rollups.DAILY_COUNTERS] for k, r in rollups.daily_stats(db, project_id).items()}
+        ingested_sketches = db.query(models.DailyVisitorSketch).filter_by(project_id=project_id).one().visitors
+        rollups.rebuild_sketches(db, project_id=project_id)
+        assert db.query(models.DailyVisitorSketch).filter_by(project_id=project_id).one().visitors == ingested_sketches
+        assert rollups.unique_visitors(db, [project_id], buckets=True) == {project_id: 2}
+    finally:
+        db.close()
+    assert ingested == rebuilt
+    assert today["unique_visitors"] == 2
+    assert today["unique_visitors_error"]["relative"] > 0
+
+
+def test_bucket_sketches_count_visits_without_page_views(client, project_id):
+    from ingestion import buffer
+    import rollups
+
+    client.post(f"/api/analytics/{project_id}/track", json=_visit_payload())
+    buffer.flush()
+
+    db = SessionLocal()
+    try:
+        assert rollups.unique_visitors(db, [project_id], buckets=True) == {project_id: 1}
+        ingested = [tuple(row) for row in rollups.time_buckets(db, project_id, sketches=True)]
+        rollups.rebuild_time_buckets(db, project_id=project_id)
+        assert [tuple(row) for row in rollups.time_buckets(db, project_id, sketches=True)] == ingested
+    finally:
+        db.close()
+
+
+def test_hourly_charts_read_time_buckets_in_ist(client, project_id):
+    from datetime import datetime
+    from ingestion import buffer
+    import rollups
+
+    visitor = uuid.uuid4().hex
+    for url in ("https://example.com/a", "https://example.com/b"):
+        visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(visitor_id=visitor)).json()["visit_id"]
+        client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": url})
+    buffer.flush()
+
+    now_ist = datetime.utcnow() + rollups.IST_OFFSET
+    day = client.get(f"/api/analytics/{project_id}/hourly/{now_ist.strftime('%Y-%m-%d')}").json()
+    assert day["totals"]["page_views"] == 2
+    assert day["totals"]["unique_visits"] == 1
+    hour = day["hourly_stats"][now_ist.hour]
+    assert (hour["page_views"], hour["unique_visits"], hour["first_time_visits"]) == (2, 1, 1)
+
+    activity = client.get(f"/api/pages/{project_id}/page-activity?hours=2").json()
+    assert activity[-1] == {"hour": now_ist.strftime("%Y-%m-%d %H:00:00"), "views": 2}
+
+    db = SessionLocal()
+    try:
+        def snapshot():
+            return [tuple(row) for row in rollups.time_buckets(db, project_id, sketches=True)]
+        ingested = snapshot()
+        assert rollups.rebuild_time_buckets(db, project_id=project_id) == len(ingested)
+        assert snapshot() == ingested
+    finally:
+        db.close()
+
+
+def test_summary_is_served_in_one_statement(client, project_id):
+    from sqlalchemy import event
+    from database import engine
+    from ingestion import buffer
+
+    for device in ("desktop", "mobile", "mobile"):
+        visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(device=device)).json()["visit_id"]
+        client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/pricing", "title": "Pricing"})
+    buffer.flush()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        summary = client.get(f"/api/analytics/{project_id}/summary?days=7").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # Project lookup + the summary snapshot
+    assert len(statements) == 2
+    assert summary["total_visits"] == 3
+    assert summary["unique_visitors"] == 3
+    assert summary["live_visitors"] == 3
+    assert len(summary["daily_stats"]) == 7
+    assert summary["all_daily_stats"][-1]["page_views"] == 3
+    assert summary["device_stats"] == {"desktop": 1, "mobile": 2}
+    assert summary["top_pages"][0]["views"] >= 1
+
+
+def test_visit_engagement_is_maintained_and_filterable(client, project_id):
+    from ingestion import buffer
+
+    bounced = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    client.post(f"/api/analytics/{project_id}/pageview/{bounced}", json={"url": "https://example.com/"})
+    engaged = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    for path in ("/", "/pricing"):
+        client.post(f"/api/analytics/{project_id}/pageview/{engaged}", json={"url": f"https://example.com{path}"})
+    client.post(f"/api/analytics/{project_id}/event/{engaged}", json={"event_type": "signup"})
+    client.post(f"/api/analytics/{project_id}/exit/{engaged}", json={"exit_page": "https://example.com/pricing"})
+    buffer.flush()
+
+    db = SessionLocal()
+    try:
+        first, second = db.get(models.Visit, bounced), db.get(models.Visit, engaged)
+        assert (first.page_views_count, first.events_count, first.is_bounce) == (1, 0, True)
+        assert (second.page_views_count, second.events_count, second.is_bounce) == (2, 1, False)
+        assert second.last_activity_at >= second.visited_at
+    finally:
+        db.close()
+
+    visits = client.get(
+        f"/api/visitors/{project_id}/activity-view",
+        params={"page_views_per_session": "2", "page_views_per_session_operator": "equals"},
+    ).json()
+    assert [v["id"] for v in visits] == [engaged]
+
+
+def test_visitors_table_drives_is_unique_and_session_filters(client, project_id):
+    import rollups
+
+    returning = uuid.uuid4().hex
+    first = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(visitor_id=returning, device="mobile")).json()
+    second = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(visitor_id=returning, device="desktop")).json()
+    once = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()
+    assert (first["is_unique_visitor"], second["is_unique_visitor"], once["is_unique_visitor"]) == (True, False, True)
+
+    db = SessionLocal()
+    try:
+        visitor = db.get(models.Visitor, (project_id, returning))
+        assert (visitor.session_count, visitor.device) == (2, "desktop")
+        assert visitor.first_seen <= visitor.last_seen
+        stored = {(v.visitor_id, v.session_count, v.device) for v in db.query(models.Visitor).filter_by(project_id=project_id)}
+        assert rollups.rebuild_visitors(db, project_id=project_id) == 2
+        assert {(v.visitor_id, v.session_count, v.device) for v in db.query(models.Visitor).filter_by(project_id=project_id)} == stored
+    finally:
+        db.close()
+
+    visits = client.get(
+        f"/api/visitors/{project_id}/activity-view",
+        params={"sessions_per_visitor": "1", "sessions_per_visitor_operator": "greater_than"},
+    ).json()
+    assert sorted(v["id"] for v in visits) == sorted([first["visit_id"], second["visit_id"]])
+
+
+def test_source_category_is_stored_at_ingest_and_filtered_on(client, project_id):
+    import rollups
+
+    referrers = ["https://www.Google.com/search?q=x", "https://t.co/abc", "direct", "https://news.example.org:8443/post"]
+    ids = {r: client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(referrer=r)).json()["visit_id"] for r in referrers}
+
+    db = SessionLocal()
+    try:
+        stored = {v.id: (v.source_category, v.referrer_domain) for v in db.query(models.Visit).filter_by(project_id=project_id)}
+        assert stored == {
+            ids[referrers[0]]: ("organic", "google.com"),
+            ids[referrers[1]]: ("referral", "t.co"),
+            ids[referrers[2]]: ("direct", None),
+            ids[referrers[3]]: ("referral", "news.example.org"),
+        }
+        db.query(models.Visit).filter_by(project_id=project_id).update({"source_category": "referral", "referrer_domain": None})
+        db.commit()
+        assert rollups.rebuild_visit_sources(db, project_id=project_id) == 4
+        assert {v.id: (v.source_category, v.referrer_domain) for v in db.query(models.Visit).filter_by(project_id=project_id)} == stored
+    finally:
+        db.close()
+
+    sources = client.get(f"/api/traffic/{project_id}/sources", params={"traffic_sources": "referral"}).json()
+    assert [(s["source_type"], s["count"]) for s in sources if s["count"]] == [("referral", 2)]
+    visits = client.get(f"/api/visitors/{project_id}/activity-view", params={"traffic_sources": "organic"}).json()
+    assert [v["id"] for v in visits] == [ids[referrers[0]]]
+    stored = client.get(f"/api/traffic/{project_id}/referrers").json()
+    assert {(r["referrer"], r["domain"]) for r in stored} == {
+        ("https://www.Google.com/search?q=x", "google.com"),
+        ("https://t.co/abc", "t.co"),
+        ("direct", None),
+        ("https://news.example.org:8443/post", "news.example.org"),
+    }
+
+
+def test_pages_group_on_stored_base_urls(client, project_id):
+    import rollups
+    from ingestion import buffer
+
+    first = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(entry_page="https://example.com/?utm_source=x")).json()["visit_id"]
+    for url in ("https://example.com/?utm_source=x", "https://example.com/pricing/?plan=pro", "https://example.com/pricing#faq"):
+        client.post(f"/api/analytics/{project_id}/pageview/{first}", json={"url": url})
+    second = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(entry_page="https://Example.com")).json()["visit_id"]
+    client.post(f"/api/analytics/{project_id}/pageview/{second}", json={"url": "https://example.com/"})
+    buffer.flush()
+
+    db = SessionLocal()
+    try:
+        stored = db.query(models.PageView.visit_id, models.PageView.base_url).join(models.Visit).filter(
+            models.Visit.project_id == project_id
+        ).order_by(models.PageView.id).all()
+        assert [b for _, b in stored] == ["https://example.com/", "https://example.com/pricing", "https://example.com/pricing", "https://example.com/"]
+        visits = {v.id: (v.entry_base_url, v.exit_base_url) for v in db.query(models.Visit).filter_by(project_id=project_id)}
+        assert visits == {first: ("https://example.com/", "https://example.com/pricing"), second: ("https://example.com/", "https://example.com/")}
+        assert rollups.rebuild_page_urls(db, project_id=project_id) == 6
+        assert {v.id: (v.entry_base_url, v.exit_base_url) for v in db.query(models.Visit).filter_by(project_id=project_id)} == visits
+    finally:
+        db.close()
+
+    pages = client.get(f"/api/pages/{project_id}/most-visited").json()["data"]
+    assert {(p["url"], p["total_views"]) for p in pages} == {("https://example.com/", 2), ("https://example.com/pricing", 2)}
+    entries = client.get(f"/api/pages/{project_id}/entry-pages").json()["data"]
+    assert [(p["page"], p["sessions"]) for p in entries] == [("https://example.com/", 2)]
+    exits = client.get(f"/api/pages/{project_id}/exit-pages").json()["data"]
+    assert {(p["page"], p["exits"], p["bounce_rate"]) for p in exits} == {("https://example.com/pricing", 1, 0.0), ("https://example.com/", 1, 100.0)}
+
+
+def test_activity_view_pages_with_a_keyset_cursor(client, project_id, monkeypatch):
+    from routers import visitors
+
+    ids = [client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"] for _ in range(5)]
+    monkeypatch.setattr(visitors, "ACTIVITY_MAX_PAGE_SIZE", 2)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 50} if cursor is None else {"limit": 50, "cursor": cursor}
+        res = client.get(f"/api/visitors/{project_id}/activity-view", params=params)
+        assert res.status_code == 200 and len(res.json()) <= 2
+        seen += [v["id"] for v in res.json()]
+        pages += 1
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert (seen, pages) == (sorted(ids, reverse=True), 3)
+
+    assert client.get(f"/api/visitors/{project_id}/activity-view", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_csv_export_streams_each_dataset(client, project_id):
+    import csv
+    import gzip
+    import io
+    from ingestion import buffer
+
+    visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload()).json()["visit_id"]
+    client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/a?x=1", "title": "A"})
+    client.post(f"/api/analytics/{project_id}/event/{visit_id}", json={"event_type": "click", "event_data": {"id": "buy"}})
+    buffer.flush()
+
+    def rows(dataset, **params):
+        res = client.get(f"/api/reports/{project_id}/export/csv", params={"dataset": dataset, **params})
+        assert res.status_code == 200
+        body = gzip.decompress(res.content) if params.get("gzip") else res.content
+        return list(csv.reader(io.StringIO(body.decode("utf-8"))))
+
+    visits = rows("visits")
+    assert visits[0][0] == "Visitor ID" and len(visits) == 2
+    assert rows("visits", gzip="true") == visits
+    pageviews = rows("pageviews")
+    assert pageviews[1][0] == str(visit_id) and pageviews[1][3] == "https://example.com/a"
+    events = rows("events")
+    assert events[1][2] == "click" and events[1][4] == '{"id":"buy"}'
+
+    assert client.get(f"/api/reports/{project_id}/export/csv", params={"dataset": "clicks"}).status_code == 400
+
+
+def test_parquet_export_is_typed_and_chunked(client, project_id, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import io
+    import pyarrow.parquet as pq
+    import exports
+    from ingestion import buffer
+
+    for device in ("desktop", "mobile", "mobile"):
+        visit_id = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(device=device)).json()["visit_id"]
+        client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "https://example.com/p", "title": "P", "scroll_depth": 42.5})
+    client.post(f"/api/analytics/{project_id}/event/{visit_id}", json={"event_type": "click", "event_data": {"id": "buy"}})
+    buffer.flush()
+
+    res = client.get(f"/api/reports/{project_id}/export/parquet", params={"dataset": "visits"})
+    assert res.status_code == 200
+    visits = pq.read_table(io.BytesIO(res.content))
+    assert visits.num_rows == 3
+    assert visits.schema.field("visited_at").type == pa.timestamp("us", tz="UTC")
+    assert visits.schema.field("is_bounce").type == pa.bool_()
+    assert pa.types.is_dictionary(visits.schema.field("device").type)
+    assert sorted(visits.column("device").to_pylist()) == ["desktop", "mobile", "mobile"]
+
+    pageviews = pq.read_table(io.BytesIO(client.get(f"/api/reports/{project_id}/export/parquet", params={"dataset": "pageviews"}).content))
+    assert pageviews.column("scroll_depth").to_pylist() == [42.5] * 3
+    events = pq.read_table(io.BytesIO(client.get(f"/api/reports/{project_id}/export/parquet", params={"dataset": "events"}).content))
+    assert events.column("event_data").to_pylist() == ['{"id":"buy"}']
+
+    # Scheduled dumps: one row group per cursor chunk, written to a path
+    path = str(tmp_path / "visits.parquet")
+    stmt = exports.export_query("visits", project_id, columnar=True)
+    assert exports.write_parquet("visits", exports.iter_chunks(stmt, chunk_rows=2), path) == 3
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
+    assert pq.read_table(path).column("id").to_pylist() == visits.column("id").to_pylist()
+
+    assert client.get(f"/api/reports/{project_id}/export/parquet", params={"dataset": "clicks"}).status_code == 400
+
+
+def test_traffic_source_conversions_are_counted_per_category(client, project_id):
+    from datetime import datetime, timedelta
+    from ingestion import buffer
+
+    def visit(referrer):
+        payload = _visit_payload(referrer=referrer)
+        return client.post(f"/api/analytics/{project_id}/track", json=payload).json()["visit_id"], payload["session_id"]
+
+    (direct, _), (organic, organic_session), (social, _) = visit("direct"), visit("https://www.google.com/search?q=x"), visit("https://facebook.com/")
+    for action in ("add_to_cart", "add_to_cart", "remove_from_cart"):
+        client.post(f"/api/analytics/{project_id}/cart-action/{direct}", json={"action": action})
+    for event_type in ("purchase", "signup", "lead", "form_submit", "scroll"):
+        client.post(f"/api/analytics/{project_id}/event/{organic}", json={"event_type": event_type})
+    client.post(f"/api/analytics/{project_id}/pageview/{organic}", json={"url": "https://example.com/thank-you", "title": "Thanks"})
+    client.post(f"/api/analytics/{project_id}/exit-link", json={"url": "https://pay.example.net/checkout", "session_id": organic_session})
+    client.post(f"/api/analytics/{project_id}/event/{social}", json={"event_type": "scroll"})
+    buffer.flush()
+
+    now = datetime.utcnow()
+    params = {"start_date": (now - timedelta(days=1)).isoformat() + "Z", "end_date": (now + timedelta(days=1)).isoformat() + "Z"}
+    sources = {s["source_type"]: s for s in client.get(f"/api/traffic/{project_id}/sources", params=params).json()}
+
+    # direct: one visit with add_to_cart; organic: 4 conversion events + thank-you page + checkout link
+    assert {k: sources[k]["conversions"] for k in sources} == {"direct": 1, "organic": 6, "social": 0}
+
+    # The cart detail still counts rows; only the total counts visits
+    from routers.traffic_sources import _conversion_counts
+    db = SessionLocal()
+    try:
+        counts = _conversion_counts(db, db.query(models.Visit).filter(models.Visit.project_id == project_id))
+    finally:
+        db.close()
+    assert (counts["direct"]["cart_actions"], counts["direct"]["cart_visits"]) == (2, 1)
+    assert counts["organic"] == {"purchase_events": 1, "signup_events": 1, "lead_events": 2, "custom_conversions": 1, "link_conversions": 1}
+
+
+def test_visits_written_without_a_category_are_classified_on_insert(client, project_id):
+    from datetime import datetime, timedelta
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        # e.g. a replayed or hand-written row that only carries the referrer
+        visit = models.Visit(project_id=project_id, referrer="https://www.bing.com/search?q=x", visited_at=now)
+        db.add(visit)
+        db.commit()
+        assert visit.source_category == "organic"
+    finally:
+        db.close()
+
+    params = {"start_date": (now - timedelta(days=1)).isoformat() + "Z", "end_date": (now + timedelta(days=1)).isoformat() + "Z"}
+    sources = client.get(f"/api/traffic/{project_id}/sources", params=params).json()
+    assert [(s["source_type"], s["count"]) for s in sources] == [("organic", 1)]
+
+
+def test_malformed_page_urls_are_stored_not_rejected(client, project_id):
+    import rollups
+    from ingestion import buffer
+
+    res = client.post(f"/api/analytics/{project_id}/track", json=_visit_payload(entry_page="http://[::1"))
+    assert res.status_code == 200
+    visit_id = res.json()["visit_id"]
+    res = client.post(f"/api/analytics/{project_id}/pageview/{visit_id}", json={"url": "http://[::1/x?a=1", "title": "Bad"})
+    assert res.status_code == 200
+    buffer.flush()
+
+    db = SessionLocal()
+    try:
+        visit = db.get(models.Visit, visit_id)
+        assert visit.entry_base_url == "http://[::1"
+        assert visit.exit_base_url == "http://[::1/x"
+        assert db.query(models.PageView.base_url).filter_by(visit_id=visit_id).scalar() == "http://[::1/x"
+        # ...and they do not abort a rebuild
+        assert rollups.rebuild_page_urls(db, project_id=project_id) == 2
+    finally:
+        db.close()
@@ -0,0 +1,87 @@
+import uuid
+
+import models
+from cache_utils import BloomFilter
+from database import SessionLocal
+from visit_index import VisitIndex
+
+
+class NoQuerySession:
+    def query(self, *args, **kwargs):
+        raise AssertionError("index should have answered without a query")
+
+
+def _insert_visit(project_id, visitor_id, session_id):
+    db = SessionLocal()
+    try:
+        visit = models.Visit(project_id=project_id, visitor_id=visitor_id, session_id=session_id)
+        db.add(visit)
+        db.commit()
+        return visit.id
+    finally:
+        db.close()
+
+
+def _project():
+    db = SessionLocal()
+    try:
+        project = models.Project(name="Index", domain="example.com", tracking_code=uuid.uuid4().hex)
+        db.add(project)
+        db.commit()
+        return project.id
+    finally:
+        db.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [uuid.uuid4().hex for _ in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(5000))
+    assert false_positives < 150
+
+
+def test_warmed_index_answers_without_queries():
+    project_id = _project()
+    visit_id = _insert_visit(project_id, "visitor-a", "session-a")
+
+    index = VisitIndex(lru_size=100, capacity=10000, trust_misses=True)
+    index.warm(SessionLocal)
+
+    db = NoQuerySession()
+    assert index.find_session(db, project_id, "session-a") == visit_id
+    assert index.find_session(db, project_id, "session-new") is None
+
+
+def test_miss_is_checked_against_the_database_by_default():
+    project_id = _project()
+    index = VisitIndex(lru_size=100, capacity=10000)
+    index.warm(SessionLocal)
+
+    # Written by another worker after this worker's last sync
+    visit_id = _insert_visit(project_id, "visitor-c", "session-c")
+
+    db = SessionLocal()
+    try:
+        assert index.find_session(db, project_id, "session-c") == visit_id
+    finally:
+        db.close()
+
+
+def test_probable_positive_is_confirmed_against_the_database():
+    project_id = _project()
+    visit_id = _insert_visit(project_id, "visitor-b", "session-b")
+
+    index = VisitIndex(lru_size=100, capacity=10000)
+    index.warm(SessionLocal)
+    index.sessions.clear()
+
+    db = SessionLocal()
+    try:
+        assert index.find_session(db, project_id, "session-b") == visit_id
+    finally:
+        db.close()
+    assert index.stats["confirmed"] == 1
@@ -1,9 +1,8 @@
 from datetime import datetime, timedelta
 from sqlalchemy import func, Date, cast
-import os
-import geoip2.database
 from user_agents import parse
 from typing import Optional
+from urllib.parse import urlsplit
 
 def get_ist_now():
     """Get current time in IST"""
@@ -45,24 +44,91 @@ def get_truncated_hour_expr(column, dialect_name):
         return func.date_trunc('hour', func.timezone('Asia/Kolkata', func.timezone('UTC', column)))
 
 
-def get_location_from_ip(ip_address: str) -> dict:
-    """Get location data from IP address using GeoIP2"""
+def get_insert_for_dialect(model, dialect_name):
+    """INSERT construct that supports ON CONFLICT for the given dialect"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # Postgres
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
+
+
+# Traffic source classification, applied once per visit at ingest
+SEARCH_ENGINES = ["google", "bing", "yahoo", "duckduckgo", "baidu"]
+SOCIAL_SITES = ["facebook", "twitter", "instagram", "linkedin", "youtube", "tiktok", "pinterest"]
+AI_TOOLS = ["chatgpt", "claude", "gemini", "copilot", "perplexity"]
+EMAIL_PROVIDERS = ["mail", "gmail", "outlook", "yahoo.com"]
+PAID_MARKERS = ["ads", "adwords", "facebook.com/tr"]
+UTM_MARKERS = ["utm_", "campaign"]
+SOURCE_CATEGORIES = ("direct", "organic", "social", "ai", "email", "paid", "utm", "referral")
+
+
+def classify_source(referrer: Optional[str]) -> str:
+    """Source category of a referrer; stored as visits.source_category"""
+    r = (referrer or "").lower().strip()
+    if not r or r in ("direct", "null", "undefined"):
+        return "direct"
+    for category, markers in (
+        ("organic", SEARCH_ENGINES),
+        ("social", SOCIAL_SITES),
+        ("ai", AI_TOOLS),
+        ("email", EMAIL_PROVIDERS),
+        ("paid", PAID_MARKERS),
+        ("utm", UTM_MARKERS),
+    ):
+        if any(x in r for x in markers):
+            return category
+    return "referral"
+
+
+def get_referrer_domain(referrer: Optional[str]) -> Optional[str]:
+    """Normalized host of a referrer (lowercase, no port, no leading www.); stored as visits.referrer_domain"""
+    r = (referrer or "").strip().lower()
+    if not r or r in ("direct", "null", "undefined"):
+        return None
+    try:
+        host = urlsplit(r if "//" in r else f"//{r}").hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host[4:] if host.startswith("www.") else host
+
+
+def normalize_page_url(url: Optional[str]) -> Optional[str]:
+    """
+    Base URL a page is grouped under; stored as page_views.base_url and
+    visits.entry_base_url / exit_base_url.
+
+    Drops the query string and fragment, lowercases scheme and host and
+    strips trailing slashes (the root stays "/"). Cart-action fragments
+    ("#cart-...") are kept, since they mark virtual pages.
+    """
+    if not url:
+        return None
+    base, _, fragment = url.strip().partition("#")
+    base = base.split("?", 1)[0]
     try:
-        geoip_path = os.getenv("GEOIP_DB_PATH", "./GeoLite2-City.mmdb")
-        if not os.path.exists(geoip_path):
-            return {}
-        
-        with geoip2.database.Reader(geoip_path) as reader:
-            response = reader.city(ip_address)
-            return {
-                "country": response.country.name,
-                "state": response.subdivisions.most_specific.name if response.subdivisions else None,
-                "city": response.city.name,
-                "latitude": response.location.latitude,
-                "longitude": response.location.longitude
-            }
-    except Exception:
-        return {}
+        parts = urlsplit(base)
+    except ValueError:
+        # Malformed (e.g. an unclosed IPv6 host): keep it as sent, minus query and fragment
+        return base
+    path = parts.path.rstrip("/") or "/"
+    if parts.netloc:
+        scheme = f"{parts.scheme.lower()}:" if parts.scheme else ""
+        base = f"{scheme}//{parts.netloc.lower()}{path}"
+    else:
+        base = path
+    if fragment.startswith("cart-"):
+        base += f"#{fragment}"
+    return base
+
+
+def get_location_from_ip(ip_address: str) -> dict:
+    """Get location data from IP address using the shared, cached GeoIP2 reader"""
+    from geolocation import resolver
+    return resolver.lookup(ip_address)
 
 def parse_user_agent(user_agent_string: str) -> dict:
     """Parse user agent string to extract device, browser, and OS info"""
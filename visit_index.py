@@ -0,0 +1,178 @@
+"""
+In-memory session index for track_visit.
+
+track_visit needs to know whether a session has already been tracked
+(dedupe) before inserting a visit. The index answers from memory:
+
+- an LRU of recent (project, session) -> visit id gives definite "yes"
+  answers,
+- everything else is looked up in the DB (an ix_visits_project_session
+  probe).
+
+A Bloom filter over every (project, session) key can also answer "no", but
+only for keys this worker has seen or synced; with several workers a session
+started on another worker since the last sync would be missed and tracked
+twice. So Bloom misses are trusted only with VISIT_INDEX_TRUST_MISSES=true,
+for deployments with a single writer process.
+
+Whether the visitor is new (is_unique) comes from the `visitors` table
+upsert in track_visit, not from this index.
+
+The index is warmed from the database at startup and tails the visits table
+every few seconds, so rows written by other workers are picked up too. Until
+the warm-up finishes every question goes to the database.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cache_utils import BloomFilter, LRUCache, MISSING
+
+logger = logging.getLogger("app")
+
+VISIT_INDEX_ENABLED = os.getenv("VISIT_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+VISIT_INDEX_LRU_SIZE = int(os.getenv("VISIT_INDEX_LRU_SIZE", "200000"))
+VISIT_INDEX_CAPACITY = int(os.getenv("VISIT_INDEX_CAPACITY", "5000000"))
+VISIT_INDEX_SESSION_DAYS = int(os.getenv("VISIT_INDEX_SESSION_DAYS", "2"))
+VISIT_INDEX_SYNC_INTERVAL = float(os.getenv("VISIT_INDEX_SYNC_INTERVAL", "2.0"))
+VISIT_INDEX_SYNC_OVERLAP = timedelta(seconds=60)
+VISIT_INDEX_TRUST_MISSES = os.getenv("VISIT_INDEX_TRUST_MISSES", "false").lower() in ("1", "true", "yes")
+
+
+class VisitIndex:
+    def __init__(
+        self,
+        lru_size: int = VISIT_INDEX_LRU_SIZE,
+        capacity: int = VISIT_INDEX_CAPACITY,
+        session_days: int = VISIT_INDEX_SESSION_DAYS,
+        sync_interval: float = VISIT_INDEX_SYNC_INTERVAL,
+        enabled: bool = VISIT_INDEX_ENABLED,
+        trust_misses: bool = VISIT_INDEX_TRUST_MISSES,
+    ):
+        self.enabled = enabled
+        self.trust_misses = trust_misses
+        self.session_days = session_days
+        self.sync_interval = sync_interval
+
+        self.sessions = LRUCache(lru_size)
+        self.session_bloom = BloomFilter(capacity)
+
+        self.ready = False
+        self._synced_until = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.stats = {"answered": 0, "confirmed": 0, "fallback": 0}
+
+    @staticmethod
+    def _key(project_id: int, value: str) -> str:
+        return f"{project_id}:{value}"
+
+    def remember(self, project_id: int, session_id: Optional[str], visit_id: int):
+        if session_id:
+            key = self._key(project_id, session_id)
+            self.sessions.set(key, visit_id)
+            self.session_bloom.add(key)
+
+    def find_session(self, db, project_id: int, session_id: str) -> Optional[int]:
+        """Visit id already tracked for this session, or None"""
+        import models
+
+        key = self._key(project_id, session_id)
+        if self.enabled and self.ready:
+            visit_id = self.sessions.get(key)
+            if visit_id is not MISSING:
+                self.stats["answered"] += 1
+                return visit_id
+            if self.trust_misses and key not in self.session_bloom:
+                self.stats["answered"] += 1
+                return None
+            self.stats["confirmed"] += 1
+        else:
+            self.stats["fallback"] += 1
+
+        row = db.query(models.Visit.id).filter(
+            models.Visit.project_id == project_id,
+            models.Visit.session_id == session_id
+        ).first()
+        if row and self.enabled:
+            self.sessions.set(key, row.id)
+        return row.id if row else None
+
+    def warm(self, session_factory):
+        """Load recent sessions and the keys of all older ones from the database"""
+        import models
+
+        started = datetime.utcnow()
+        session_cutoff = started - timedelta(days=self.session_days)
+        db = session_factory()
+        try:
+            rows = db.query(
+                models.Visit.id,
+                models.Visit.project_id,
+                models.Visit.session_id,
+                models.Visit.visited_at
+            ).yield_per(10000)
+            for visit_id, project_id, session_id, visited_at in rows:
+                if visited_at and visited_at >= session_cutoff:
+                    self.remember(project_id, session_id, visit_id)
+                elif session_id:
+                    self.session_bloom.add(self._key(project_id, session_id))
+        finally:
+            db.close()
+
+        self._synced_until = started
+        self.ready = True
+        logger.info(f"📇 Visit index warmed: {self.session_bloom.count} sessions")
+
+    def sync(self, session_factory):
+        """Pick up visits written since the last sync (including other workers')"""
+        import models
+
+        if self._synced_until is None:
+            return
+        started = datetime.utcnow()
+        db = session_factory()
+        try:
+            rows = db.query(
+                models.Visit.id, models.Visit.project_id, models.Visit.session_id
+            ).filter(
+                models.Visit.visited_at >= self._synced_until - VISIT_INDEX_SYNC_OVERLAP
+            ).yield_per(10000)
+            for visit_id, project_id, session_id in rows:
+                self.remember(project_id, session_id, visit_id)
+        finally:
+            db.close()
+        self._synced_until = started
+
+    def start(self, session_factory):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory,), name="visit-index", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self, session_factory):
+        try:
+            self.warm(session_factory)
+        except Exception as e:
+            logger.error(f"❌ Visit index warm-up failed, falling back to DB lookups: {e}")
+            return
+        while not self._stopping.wait(self.sync_interval):
+            try:
+                self.sync(session_factory)
+            except Exception as e:
+                logger.error(f"❌ Visit index sync failed: {e}")
+
+
+index = VisitIndex()